@@ -0,0 +1,180 @@
+"""多账号分片（monitor 使用）
+
+每个配置了 StringSession 的 TelegramConfig 行是一个监控账号（第 i 个账号使用第 i 条 Credential，
+不足时使用第一条 / .env 中的 API 凭据）；数据库中没有时回退为 .env 的 STRING_SESSION 或本地 session 文件。
+
+频道按一致性哈希分配给账号：增删账号时只有约 1/N 的频道换账号，其余账号的绑定、加入状态不受影响。
+所有账号共用同一个消息处理函数、写入队列和按链接去重逻辑。
+"""
+import asyncio
+import bisect
+import hashlib
+from typing import Dict, List, Optional
+
+from telethon import TelegramClient, events
+from telethon.sessions import StringSession
+
+from channel_registry import ChannelRegistry
+from channel_joiner import ChannelJoiner
+import async_db
+
+# 每个账号在哈希环上的虚拟节点数（越多分配越均匀）
+RING_REPLICAS = 100
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """一致性哈希环：频道用户名 -> 账号"""
+
+    def __init__(self, keys: List[str], replicas: int = RING_REPLICAS):
+        points = sorted((_ring_hash(f"{key}#{i}"), key) for key in keys for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._keys = [k for _, k in points]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def owner(self, item: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._hashes, _ring_hash(item.lower()))
+        return self._keys[i % len(self._keys)]
+
+
+class Account:
+    """一个监控账号：客户端、加入任务与当前事件绑定"""
+
+    def __init__(self, key: str, label: str, client: TelegramClient, joiner: ChannelJoiner):
+        self.key = key
+        self.label = label
+        self.client = client
+        self.joiner = joiner
+        self.event_builder = None
+        self.channels: List[str] = []
+        self.user_id: Optional[int] = None
+        # 主动断开（移除/替换账号、退出）时置位，断开回调据此忽略
+        self.closing = False
+
+
+class AccountPool:
+    """管理全部监控账号，并按一致性哈希把频道分给各账号"""
+
+    def __init__(self, registry: ChannelRegistry, handler):
+        self.registry = registry
+        self.handler = handler
+        self.accounts: Dict[str, Account] = {}
+        self.ring = HashRing([])
+        self._stopped = asyncio.Event()
+
+    @property
+    def primary(self) -> Optional[Account]:
+        return next(iter(self.accounts.values()), None)
+
+    async def _start_account(self, cfg: dict) -> Optional[Account]:
+        session = StringSession(cfg['string_session']) if cfg['string_session'] else 'monitor_session'
+        client = TelegramClient(session, cfg['api_id'], cfg['api_hash'])
+        print(f"🔗 正在连接账号 {cfg['label']}...")
+        try:
+            if cfg['interactive']:
+                # 单账号回退模式保持原有行为：必要时交互登录
+                await client.start()
+            else:
+                await client.connect()
+                if not await client.is_user_authorized():
+                    print(f"⚠️ 账号 {cfg['label']} 的 StringSession 无效或已失效，已跳过")
+                    await client.disconnect()
+                    return None
+            me = await client.get_me()
+        except Exception as e:
+            print(f"⚠️ 账号 {cfg['label']} 连接失败: {e}")
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            return None
+        account = Account(cfg['key'], cfg['label'], client, ChannelJoiner(self.registry, account=cfg['key']))
+        account.user_id = me.id
+        print(f"👤 账号 {cfg['label']}: {me.first_name} (@{me.username if me.username else 'N/A'})")
+        return account
+
+    async def _stop_account(self, account: Account):
+        account.closing = True
+        if account.event_builder is not None:
+            account.client.remove_event_handler(self.handler, account.event_builder)
+        await account.joiner.close()
+        await account.client.disconnect()
+
+    def _on_disconnected(self, account: Account):
+        # 主动断开的账号不算掉线；替换账号时新账号已先连上，不会误判为全部断开
+        if account.closing:
+            return
+        if not any(a.client.is_connected() for a in self.accounts.values()):
+            self._stopped.set()
+
+    async def refresh(self) -> bool:
+        """按数据库配置增删账号，账号集合有变化时返回 True（需重新分配频道）"""
+        configs = await async_db.load_account_configs()
+        wanted = {c['key']: c for c in configs}
+        removed = [a for k, a in self.accounts.items() if k not in wanted]
+        added = [c for k, c in wanted.items() if k not in self.accounts]
+        # 先连接并登记新账号，再停掉被移除的账号（替换唯一账号时监控不会因“全部断开”而退出）；
+        # 新账号并行连接，同一 Telegram 用户配置了多次时只保留一个（被移除的账号不参与判断，同一用户换 session 时保留新的）
+        kept = {k: a for k, a in self.accounts.items() if k in wanted}
+        started = 0
+        for account in await asyncio.gather(*(self._start_account(c) for c in added)):
+            if account is None:
+                continue
+            if any(a.user_id == account.user_id for a in kept.values()):
+                print(f"⚠️ 账号 {account.label} 与已有账号是同一用户（{account.user_id}），已跳过")
+                account.closing = True
+                await account.client.disconnect()
+                continue
+            account.joiner.start(account.client)
+            account.client.disconnected.add_done_callback(lambda _, a=account: self._on_disconnected(a))
+            self.accounts[account.key] = kept[account.key] = account
+            started += 1
+        for account in removed:
+            print(f"➖ 移除账号 {account.label}")
+            del self.accounts[account.key]
+            await self._stop_account(account)
+        changed = bool(removed) or started > 0
+        if changed or not self.ring:
+            self.ring = HashRing(list(self.accounts))
+            print(f"🧩 当前监控账号 {len(self.accounts)} 个：{[a.label for a in self.accounts.values()]}")
+        return changed
+
+    def assign(self, channels: List[str]) -> Dict[str, List[str]]:
+        """{账号: [频道]}（包含分到 0 个频道的账号）"""
+        assignment: Dict[str, List[str]] = {key: [] for key in self.accounts}
+        for ch in channels:
+            owner = self.ring.owner(ch.lstrip('@').strip())
+            if owner is not None:
+                assignment[owner].append(ch)
+        return assignment
+
+    def bind(self, account: Account, chats):
+        """替换账号上的事件绑定；chats 为 None 表示监听全部会话"""
+        if account.event_builder is not None:
+            try:
+                account.client.remove_event_handler(self.handler, account.event_builder)
+            except Exception as e:
+                print(f"⚠️ 移除旧事件处理器失败: {e}")
+        ev = events.NewMessage(chats=chats) if chats is not None else events.NewMessage()
+        account.client.add_event_handler(self.handler, ev)
+        account.event_builder = ev
+
+    async def run_until_disconnected(self):
+        """所有账号都断开后返回"""
+        if self.accounts:
+            await self._stopped.wait()
+
+    async def close(self):
+        for account in list(self.accounts.values()):
+            try:
+                await self._stop_account(account)
+            except Exception as e:
+                print(f"⚠️ 关闭账号 {account.label} 失败: {e}")
+        self.accounts.clear()
@@ -0,0 +1,303 @@
+"""monitor 进程的异步数据访问层（SQLAlchemy AsyncEngine + asyncpg）
+
+monitor 运行在 Telethon 的事件循环里，循环内的任何同步数据库调用都会卡住所有消息处理。
+这里把 monitor 用到的读写都封装成协程：凭据 / StringSession / 频道列表 / 过滤规则 / 按链接去重写入。
+SQL 与同步版本共用（message_store.UPSERT_BY_LINKS_SQL），两边写入结果一致。
+
+另附事件循环阻塞探测 LoopLagProbe，以及自检：
+    python async_db.py --check-loop <测试库URL> [条数]
+        在单独的测试库上模拟入库，检查事件循环最长阻塞是否超过 LOOP_BLOCK_WARN_MS（不读写 DATABASE_URL）
+"""
+import asyncio
+import hashlib
+import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import settings
+from model import Message, Channel, Credential, TelegramConfig, ChannelRule, BackfillCheckpoint
+from message_store import UPSERT_BY_LINKS_SQL, upsert_params, report_upsert
+import rules
+
+
+def to_async_url(url: str):
+    """把同步连接串（postgresql:// / postgresql+psycopg2:// / postgres://）换成 asyncpg 驱动"""
+    u = make_url(url.replace('postgres://', 'postgresql://', 1) if url.startswith('postgres://') else url)
+    u = u.set(drivername='postgresql+asyncpg')
+    # asyncpg 不认识 libpq 的 sslmode 参数，对应的是 ssl
+    if 'sslmode' in u.query:
+        query = dict(u.query)
+        query['ssl'] = query.pop('sslmode')
+        u = u.set(query=query)
+    return u
+
+
+async_engine = create_async_engine(to_async_url(settings.DATABASE_URL), pool_pre_ping=True)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+async def get_api_credentials() -> Tuple[int, str]:
+    """获取 API 凭据，优先使用数据库中的凭据"""
+    async with AsyncSessionLocal() as session:
+        cred = (await session.execute(select(Credential).limit(1))).scalar_one_or_none()
+        if cred:
+            return int(cred.api_id), cred.api_hash
+    return settings.TELEGRAM_API_ID, settings.TELEGRAM_API_HASH
+
+
+async def get_string_session() -> Optional[str]:
+    """从数据库获取StringSession配置"""
+    try:
+        async with AsyncSessionLocal() as session:
+            config = (await session.execute(select(TelegramConfig).limit(1))).scalar_one_or_none()
+            if config and config.string_session:
+                return config.string_session.strip()
+    except Exception as e:
+        print(f"⚠️ 读取StringSession配置失败: {e}")
+    return None
+
+
+def env_channels() -> List[str]:
+    """.env 中 DEFAULT_CHANNELS 配置的频道"""
+    return [c.strip() for c in (settings.DEFAULT_CHANNELS or '').split(',') if c.strip()]
+
+
+async def sync_env_channels():
+    """把 .env 中的频道补写进数据库（启动时执行一次即可）"""
+    async with AsyncSessionLocal() as session:
+        db_channels = set((await session.execute(select(Channel.username))).scalars())
+        missing = [u for u in dict.fromkeys(env_channels()) if u not in db_channels]
+        if missing:
+            session.add_all([Channel(username=u) for u in missing])
+            await session.commit()
+
+
+def _session_tag(string_session: str) -> str:
+    """StringSession 的短哈希：写进账号 key，原地修改 StringSession 后 key 随之变化，监控会重新加载该账号"""
+    return hashlib.sha1(string_session.encode('utf-8')).hexdigest()[:8]
+
+
+async def load_account_configs() -> List[dict]:
+    """监控账号配置 [{key, label, api_id, api_hash, string_session, interactive}]
+
+    每个填了 StringSession 的 TelegramConfig 行是一个账号，第 i 个账号使用第 i 条 Credential（不足时用第一条，
+    没有则用 .env）；数据库中没有账号时回退为 .env 的 STRING_SESSION，再回退为本地 session 文件。
+    """
+    async with AsyncSessionLocal() as session:
+        configs = list((await session.execute(select(TelegramConfig).order_by(TelegramConfig.id))).scalars())
+        creds = list((await session.execute(select(Credential).order_by(Credential.id))).scalars())
+    default_cred = (int(creds[0].api_id), creds[0].api_hash) if creds else (settings.TELEGRAM_API_ID, settings.TELEGRAM_API_HASH)
+    accounts = []
+    for cfg in configs:
+        string_session = (cfg.string_session or '').strip()
+        if not string_session:
+            continue
+        i = len(accounts)
+        api_id, api_hash = (int(creds[i].api_id), creds[i].api_hash) if i < len(creds) else default_cred
+        accounts.append({'key': f"cfg{cfg.id}:{_session_tag(string_session)}", 'label': f"#{cfg.id}", 'api_id': api_id, 'api_hash': api_hash,
+                         'string_session': string_session, 'interactive': False})
+    if accounts:
+        return accounts
+    env_string = (settings.STRING_SESSION or '').strip()
+    if env_string:
+        return [{'key': f"env:{_session_tag(env_string)}", 'label': '.env StringSession', 'api_id': default_cred[0], 'api_hash': default_cred[1],
+                 'string_session': env_string, 'interactive': True}]
+    return [{'key': 'file', 'label': 'session 文件', 'api_id': default_cred[0], 'api_hash': default_cred[1],
+             'string_session': None, 'interactive': True}]
+
+
+async def get_channels() -> List[str]:
+    """获取频道列表，合并数据库和 .env 中的频道"""
+    async with AsyncSessionLocal() as session:
+        db_channels = set((await session.execute(select(Channel.username))).scalars())
+    return list(db_channels | set(env_channels()))
+
+
+async def load_channel_entities() -> List[Channel]:
+    """读取频道实体登记（channels 全表：用户名、频道ID、access_hash、解析状态）"""
+    async with AsyncSessionLocal() as session:
+        return list((await session.execute(select(Channel))).scalars())
+
+
+async def save_channel_entity(username: str, tg_id: int, access_hash: int, title: Optional[str],
+                              account: Optional[str] = None):
+    """登记解析成功的频道实体；access_hash 按账号区分，换账号后加入状态清空，由新账号重新加入"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Channel).where(Channel.username == username).values(
+            tg_id=tg_id, access_hash=access_hash, title=title, account=account,
+            resolved_at=datetime.datetime.utcnow(), resolve_error=None,
+            join_status=None, join_attempt_at=None, join_error=None,
+        ))
+        await session.commit()
+
+
+async def save_channel_resolve_error(username: str, error: str, invalid: bool = False):
+    """记录频道解析失败（保留已有的实体信息）；invalid 表示用户名无效，不再重试"""
+    values = {'resolved_at': datetime.datetime.utcnow(), 'resolve_error': error[:500]}
+    if invalid:
+        values.update(join_status='invalid', join_error=error[:500])
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Channel).where(Channel.username == username).values(**values))
+        await session.commit()
+
+
+async def save_channel_join_state(username: str, status: str, error: Optional[str] = None):
+    """记录频道加入结果（joined / private / invalid / failed）"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Channel).where(Channel.username == username).values(
+            join_status=status, join_attempt_at=datetime.datetime.utcnow(),
+            join_error=error[:500] if error else None,
+        ))
+        await session.commit()
+
+
+async def load_backfill_checkpoint(channel: str) -> int:
+    """频道已回溯到的最大消息ID，没有记录返回 0"""
+    async with AsyncSessionLocal() as session:
+        last_id = (await session.execute(
+            select(BackfillCheckpoint.last_message_id).where(BackfillCheckpoint.channel == channel)
+        )).scalar_one_or_none()
+    return last_id or 0
+
+
+async def save_backfill_checkpoint(channel: str, last_message_id: int):
+    """推进频道的回溯高水位（只增不减）"""
+    stmt = pg_insert(BackfillCheckpoint).values(channel=channel, last_message_id=last_message_id,
+                                                 updated_at=datetime.datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BackfillCheckpoint.channel],
+        set_={
+            'last_message_id': func.greatest(BackfillCheckpoint.last_message_id, stmt.excluded.last_message_id),
+            'updated_at': stmt.excluded.updated_at,
+        },
+    )
+    async with AsyncSessionLocal() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def reset_backfill_checkpoint(channel: str):
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(BackfillCheckpoint).where(BackfillCheckpoint.channel == channel))
+        await session.commit()
+
+
+async def load_rules_cache():
+    """异步版 rules.load_rules_cache：查询启用的规则并替换规则缓存"""
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(ChannelRule).filter_by(enabled=True))
+            rules.install_rules_cache(result.scalars().all())
+    except Exception as e:
+        print(f"⚠️ 加载规则失败: {e}")
+
+
+async def upsert_message_by_links(session: AsyncSession, parsed_data: dict, timestamp: datetime.datetime,
+                                  commit: bool = True, match_urls=None) -> str:
+    """异步版 message_store.upsert_message_by_links，返回 'updated' 或 'inserted'"""
+    result = await session.execute(UPSERT_BY_LINKS_SQL, upsert_params(parsed_data, timestamp, match_urls))
+    row = result.one()
+    if commit:
+        await session.commit()
+    return report_upsert(row)
+
+
+class LoopLagProbe:
+    """事件循环阻塞探测：每隔 interval 秒醒来一次，实际醒来时间与预期之差即循环被阻塞的时长"""
+
+    def __init__(self, threshold_ms: Optional[int] = None, interval: float = 0.05, warn: bool = True):
+        self.threshold = (threshold_ms if threshold_ms is not None else settings.LOOP_BLOCK_WARN_MS) / 1000
+        self.interval = interval
+        self.warn = warn
+        self.max_lag = 0.0
+        self.over = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.over += 1
+                if self.warn:
+                    print(f"🐢 事件循环被阻塞 {lag * 1000:.0f}ms（阈值 {self.threshold * 1000:.0f}ms）")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def _check_loop(url: str, count: int) -> bool:
+    """在测试库 url 上模拟一次入库：解析 -> 规则 -> 写入队列 -> 批量落库，全程测量事件循环阻塞"""
+    from sqlalchemy import create_engine
+    from message_parser import parse_message
+    from message_writer import MessageWriter
+    from model import Base
+
+    if url == settings.DATABASE_URL:
+        raise SystemExit("❌ 自检会写入并删除消息，请指定单独的测试库，不要使用 DATABASE_URL")
+    sync_engine = create_engine(url)
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    # 本进程内所有异步会话（含 MessageWriter）都改连测试库
+    check_engine = create_async_engine(to_async_url(url))
+    AsyncSessionLocal.configure(bind=check_engine)
+
+    check_channel = '__loop_check__'
+    probe = LoopLagProbe(warn=False, interval=0.01)
+    writer = MessageWriter()
+    probe.start()
+    writer.start()
+    await get_channels()
+    await load_rules_cache()
+    now = datetime.datetime.now()
+    try:
+        for i in range(count):
+            text = (f"名称：事件循环自检 {i}\n描述：自检数据，结束后自动删除\n"
+                    f"链接：https://pan.quark.cn/s/loopcheck{now:%H%M%S}{i}\n🏷 标签：#自检")
+            parsed = parse_message(text)
+            parsed['channel'] = check_channel
+            if rules.should_drop_by_rules(check_channel, parsed):
+                continue
+            await writer.put(parsed, now)
+            if i % 50 == 0:
+                await asyncio.sleep(0)
+        await writer.close()
+    finally:
+        await probe.stop()
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(Message).where(Message.channel == check_channel))
+            await session.commit()
+        await check_engine.dispose()
+    ok = probe.max_lag <= probe.threshold
+    print(f"{'✅' if ok else '❌'} 入库 {count} 条，事件循环最长阻塞 {probe.max_lag * 1000:.1f}ms"
+          f"（阈值 {probe.threshold * 1000:.0f}ms）")
+    return ok
+
+
+if __name__ == '__main__':
+    import sys
+    if '--check-loop' not in sys.argv or len(sys.argv) <= sys.argv.index('--check-loop') + 1:
+        print("用法: python async_db.py --check-loop <测试库URL> [条数]")
+        sys.exit(1)
+    idx = sys.argv.index('--check-loop')
+    n = int(sys.argv[idx + 2]) if len(sys.argv) > idx + 2 else 2000
+    # 以模块 async_db（而不是 __main__）运行：MessageWriter 等导入的是 async_db，测试库要改在同一个会话工厂上
+    import async_db
+    sys.exit(0 if asyncio.run(async_db._check_loop(sys.argv[idx + 1], n)) else 1)
@@ -0,0 +1,157 @@
+"""多频道并发回溯（monitor.py --backfill 使用）
+
+- 频道按监控账号分片（与实时监听相同的一致性哈希），每个账号同时回溯 BACKFILL_CONCURRENCY 个频道
+- 服务器端只返回含链接的消息（InputMessagesFilterUrl），从旧到新拉取
+- 每个频道的高水位（已处理的最大消息ID）存于 backfill_checkpoints，重跑时以 min_id 续传；--restart 从头开始
+- 每批消息交给多进程解析池解析（parse_pool.py），入库按批写入（与实时写入同一套按链接去重逻辑），每批提交后才推进高水位；
+  某批有写入失败的消息时高水位停在该批之前（本次回溯不再推进），频道记为未完成，重跑时从该批重新写入
+"""
+import asyncio
+import datetime
+from datetime import timezone, timedelta
+from typing import Dict, List, Optional
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import InputMessagesFilterUrl
+
+from config import settings
+from parse_pool import get_parse_pool
+from message_writer import write_batch
+from channel_registry import normalize_username
+import async_db
+
+# 北京时间时区
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+# 连续多少条消息没有凑满一批时也推进一次高水位
+CHECKPOINT_EVERY = 1000
+# 单个频道遇到 FloodWait 的最大重试次数
+MAX_FLOOD_RETRIES = 3
+
+
+def to_beijing_time(dt):
+    """将 datetime 对象转换为北京时间"""
+    if dt is None:
+        return datetime.datetime.now(BEIJING_TZ).replace(tzinfo=None)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(BEIJING_TZ).replace(tzinfo=None)
+
+
+def _new_stats() -> Dict[str, int]:
+    return {'scanned': 0, 'inserted': 0, 'updated': 0, 'merged': 0, 'failed': 0, 'skipped': 0, 'dropped': 0}
+
+
+async def backfill_channel(client, channel: str, peer=None, url_only: bool = True,
+                           batch_size: Optional[int] = None) -> Dict[str, int]:
+    """从高水位之后回溯一个频道，返回计数；peer 为已登记的 InputPeer（没有则按用户名解析）"""
+    batch_size = batch_size or settings.WRITE_BATCH_SIZE
+    min_id = await async_db.load_backfill_checkpoint(channel)
+    stats = _new_stats()
+    # 未解析的 (text, 时间)：凑满一批后交给解析池一次解析
+    raw: List[tuple] = []
+    last_id = min_id
+    since_checkpoint = 0
+    # 出现写入失败后不再推进高水位（write_batch 合并了同批记录，无法知道具体是哪条失败）
+    stalled = False
+
+    async def flush():
+        nonlocal since_checkpoint, stalled
+        if raw:
+            results = await get_parse_pool().parse_batch_async([(text, channel) for text, _ in raw])
+            batch = []
+            for (_, ts), (status, parsed) in zip(raw, results):
+                # 仅保存“关于网盘”的消息（必须包含 links）
+                if status == 'ok':
+                    batch.append((parsed, ts))
+                elif status in ('skipped', 'dropped'):
+                    stats[status] += 1
+            raw.clear()
+            if batch:
+                result = await write_batch(batch)
+                for k in ('inserted', 'updated', 'merged', 'failed'):
+                    stats[k] += result[k]
+                if result['failed'] and not stalled:
+                    stalled = True
+                    print(f"⚠️ @{channel} 有 {result['failed']} 条消息写入失败，断点停在这批之前，重跑时重新写入")
+        if last_id > min_id and not stalled:
+            await async_db.save_backfill_checkpoint(channel, last_id)
+        since_checkpoint = 0
+
+    kwargs = {'reverse': True, 'min_id': min_id}
+    if url_only:
+        kwargs['filter'] = InputMessagesFilterUrl()
+    print(f"⏪ 开始回溯 @{channel}（从消息ID > {min_id} 开始{'，仅含链接的消息' if url_only else ''}）")
+    async for msg in client.iter_messages(peer or channel, **kwargs):
+        stats['scanned'] += 1
+        since_checkpoint += 1
+        last_id = max(last_id, msg.id)
+        text = getattr(msg, 'message', None) or getattr(msg, 'raw_text', None)
+        if text and text.strip():
+            raw.append((text, to_beijing_time(getattr(msg, 'date', None))))
+        if len(raw) >= batch_size or since_checkpoint >= CHECKPOINT_EVERY:
+            await flush()
+    await flush()
+    return stats
+
+
+async def _backfill_with_retry(client, channel: str, peer, url_only: bool) -> Optional[Dict[str, int]]:
+    for attempt in range(MAX_FLOOD_RETRIES + 1):
+        try:
+            return await backfill_channel(client, channel, peer=peer, url_only=url_only)
+        except FloodWaitError as fe:
+            wait_s = getattr(fe, 'seconds', 30)
+            if attempt == MAX_FLOOD_RETRIES:
+                print(f"❌ @{channel} 多次触发频率限制，放弃本次回溯（进度已保存）")
+                return None
+            print(f"⏳ @{channel} 频率限制，等待 {wait_s}s 后从断点继续")
+            await asyncio.sleep(wait_s + 1)
+        except Exception as e:
+            print(f"❌ 回溯 @{channel} 失败（进度已保存）：{e}")
+            return None
+    return None
+
+
+async def run_backfill(pool, channels: List[str], concurrency: Optional[int] = None,
+                       url_only: bool = True, restart: bool = False) -> Dict[str, int]:
+    """按账号分片并发回溯多个频道，返回汇总计数"""
+    concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+    channels = list(dict.fromkeys(normalize_username(c) for c in channels if normalize_username(c)))
+    if restart:
+        for ch in channels:
+            await async_db.reset_backfill_checkpoint(ch)
+    await pool.registry.load()
+    totals = _new_stats()
+    done, failed = 0, []
+
+    async def run_one(account, channel: str, sem: asyncio.Semaphore):
+        nonlocal done
+        async with sem:
+            entry = pool.registry.get(channel)
+            peer = entry.input_peer() if entry is not None and entry.resolved and entry.account == account.key else None
+            stats = await _backfill_with_retry(account.client, channel, peer, url_only)
+        if stats is None:
+            failed.append(channel)
+            return
+        for k, v in stats.items():
+            totals[k] += v
+        if stats['failed']:
+            # 有消息写入失败：断点停在失败之前，算作未完成
+            failed.append(channel)
+            print(f"⚠️ @{channel} 回溯结束但有 {stats['failed']} 条写入失败（重跑会从失败之前继续）")
+            return
+        done += 1
+        print(f"✅ @{channel} 回溯完成（{done}/{len(channels)}）：扫描 {stats['scanned']}，新增 {stats['inserted']}，"
+              f"更新 {stats['updated']}，跳过非网盘 {stats['skipped']}，规则忽略 {stats['dropped']}")
+
+    tasks = []
+    for key, chans in pool.assign(channels).items():
+        # 每个账号各自限流
+        sem = asyncio.Semaphore(concurrency)
+        tasks.extend(run_one(pool.accounts[key], ch, sem) for ch in chans)
+    await asyncio.gather(*tasks)
+    print(f"⏪ 回溯完成：{done}/{len(channels)} 个频道，新增 {totals['inserted']} 条，更新 {totals['updated']} 条，"
+          f"跳过非网盘 {totals['skipped']} 条，规则忽略 {totals['dropped']} 条")
+    if failed:
+        print(f"⚠️ 未完成的频道（重跑会从断点继续）：{failed}")
+    return totals
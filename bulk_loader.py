@@ -0,0 +1,307 @@
+"""批量导入：COPY 到临时表 + 按链接集合式合并（import_from_txt 使用）
+
+逐条导入要为每条记录查一次、写一次数据库；这里每 BULK_CHUNK_RECORDS 条记录只需要几条语句：
+1. 块内全部链接 COPY 到临时表，一条查询找出它们当前所属的已有消息
+2. 在内存中按文件顺序逐条重放“按链接去重写入”：命中（任一链接属于某条已有消息或块内前面新建的消息）时
+   覆盖链接所属消息中时间最新的一条，否则新建一条；该记录的全部链接改指向目标消息。
+   这与逐条写入（UPSERT_BY_LINKS_SQL / 逐条导入）的结果、计数完全一致，包括块内重复的链接
+   （后到的记为覆盖更新）与链式共享（A:url1、B:url2、C:url1+url2 得到两条消息，C 覆盖较新的一条）
+3. 各目标消息的最终内容与各链接的最终归属 COPY 到临时表，新消息预先分配 id，
+   然后 UPDATE / INSERT / 清理旧链接 / 写入链接 各一条语句
+
+各块依次提交，后一块能命中前一块写入的链接。需要 psycopg2（COPY）。
+
+python bulk_loader.py --check <测试库URL>   在测试库上对比批量写入与逐条写入的计数与结果（会清空该库的消息表）
+"""
+import datetime
+import io
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from message_store import link_pairs
+
+# 每块记录数（一块一个事务）
+BULK_CHUNK_RECORDS = 20000
+
+Record = Tuple[dict, datetime.datetime]
+
+_CREATE_STAGING_SQL = """
+CREATE TEMP TABLE bulk_urls (url varchar NOT NULL) ON COMMIT DROP;
+CREATE TEMP TABLE bulk_links (url varchar NOT NULL, message_id integer NOT NULL, provider varchar) ON COMMIT DROP;
+CREATE TEMP TABLE bulk_dropped_urls (url varchar NOT NULL) ON COMMIT DROP;
+CREATE TEMP TABLE bulk_messages (
+    id integer NOT NULL,
+    is_new boolean NOT NULL,
+    timestamp timestamp NOT NULL,
+    title varchar,
+    description varchar,
+    links json,
+    tags json,
+    source varchar,
+    channel varchar,
+    group_name varchar,
+    bot varchar
+) ON COMMIT DROP;
+"""
+
+_HITS_SQL = text("""
+SELECT u.url, m.id, m.timestamp
+FROM bulk_urls AS u
+JOIN message_links AS l ON l.url = u.url
+JOIN messages AS m ON m.id = l.message_id
+""")
+
+_NEXT_IDS_SQL = text("SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, :n)")
+
+_TAGS_EXPR = "CASE WHEN s.tags IS NULL THEN NULL ELSE ARRAY(SELECT json_array_elements_text(s.tags))::varchar[] END"
+
+_MERGE_SQL = [
+    text(f"""
+UPDATE messages AS m
+SET timestamp = s.timestamp,
+    title = s.title,
+    description = s.description,
+    links = s.links,
+    tags = {_TAGS_EXPR},
+    source = s.source,
+    channel = s.channel,
+    group_name = s.group_name,
+    bot = s.bot
+FROM bulk_messages AS s
+WHERE m.id = s.id AND NOT s.is_new
+"""),
+    text(f"""
+INSERT INTO messages (id, timestamp, created_at, title, description, links, tags, source, channel, group_name, bot)
+SELECT s.id, s.timestamp, s.timestamp, s.title, s.description, s.links, {_TAGS_EXPR},
+       s.source, s.channel, s.group_name, s.bot
+FROM bulk_messages AS s
+WHERE s.is_new
+"""),
+    # 目标消息上最终不再归属于它的旧链接
+    text("""
+DELETE FROM message_links AS l
+USING bulk_messages AS s
+WHERE l.message_id = s.id AND NOT s.is_new
+  AND NOT EXISTS (SELECT 1 FROM bulk_links AS b WHERE b.url = l.url AND b.message_id = s.id)
+"""),
+    # 块内先改指向、后又被覆盖掉的链接（最终不属于任何消息）
+    text("""
+DELETE FROM message_links AS l
+USING bulk_dropped_urls AS d
+WHERE l.url = d.url
+"""),
+    text("""
+INSERT INTO message_links (url, message_id, provider)
+SELECT url, message_id, provider FROM bulk_links
+ON CONFLICT (url) DO UPDATE SET message_id = EXCLUDED.message_id, provider = EXCLUDED.provider
+"""),
+]
+
+
+def _copy_value(value) -> str:
+    """COPY text 格式的一个字段"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _copy_rows(cursor, table: str, columns: List[str], rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(_copy_value(v) for v in row))
+        buf.write('\n')
+    buf.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+
+def merge_chunk(session: Session, records: List[Record]) -> Dict[str, int]:
+    """在一个事务里按链接合并写入一块记录（每条都必须带 links），返回 {inserted, updated}"""
+    if not records:
+        return {'inserted': 0, 'updated': 0}
+    pairs = [link_pairs(parsed.get('links')) for parsed, _ in records]
+
+    conn = session.connection()
+    cursor = conn.connection.cursor()
+    try:
+        conn.exec_driver_sql(_CREATE_STAGING_SQL)
+
+        # 1) 块内链接当前所属的已有消息；目标键：已有消息 (0, id)，块内新建的消息 (1, 序号)
+        #    （新消息的 id 由序列分配，总比已有消息大，按 (时间, 目标键) 取最新与逐条写入一致）
+        chunk_urls = list(dict.fromkeys(u for urls, _ in pairs for u in urls))
+        _copy_rows(cursor, 'bulk_urls', ['url'], ((u,) for u in chunk_urls))
+        owner: Dict[str, Tuple[int, int]] = {}
+        owned: Dict[Tuple[int, int], set] = {}
+        target_ts: Dict[Tuple[int, int], datetime.datetime] = {}
+        for url, mid, ts in session.execute(_HITS_SQL):
+            owner[url] = (0, mid)
+            owned.setdefault((0, mid), set()).add(url)
+            target_ts[(0, mid)] = ts
+
+        # 2) 按顺序重放：命中则覆盖链接所属的最新一条消息，否则新建；
+        #    目标消息上不在本条记录中的旧链接随之删除（之后的记录不能再经它们命中），本条的链接改指向目标
+        stats = {'inserted': 0, 'updated': 0}
+        content: Dict[Tuple[int, int], Record] = {}
+        providers: Dict[str, str] = {}
+        for (parsed, ts), (urls, provs) in zip(records, pairs):
+            hits = {owner[u] for u in urls if u in owner}
+            if hits:
+                target = max(hits, key=lambda k: (target_ts[k], k))
+                stats['updated'] += 1
+            else:
+                target = (1, stats['inserted'])
+                stats['inserted'] += 1
+            content[target] = (parsed, ts)
+            target_ts[target] = ts
+            for u in owned.get(target, set()).difference(urls):
+                del owner[u]
+            for u, p in zip(urls, provs):
+                previous = owner.get(u)
+                if previous is not None and previous != target:
+                    owned[previous].discard(u)
+                owner[u] = target
+                providers[u] = p
+            owned[target] = set(urls)
+
+        # 3) 新消息预先分配 id，目标消息的最终内容与链接的最终归属写入临时表后合并
+        ids = {k: k[1] for k in content if k[0] == 0}
+        if stats['inserted']:
+            new_ids = [r[0] for r in session.execute(_NEXT_IDS_SQL, {'n': stats['inserted']})]
+            ids.update(((1, n), mid) for n, mid in enumerate(new_ids))
+        rows = []
+        for key, (parsed, ts) in content.items():
+            rows.append((ids[key], key[0] == 1, ts, parsed.get('title'), parsed.get('description'), parsed.get('links'),
+                         parsed.get('tags'), parsed.get('source'), parsed.get('channel'), parsed.get('group_name'),
+                         parsed.get('bot')))
+        _copy_rows(cursor, 'bulk_messages', ['id', 'is_new', 'timestamp', 'title', 'description', 'links', 'tags',
+                                             'source', 'channel', 'group_name', 'bot'], rows)
+        _copy_rows(cursor, 'bulk_links', ['url', 'message_id', 'provider'],
+                   ((u, ids[key], providers[u]) for u, key in owner.items() if key in content))
+        _copy_rows(cursor, 'bulk_dropped_urls', ['url'], ((u,) for u in chunk_urls if u not in owner))
+    finally:
+        cursor.close()
+    for stmt in _MERGE_SQL:
+        session.execute(stmt)
+    session.commit()
+    return stats
+
+
+class BulkLoader:
+    """攒够 chunk_size 条记录合并写入一次"""
+
+    def __init__(self, session: Session, chunk_size: Optional[int] = None):
+        self.session = session
+        self.chunk_size = chunk_size or BULK_CHUNK_RECORDS
+        self.pending: List[Record] = []
+        self.stats = {'inserted': 0, 'updated': 0}
+
+    def add(self, parsed: dict, timestamp: datetime.datetime) -> bool:
+        """加入一条记录，凑满一块时写入并返回 True"""
+        self.pending.append((parsed, timestamp))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.pending:
+            return
+        result = merge_chunk(self.session, self.pending)
+        for k, v in result.items():
+            self.stats[k] += v
+        self.pending = []
+
+
+def _check_fixture(seed: int = 7) -> Tuple[List[Record], List[Record]]:
+    """(预先存在的消息, 待导入记录)：块内重复链接、链式共享、命中多条已有消息、时间倒序覆盖，外加随机组合"""
+    import random
+    base = datetime.datetime(2024, 1, 1)
+
+    def rec(i: int, urls: List[str], minutes: int) -> Record:
+        links = {f"p{abs(hash(u)) % 3}-{u[-4:]}": f"https://pan.example.com/s/{u}" for u in urls}
+        return {'title': f"r{i}", 'description': f"d{i}", 'links': links, 'tags': [f"t{i % 5}"],
+                'source': '', 'channel': 'check', 'group_name': '', 'bot': ''}, base + datetime.timedelta(minutes=minutes)
+
+    existing = [rec(-1, ['old1'], 1), rec(-2, ['old2'], 5), rec(-3, ['old3', 'old4'], 3)]
+    cases = [['a'], ['a'], ['b'], ['c'], ['b', 'c'], ['old1', 'old2'], ['old3', 'd'], ['d'], ['e', 'old4'], ['a']]
+    records = [rec(i, urls, 100 + i) for i, urls in enumerate(cases)]
+    records.append(rec(len(records), ['b'], 0))  # 比目标消息更早的记录仍覆盖它
+    rnd = random.Random(seed)
+    pool = [f"x{n:03d}" for n in range(60)] + ['old1', 'old2', 'old3', 'old4', 'a', 'b']
+    for i in range(len(records), 400):
+        records.append(rec(i, rnd.sample(pool, rnd.randint(1, 3)), rnd.randint(0, 1000)))
+    return existing, records
+
+
+def _check(url: str):
+    """在测试库上对比：批量写入（整块 / 小块）与逐条写入（UPSERT_BY_LINKS_SQL）的计数与最终结果必须一致"""
+    import contextlib
+    from sqlalchemy import create_engine
+    from config import settings
+    from model import Base
+    from message_store import upsert_message_by_links
+
+    if url == settings.DATABASE_URL:
+        raise SystemExit("❌ 自检会清空消息表，请指定单独的测试库，不要使用 DATABASE_URL")
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    existing, records = _check_fixture()
+
+    def reset(session: Session):
+        session.execute(text("TRUNCATE messages, message_links RESTART IDENTITY CASCADE"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            for parsed, ts in existing:
+                upsert_message_by_links(session, parsed, ts, commit=False)
+        session.commit()
+
+    def dump(session: Session):
+        messages = sorted((m.title, m.timestamp, json.dumps(m.links, sort_keys=True), tuple(m.tags or ()))
+                          for m in session.execute(text("SELECT * FROM messages")))
+        links = sorted(session.execute(text(
+            "SELECT l.url, l.provider, m.title FROM message_links AS l JOIN messages AS m ON m.id = l.message_id")).all())
+        return messages, links
+
+    results = {}
+    with Session(engine) as session:
+        reset(session)
+        stats = {'inserted': 0, 'updated': 0}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for parsed, ts in records:
+                stats[upsert_message_by_links(session, parsed, ts, commit=False)] += 1
+        session.commit()
+        results['逐条'] = (stats, dump(session))
+        for chunk_size in (len(records), 7):
+            reset(session)
+            loader = BulkLoader(session, chunk_size=chunk_size)
+            for parsed, ts in records:
+                loader.add(parsed, ts)
+            loader.flush()
+            results[f"批量（每块 {chunk_size} 条）"] = (loader.stats, dump(session))
+        session.execute(text("TRUNCATE messages, message_links RESTART IDENTITY CASCADE"))
+        session.commit()
+    expected = results['逐条']
+    ok = True
+    for name, (stats, state) in results.items():
+        same = stats == expected[0] and state == expected[1]
+        ok = ok and same
+        print(f"{'✅' if same else '❌'} {name}: 新增 {stats['inserted']}，覆盖更新 {stats['updated']}，"
+              f"消息 {len(state[0])} 条，链接 {len(state[1])} 条")
+    if not ok:
+        raise SystemExit("❌ 批量写入与逐条写入结果不一致")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != '--check':
+        print("用法: python bulk_loader.py --check <测试库URL>")
+        sys.exit(1)
+    _check(sys.argv[2])
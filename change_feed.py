@@ -0,0 +1,144 @@
+"""后台 -> 监控 的变更通知（PostgreSQL LISTEN/NOTIFY）
+
+后台修改频道 / 规则 / 暂停状态后调用 notify_change(kind)，监控进程通过 ChangeFeed 监听，
+收到通知立即刷新，空闲时没有任何轮询开销。
+监听连接直接用 asyncpg 建立，连接串由 DATABASE_URL 换成 asyncpg 可解析的 DSN（listen_dsn，保留 sslmode 等 libpq 参数）。
+为防通知丢失（监听连接断开、旧版后台仍写刷新标记文件），ChangeFeed 每隔 CHANGE_FEED_FALLBACK_SEC
+还会兜底触发一次全量刷新；监听连接断开期间按 _DEGRADED_POLL_SEC 轮询并自动重连。
+
+python change_feed.py --check-dsn   自检 listen_dsn 生成的连接串（不连接数据库）
+"""
+import asyncio
+from typing import Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from config import settings
+from model import engine
+
+CHANNEL = 'tg_monitor_changes'
+# 变更类型：频道列表 / 过滤规则 / 暂停恢复 / 监控账号
+KINDS = ('channels', 'rules', 'control', 'accounts')
+
+# 监听连接不可用时的轮询间隔（秒）
+_DEGRADED_POLL_SEC = 5
+
+
+def listen_dsn(url: str) -> str:
+    """DATABASE_URL -> asyncpg.connect 的 DSN：只去掉驱动名，查询参数原样保留。
+    asyncpg 的 DSN 解析认识 libpq 的 sslmode；不能用 to_async_url（它把 sslmode 改成 ssl，
+    而 DSN 里的 ssl 会被当成连接时的服务端参数发给 PostgreSQL，连接被拒绝）"""
+    u = make_url(url.replace('postgres://', 'postgresql://', 1) if url.startswith('postgres://') else url)
+    return u.set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+def notify_change(kind: str) -> bool:
+    """发布一条变更通知（同步，供后台调用），失败返回 False"""
+    if kind not in KINDS:
+        raise ValueError(f"未知的变更类型: {kind}")
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :kind)"), {'channel': CHANNEL, 'kind': kind})
+        return True
+    except Exception as e:
+        print(f"⚠️ 发送变更通知失败: {e}")
+        return False
+
+
+class ChangeFeed:
+    """监控端的变更订阅：wait() 返回本次需要刷新的变更类型集合"""
+
+    def __init__(self, fallback_sec: Optional[int] = None):
+        self.fallback_sec = fallback_sec if fallback_sec is not None else settings.CHANGE_FEED_FALLBACK_SEC
+        self._conn = None
+        self._pending: Set[str] = set()
+        self._event = asyncio.Event()
+        self._warned = False
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self._pending.add(payload if payload in KINDS else 'channels')
+        self._event.set()
+
+    def _on_terminate(self, conn):
+        print("⚠️ 变更通知连接已断开，改为轮询并尝试重连")
+        self._conn = None
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def connect(self) -> bool:
+        import asyncpg
+        try:
+            conn = await asyncpg.connect(listen_dsn(settings.DATABASE_URL))
+            await conn.add_listener(CHANNEL, self._on_notify)
+            conn.add_termination_listener(self._on_terminate)
+            self._conn = conn
+            self._warned = False
+            print(f"📣 已订阅后台变更通知（LISTEN {CHANNEL}）")
+            return True
+        except Exception as e:
+            if not self._warned:
+                print(f"⚠️ 订阅变更通知失败，改为每 {_DEGRADED_POLL_SEC}s 轮询并持续重试: {e}")
+                self._warned = True
+            self._conn = None
+            return False
+
+    async def wait(self) -> Set[str]:
+        """等待下一批变更；超时（兜底轮询）时返回全部类型"""
+        if not self.connected:
+            # 重连前的变更无法得知，重连成功后先做一次全量刷新
+            if await self.connect():
+                return set(KINDS)
+        timeout = self.fallback_sec if self.connected else _DEGRADED_POLL_SEC
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return set(KINDS)
+        # 稍等片刻，把连续多次保存合并成一次刷新
+        await asyncio.sleep(0.05)
+        kinds, self._pending = self._pending, set()
+        self._event.clear()
+        return kinds
+
+    async def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.remove_termination_listener(self._on_terminate)
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+def _check_dsn():
+    """用 asyncpg 自己的 DSN 解析检查 listen_dsn 的结果：SSL 参数生效、没有多出的服务端参数"""
+    from asyncpg import connect_utils
+    cases = [
+        ('postgresql+psycopg2://u:p%40w@db:5432/tg?sslmode=require', 'require', ('db', 5432)),
+        ('postgres://u:pw@db/tg?sslmode=prefer', 'prefer', ('db', 5432)),
+        ('postgresql://u:pw@db:6543/tg', None, ('db', 6543)),
+        ('postgresql+psycopg2://postgres@/tg?host=/tmp/pgdata', None, '/tmp/pgdata/.s.PGSQL.5432'),
+    ]
+    for url, sslmode, addr in cases:
+        dsn = listen_dsn(url)
+        addrs, params = connect_utils._parse_connect_dsn_and_args(
+            dsn=dsn, host=None, port=None, user=None, password=None, passfile=None, database=None, ssl=None,
+            service=None, servicefile=None, direct_tls=None, server_settings=None, target_session_attrs=None,
+            krbsrvname=None, gsslib=None)
+        assert addrs == [addr], (dsn, addrs)
+        assert params.database == 'tg' and not params.server_settings, (dsn, params)
+        if sslmode:
+            assert params.ssl is not None and params.sslmode.name.replace('_', '-') == sslmode, (dsn, params.sslmode)
+        if '%40' in url:
+            assert params.password == 'p@w', (dsn, params.password)
+        print(f"✅ {url} -> {dsn}")
+
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:2] != ['--check-dsn']:
+        print("用法: python change_feed.py --check-dsn")
+        sys.exit(1)
+    _check_dsn()
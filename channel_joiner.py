@@ -0,0 +1,121 @@
+"""增量加入频道（monitor 使用）
+
+只加入登记为“未尝试 / 加入失败且已到重试时间”的频道，已加入、私有、无效的频道不再请求 Telegram。
+加入由少量并发的后台任务完成，与事件绑定、消息处理互不等待；遇到 FloodWait 时所有加入任务一起暂停，
+到期后继续，期间消息照常处理。
+"""
+import asyncio
+import datetime
+from typing import List, Optional, Set
+
+from telethon.errors import (
+    FloodWaitError,
+    ChannelPrivateError,
+    ChannelInvalidError,
+    UserAlreadyParticipantError,
+)
+from telethon.tl.functions.channels import JoinChannelRequest
+
+from config import settings
+from channel_registry import ChannelRegistry, normalize_username
+import async_db
+
+
+class ChannelJoiner:
+    """按登记的加入状态增量加入频道（多账号时每个账号一个，只处理 account 负责的频道）"""
+
+    def __init__(self, registry: ChannelRegistry, concurrency: Optional[int] = None, account: Optional[str] = None):
+        self.registry = registry
+        self.account = account
+        self.concurrency = concurrency or settings.CHANNEL_JOIN_CONCURRENCY
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._resume_at = 0.0
+        self._workers: List[asyncio.Task] = []
+        self.client = None
+
+    def start(self, client):
+        self.client = client
+        if not self._workers:
+            loop = asyncio.get_running_loop()
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def submit(self, usernames: List[str]) -> int:
+        """把需要加入的频道放入队列（已在队列/正在加入的跳过），返回新入队数量"""
+        added = 0
+        for username in usernames:
+            uname = normalize_username(username)
+            if uname and uname not in self._queued and self.registry.needs_join(uname, self.account):
+                self._queued.add(uname)
+                self.queue.put_nowait(uname)
+                added += 1
+        if added:
+            print(f"📥 待加入频道 {added} 个（并发 {self.concurrency}）")
+        return added
+
+    async def _wait_flood(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._resume_at - loop.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def _join(self, uname: str) -> bool:
+        """加入一个频道；遇到频率限制返回 False（需重新排队）"""
+        entry = self.registry.get(uname)
+        if entry is None or not entry.resolved or (self.account is not None and entry.account != self.account):
+            # 尚未解析，或已改由其他账号负责
+            return True
+        status, error = 'joined', None
+        try:
+            await self.client(JoinChannelRequest(entry.input_channel()))
+            print(f"📥 已加入频道 @{uname}")
+        except UserAlreadyParticipantError:
+            # 已经在频道中
+            pass
+        except ChannelPrivateError:
+            status, error = 'private', "私有频道，需要邀请链接"
+            print(f"🚫 无法加入私有频道 @{uname}（需要邀请链接）")
+        except ChannelInvalidError as e:
+            status, error = 'invalid', str(e)
+            print(f"❓ 频道无效 @{uname}: {e}")
+        except FloodWaitError as fe:
+            wait_s = getattr(fe, 'seconds', 5)
+            self._resume_at = max(self._resume_at, asyncio.get_running_loop().time() + wait_s + 1)
+            print(f"⏳ 频率限制，加入频道暂停 {wait_s}s（消息处理不受影响）")
+            return False
+        except Exception as e:
+            status, error = 'failed', str(e) or e.__class__.__name__
+            print(f"⚠️ 加入频道 @{uname} 失败（{self.registry.retry_sec}s 后重试）: {error}")
+        await async_db.save_channel_join_state(entry.username, status, error)
+        entry.join_status, entry.join_attempt_at = status, datetime.datetime.utcnow()
+        return True
+
+    async def _worker(self):
+        while True:
+            uname = await self.queue.get()
+            try:
+                await self._wait_flood()
+                if not await self._join(uname):
+                    # 频率限制：放回队列，暂停结束后再试
+                    self.queue.put_nowait(uname)
+                    continue
+                self._queued.discard(uname)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._queued.discard(uname)
+                print(f"⚠️ 加入频道任务出错 @{uname}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def close(self):
+        for t in self._workers:
+            t.cancel()
+        for t in self._workers:
+            try:
+                await t
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
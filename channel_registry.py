@@ -0,0 +1,167 @@
+"""频道实体登记（monitor 使用）
+
+channels 表里持久化了每个频道解析后的 频道ID / access_hash / 名称：
+- 启动与重绑时直接用登记信息构造 InputPeerChannel，不再逐个 get_entity()
+- 新消息按 chat_id 查内存字典得到频道用户名，不再 await event.get_chat()
+- 只有从未解析过、或解析失败且超过重试间隔的频道才会请求 Telegram（用户名无效的不再重试）
+- 同时登记加入状态，ChannelJoiner 据此只加入新增或加入失败的频道
+"""
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+from telethon import utils
+from telethon.errors import FloodWaitError, UsernameInvalidError, UsernameNotOccupiedError
+from telethon.tl.types import Channel as TgChannel, InputChannel, InputPeerChannel, PeerChannel
+
+from config import settings
+import async_db
+
+
+def normalize_username(username: str) -> str:
+    return (username or '').lstrip('@').strip()
+
+
+class ChannelEntry:
+    """一个频道的登记信息"""
+
+    __slots__ = ('username', 'tg_id', 'access_hash', 'title', 'resolved_at', 'resolve_error',
+                 'join_status', 'join_attempt_at', 'account')
+
+    def __init__(self, username: str, tg_id: Optional[int] = None, access_hash: Optional[int] = None,
+                 title: Optional[str] = None, resolved_at: Optional[datetime.datetime] = None,
+                 resolve_error: Optional[str] = None, join_status: Optional[str] = None,
+                 join_attempt_at: Optional[datetime.datetime] = None, account: Optional[str] = None):
+        self.username = username
+        self.tg_id = tg_id
+        self.access_hash = access_hash
+        self.title = title
+        self.resolved_at = resolved_at
+        self.resolve_error = resolve_error
+        self.join_status = join_status
+        self.join_attempt_at = join_attempt_at
+        self.account = account  # 解析出 access_hash 的账号（access_hash 按账号区分）
+
+    @property
+    def resolved(self) -> bool:
+        return self.tg_id is not None and self.access_hash is not None
+
+    @property
+    def chat_id(self) -> int:
+        """Telethon 事件里的 chat_id（带 -100 前缀的频道ID）"""
+        return utils.get_peer_id(PeerChannel(self.tg_id))
+
+    def input_peer(self) -> InputPeerChannel:
+        return InputPeerChannel(self.tg_id, self.access_hash)
+
+    def input_channel(self) -> InputChannel:
+        return InputChannel(self.tg_id, self.access_hash)
+
+
+class ChannelRegistry:
+    """用户名 -> 频道实体，chat_id -> 用户名"""
+
+    def __init__(self, retry_sec: Optional[int] = None):
+        self.retry_sec = retry_sec if retry_sec is not None else settings.CHANNEL_RESOLVE_RETRY_SEC
+        self.entries: Dict[str, ChannelEntry] = {}
+        self.chat_usernames: Dict[int, str] = {}
+
+    async def load(self):
+        """从数据库载入登记信息"""
+        rows = await async_db.load_channel_entities()
+        self.entries = {}
+        for r in rows:
+            uname = normalize_username(r.username)
+            if uname:
+                self.entries[uname] = ChannelEntry(r.username, r.tg_id, r.access_hash, r.title, r.resolved_at,
+                                                   r.resolve_error, r.join_status, r.join_attempt_at, r.account)
+        self.chat_usernames = {e.chat_id: uname for uname, e in self.entries.items() if e.resolved}
+
+    def get(self, username: str) -> Optional[ChannelEntry]:
+        return self.entries.get(normalize_username(username))
+
+    def needs_resolve(self, username: str, account: Optional[str] = None) -> bool:
+        """从未解析过、由其他账号解析（改由 account 负责），或解析失败且已超过重试间隔"""
+        entry = self.get(username)
+        if entry is None:
+            return True
+        if entry.join_status == 'invalid':
+            return False
+        if entry.resolved:
+            return account is not None and entry.account != account
+        return self._retry_due(entry.resolved_at)
+
+    def needs_join(self, username: str, account: Optional[str] = None) -> bool:
+        """已由 account 解析、且从未尝试加入或加入失败已到重试时间"""
+        entry = self.get(username)
+        if entry is None or not entry.resolved:
+            return False
+        if account is not None and entry.account != account:
+            return False
+        if entry.join_status in ('joined', 'private', 'invalid'):
+            return False
+        return entry.join_status is None or self._retry_due(entry.join_attempt_at)
+
+    def _retry_due(self, last_attempt: Optional[datetime.datetime]) -> bool:
+        if last_attempt is None:
+            return True
+        return (datetime.datetime.utcnow() - last_attempt).total_seconds() >= self.retry_sec
+
+    def pending(self, usernames: List[str], account: Optional[str] = None) -> List[str]:
+        return [u for u in usernames if normalize_username(u) and self.needs_resolve(u, account)]
+
+    async def resolve_pending(self, client, usernames: List[str], account: Optional[str] = None) -> int:
+        """用 account 的客户端解析需要解析的频道并登记，返回解析成功的数量；遇到频率限制则停止，留待下次重试"""
+        pending = self.pending(usernames, account)
+        resolved = 0
+        for username in pending:
+            uname = normalize_username(username)
+            error = None
+            flood = False
+            invalid = False
+            try:
+                entity = await client.get_entity(uname)
+                if isinstance(entity, TgChannel) and entity.access_hash is not None:
+                    await async_db.save_channel_entity(username, entity.id, entity.access_hash, getattr(entity, 'title', None), account)
+                    resolved += 1
+                    print(f"📇 已登记频道 @{uname}（id={entity.id}）")
+                else:
+                    error = "不是频道"
+                    invalid = True
+            except (UsernameInvalidError, UsernameNotOccupiedError):
+                error = "无效或不存在的频道用户名"
+                invalid = True
+            except FloodWaitError as fe:
+                error = f"频率限制，需等待 {getattr(fe, 'seconds', 0)}s"
+                flood = True
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            if error:
+                print(f"⚠️ 解析频道实体失败 @{uname}: {error}")
+                await async_db.save_channel_resolve_error(username, error, invalid=invalid)
+                if flood:
+                    break
+        if pending:
+            await self.load()
+        return resolved
+
+    def input_peers(self, usernames: List[str], account: Optional[str] = None) -> Tuple[List[InputPeerChannel], List[str]]:
+        """返回 (account 已登记频道的 InputPeer, 尚未解析成功的用户名)"""
+        peers, unresolved = [], []
+        for username in usernames:
+            entry = self.get(username)
+            if entry is not None and entry.resolved and (account is None or entry.account == account):
+                peers.append(entry.input_peer())
+            elif normalize_username(username):
+                unresolved.append(normalize_username(username))
+        return peers, unresolved
+
+    def username_for(self, chat_id: Optional[int]) -> str:
+        """chat_id -> 频道用户名，未登记返回空串"""
+        if chat_id is None:
+            return ''
+        return self.chat_usernames.get(chat_id, '')
+
+    def remember(self, chat_id: int, username: str):
+        """登记一个运行中才认识的 chat_id（仅内存）"""
+        if chat_id is not None and username:
+            self.chat_usernames[chat_id] = username
@@ -0,0 +1,155 @@
+"""并发抓取频道消息的评论（export_import_bsbdbfjfjff.py 导出时使用）
+
+- 最多 EXPORT_COMMENT_CONCURRENCY 条消息同时抓取评论（定位讨论主题 + 读取回复），与历史消息流水线并行
+- 讨论主题查找结果按 相册(grouped_id) / 消息ID 缓存：同一相册的多条消息共用一个讨论主题，只请求一次；
+  同一主题的评论也只读取一次
+- 遇到 FloodWait 时所有抓取任务一起暂停，到期后继续
+"""
+import asyncio
+from collections import OrderedDict
+from typing import List, Optional
+
+from telethon import functions
+from telethon.errors import FloodWaitError
+
+from config import settings
+
+# 讨论主题ID缓存条数（只是整数，可以多留一些）
+THREAD_CACHE_SIZE = 10000
+# 评论内容缓存条数（相册的多条消息是连续的，保留最近的即可）
+COMMENT_CACHE_SIZE = 256
+# 单次请求遇到 FloodWait 的最大重试次数
+MAX_FLOOD_RETRIES = 3
+
+
+def wants_comments(msg, text: str) -> bool:
+    """消息提示“评论区查看”或存在评论数量时需要抓取评论"""
+    try:
+        if text and ("评论区" in text or "评论区查看" in text or "资源评论区查看" in text):
+            return True
+        replies_meta = getattr(msg, 'replies', None)
+        if replies_meta and getattr(replies_meta, 'replies', 0) > 0:
+            return True
+    except Exception:
+        pass
+    return False
+
+
+class _LRU(OrderedDict):
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class CommentHarvester:
+    """channel 的消息 -> 讨论组 discussion 中对应主题下的评论文本"""
+
+    def __init__(self, client, channel, discussion, concurrency: Optional[int] = None):
+        self.client = client
+        self.channel = channel
+        self.discussion = discussion
+        self.concurrency = concurrency or settings.EXPORT_COMMENT_CONCURRENCY
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._threads = _LRU(THREAD_CACHE_SIZE)    # 相册/消息 -> 讨论主题ID 的任务
+        self._comments = _LRU(COMMENT_CACHE_SIZE)  # 讨论主题ID -> 评论文本列表 的任务
+        self._resume_at = 0.0
+        self.lookups = 0
+        self.cache_hits = 0
+        self.comments = 0
+
+    async def _call(self, make_coro):
+        """带并发限制与 FloodWait 重试地执行一次请求"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            delay = self._resume_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with self._sem:
+                try:
+                    return await make_coro()
+                except FloodWaitError as fe:
+                    if attempt == MAX_FLOOD_RETRIES:
+                        raise
+                    wait_s = getattr(fe, 'seconds', 5)
+                    self._resume_at = max(self._resume_at, loop.time() + wait_s + 1)
+                    print(f"⏳ 抓取评论触发频率限制，暂停 {wait_s}s")
+
+    def _pick_top_id(self, dm) -> Optional[int]:
+        msgs = getattr(dm, 'messages', []) or []
+        if not msgs:
+            return None
+        # 优先选择"讨论组"同一 peer 的消息作为主题帖 id
+        disc_id = getattr(self.discussion, 'id', None)
+        for m_ in msgs:
+            peer = getattr(m_, 'peer_id', None)
+            if peer is None:
+                continue
+            # Channel 类型讨论组 / Chat 类型讨论组
+            if getattr(peer, 'channel_id', None) == disc_id or getattr(peer, 'chat_id', None) == disc_id:
+                return getattr(m_, 'id', None)
+        return getattr(msgs[0], 'id', None)
+
+    async def _lookup_thread(self, msg_id: int) -> Optional[int]:
+        self.lookups += 1
+        try:
+            dm = await self._call(lambda: self.client(
+                functions.messages.GetDiscussionMessageRequest(peer=self.channel, msg_id=msg_id)))
+            return self._pick_top_id(dm)
+        except Exception as e:
+            print(f"⚠️ 获取讨论主题失败(id={msg_id}): {e}")
+            return None
+
+    async def _read_comments(self, top_id: int) -> List[str]:
+        async def read():
+            chunks = []
+            async for reply in self.client.iter_messages(self.discussion, reply_to=top_id):
+                rtext = getattr(reply, 'raw_text', '') or ''
+                if rtext:
+                    chunks.append(rtext)
+            return chunks
+        chunks = await self._call(read)
+        self.comments += len(chunks)
+        return chunks
+
+    def _cached(self, cache: _LRU, key, make_coro) -> asyncio.Future:
+        """同一 key 只创建一个任务，并发的调用方共享结果"""
+        fut = cache.get(key)
+        if fut is not None and not (fut.done() and (fut.cancelled() or fut.exception() is not None)):
+            self.cache_hits += 1
+            cache.move_to_end(key)
+            return fut
+        fut = asyncio.ensure_future(make_coro())
+        cache.put(key, fut)
+        return fut
+
+    async def harvest(self, msg, text: str) -> str:
+        """返回合并了评论的文本（没有评论或抓取失败时返回原文）"""
+        msg_id = getattr(msg, 'id', None)
+        grouped_id = getattr(msg, 'grouped_id', None)
+        key = ('album', grouped_id) if grouped_id else ('msg', msg_id)
+        top_id = await asyncio.shield(self._cached(self._threads, key, lambda: self._lookup_thread(msg_id)))
+        if not top_id:
+            print(f"⚠️ 跳过评论抓取，无法定位讨论主题(id={msg_id})")
+            return text
+        try:
+            chunks = await asyncio.shield(self._cached(self._comments, top_id, lambda: self._read_comments(top_id)))
+        except Exception as e:
+            print(f"⚠️ 读取评论失败(id={msg_id}): {e}")
+            return text
+        # 将评论内容合并到原始文本，确保下游解析到评论里的链接
+        if chunks:
+            return (text + "\n\n" if text else "") + "\n".join(chunks)
+        return text
+
+    async def close(self):
+        """取消仍在进行的抓取任务"""
+        pending = [f for cache in (self._threads, self._comments) for f in cache.values() if not f.done()]
+        for f in pending:
+            f.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -25,6 +25,34 @@ class Settings(BaseSettings):
     # 日志级别
     LOG_LEVEL: str = "INFO"
 
+    # 监控写入队列：攒批条数上限 / 攒批时间窗口（毫秒）/ 队列最大深度（满了会反压事件处理）
+    WRITE_BATCH_SIZE: int = 200
+    WRITE_BATCH_WINDOW_MS: int = 500
+    WRITE_QUEUE_MAXSIZE: int = 5000
+    # 事件循环单次阻塞超过该毫秒数时告警（monitor 运行时探测，async_db.py --check-loop 自检阈值）
+    LOOP_BLOCK_WARN_MS: int = 200
+
+    # 频道解析/加入失败后，间隔多少秒再重试（解析成功、已加入的频道不会再请求 Telegram）
+    CHANNEL_RESOLVE_RETRY_SEC: int = 600
+    # 同时加入频道的并发数（遇到频率限制时整体暂停）
+    CHANNEL_JOIN_CONCURRENCY: int = 3
+
+    # 后台变更通过 LISTEN/NOTIFY 即时推送；另每隔多少秒兜底全量刷新一次（防通知丢失）
+    CHANGE_FEED_FALLBACK_SEC: int = 60
+
+    # 多频道回溯：同时回溯的频道数
+    BACKFILL_CONCURRENCY: int = 4
+    # 历史导出：同时抓取评论的消息数
+    EXPORT_COMMENT_CONCURRENCY: int = 8
+    # 逐条导入使用的链接哈希索引快照文件（link_index.py）
+    LINK_INDEX_PATH: str = "link_index.npy"
+    # 导入 / 回溯 / 监控突发时的解析进程数（0 表示按 CPU 核数，1 表示不用多进程）
+    PARSE_WORKERS: int = 0
+    # 前台 web.py 共用的新消息轮询间隔（秒）：每个进程只有一个线程查询高水位，与打开的页面数无关
+    WEB_POLL_SEC: int = 5
+    # 前台 web.py 各页面共享的查询结果缓存的内存上限（MB）
+    WEB_CACHE_MB: int = 64
+
     # Docker 环境标识
     DOCKER_ENV: str = "false"
 
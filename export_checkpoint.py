@@ -0,0 +1,167 @@
+"""可断点续传的 JSONL 导出（export_import_bsbdbfjfjff.py 使用）
+
+输出文件旁边保存一个检查点文件 <输出>.ckpt.json，记录已导出的最大消息ID与对应的文件字节偏移：
+- 每条记录编码成一整行后一次写入；检查点只在 flush + fsync 之后推进，且先写临时文件再 os.replace，
+  因此检查点永远不会指向尚未落盘的数据
+- 重跑时从检查点偏移处校验其后的内容：完整的行保留（并据此推进最大消息ID），
+  进程被杀时写了一半的最后一行被截掉，然后以追加模式继续，从最大消息ID之后拉取，不会重复下载
+- 没有检查点但输出文件已存在（旧版导出 / 检查点丢失）时，扫描整个文件重建
+- 边导出边入库时另记录已写库的最大消息ID（imported_id），每次保存检查点时从 imported_source 读取，
+  且不超过已落盘的 last_id；续传时据此补入库
+"""
+import datetime
+import json
+import os
+from typing import Callable, Optional
+
+# 每导出多少条推进一次检查点
+CHECKPOINT_EVERY = 200
+
+
+def checkpoint_path(output_path: str) -> str:
+    return output_path + '.ckpt.json'
+
+
+def _scan_complete_lines(f, offset: int):
+    """从 offset 开始读取，返回 (最后一个完整有效行的结束偏移, 其中的最大消息ID, 完整行数)"""
+    f.seek(offset)
+    good_end, max_id, count = offset, 0, 0
+    pos = offset
+    for raw in f:
+        pos += len(raw)
+        if not raw.endswith(b'\n'):
+            # 写了一半的最后一行
+            break
+        line = raw.strip()
+        if line:
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                break
+            max_id = max(max_id, int(obj.get('id') or 0))
+            count += 1
+        good_end = pos
+    return good_end, max_id, count
+
+
+class ExportCheckpoint:
+    """一个输出文件的导出进度：last_id（已导出的最大消息ID）、offset（对应的文件字节数）、count（已导出条数）、
+    imported_id（边导出边入库时已写库的最大消息ID）"""
+
+    def __init__(self, output_path: str, channel: str, url_only: bool = False, no_comments: bool = False):
+        self.output_path = output_path
+        self.path = checkpoint_path(output_path)
+        self.channel = channel
+        self.url_only = url_only
+        self.no_comments = no_comments
+        self.last_id = 0
+        self.offset = 0
+        self.count = 0
+        self.imported_id = 0
+        # 边导出边入库时返回当前已写库的最大消息ID（StreamImporter.imported_id）
+        self.imported_source: Optional[Callable[[], int]] = None
+        self._since_save = 0
+
+    def _options(self) -> dict:
+        return {'channel': self.channel, 'url_only': self.url_only, 'no_comments': self.no_comments}
+
+    def reset(self):
+        """从头导出：清空输出文件与检查点"""
+        for p in (self.output_path, self.path):
+            if os.path.exists(p):
+                os.remove(p)
+        self.last_id = self.offset = self.count = self.imported_id = 0
+
+    def _load_saved(self) -> Optional[dict]:
+        """读取检查点文件并校验导出参数，没有时返回 None"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('channel') != self.channel:
+            raise RuntimeError(f"{self.output_path} 是频道 @{saved.get('channel')} 的导出，请换一个输出路径或使用 --restart")
+        # 已导出部分不含评论 / 只含链接消息时，不能在其后接着导出更完整的内容
+        if (saved.get('url_only') and not self.url_only) or (saved.get('no_comments') and not self.no_comments):
+            raise RuntimeError(f"{self.output_path} 的导出参数（url_only={saved.get('url_only')}, no_comments={saved.get('no_comments')}）"
+                               f"与本次不一致，请使用相同参数续传，或使用 --restart 重新导出")
+        return saved
+
+    def load(self) -> bool:
+        """载入检查点并修复输出文件，返回是否为续传"""
+        saved = self._load_saved()
+        if not os.path.exists(self.output_path):
+            if saved:
+                print(f"⚠️ 检查点存在但输出文件 {self.output_path} 不存在，将从头导出")
+            return False
+
+        start = int(saved.get('offset') or 0) if saved else 0
+        with open(self.output_path, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if start > size:
+                print(f"⚠️ 输出文件比检查点记录的短（{size} < {start} 字节），重新扫描整个文件")
+                start, saved = 0, None
+            end, max_id, count = _scan_complete_lines(f, start)
+            if end < size:
+                print(f"🩹 输出文件末尾有 {size - end} 字节不完整的记录，已截断")
+                f.truncate(end)
+        self.offset = end
+        self.last_id = max(int(saved.get('last_id') or 0) if saved else 0, max_id)
+        self.count = (int(saved.get('count') or 0) if saved else 0) + count
+        self.imported_id = min(int(saved.get('imported_id') or 0) if saved else 0, self.last_id)
+        if self.offset:
+            self.save()
+            return True
+        return False
+
+    def _sync_imported(self):
+        """保存检查点前更新 imported_id：已写库但尚未落盘的记录不计入（续传时会重新导出、重新入库）"""
+        if self.imported_source is not None:
+            self.imported_id = min(max(self.imported_id, self.imported_source()), self.last_id)
+
+    def save(self):
+        self._sync_imported()
+        data = dict(self._options(), last_id=self.last_id, offset=self.offset, count=self.count,
+                    imported_id=self.imported_id,
+                    updated_at=datetime.datetime.now().isoformat(timespec='seconds'))
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._since_save = 0
+
+    def write(self, f, record: dict):
+        """整行写入一条记录（f 为以 'ab' 打开的输出文件），定期推进检查点"""
+        f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.last_id = max(self.last_id, int(record.get('id') or 0))
+        self.count += 1
+        self._since_save += 1
+        if self._since_save >= CHECKPOINT_EVERY:
+            self.commit(f)
+
+    def commit(self, f):
+        """把已写入的记录落盘后推进检查点"""
+        f.flush()
+        os.fsync(f.fileno())
+        self.offset = f.tell()
+        self.save()
+
+    def iter_records(self, after_id: int = 0):
+        """依次读出检查点范围内 id > after_id 的记录（续传时补入库用）"""
+        with open(self.output_path, 'rb') as f:
+            pos = 0
+            for raw in f:
+                pos += len(raw)
+                if pos > self.offset:
+                    break
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue
+                if int(record.get('id') or 0) > after_id:
+                    yield record
+
+    def resume_min_id(self, min_id: Optional[int] = None) -> int:
+        """续传时 iter_messages 的 min_id（不含），与手动指定的 --min-id 取较大者"""
+        return max(self.last_id, min_id or 0)
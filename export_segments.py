@@ -0,0 +1,237 @@
+"""分段压缩的导出格式（export_import_bsbdbfjfjff.py --format zstd 使用，需要 zstandard）
+
+- 输出文件由若干个独立的 zstd 帧首尾相接组成，每帧是 EXPORT_SEGMENT_RECORDS 条 JSONL 记录
+  （整个文件仍是合法的 zstd 流，zstdcat 可直接查看）
+- 索引文件 <输出>.idx.json 记录每段的 字节偏移 / 长度 / 消息ID范围 / 日期范围 / 条数，同时充当导出检查点
+- 导入时按消息ID或日期范围只读取需要的段，并用线程池并行解压（zstd 解压时释放 GIL）
+- 续传：只有写完并 fsync 的段才会登记进索引；进程被杀时未写完的段在重跑时截掉，该段的记录重新拉取
+"""
+import datetime
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from export_checkpoint import ExportCheckpoint
+
+# 每段记录数
+EXPORT_SEGMENT_RECORDS = 5000
+# zstd 压缩级别
+ZSTD_LEVEL = 6
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd 导出格式需要 zstandard，请先 pip install zstandard")
+    return zstandard
+
+
+def index_path(output_path: str) -> str:
+    return output_path + '.idx.json'
+
+
+def is_segmented(path: str) -> bool:
+    return path.endswith('.zst') or os.path.exists(index_path(path))
+
+
+def _parse_date(value) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        dt = value
+    elif isinstance(value, datetime.date):
+        dt = datetime.datetime(value.year, value.month, value.day)
+    else:
+        try:
+            dt = datetime.datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
+
+
+class SegmentedExport(ExportCheckpoint):
+    """与 ExportCheckpoint 接口相同：write() 先缓存在内存中，凑满一段压缩写入并登记索引"""
+
+    def __init__(self, output_path: str, channel: str, url_only: bool = False, no_comments: bool = False,
+                 segment_records: Optional[int] = None):
+        super().__init__(output_path, channel, url_only=url_only, no_comments=no_comments)
+        self.path = index_path(output_path)
+        self.segment_records = segment_records or EXPORT_SEGMENT_RECORDS
+        self.segments: List[Dict[str, Any]] = []
+        self._buffer: List[bytes] = []
+        self._meta: Dict[str, Any] = {}
+        self._compressor = _zstd().ZstdCompressor(level=ZSTD_LEVEL)
+
+    def reset(self):
+        super().reset()
+        self.segments = []
+        self._buffer = []
+
+    def load(self) -> bool:
+        """载入索引并截掉未登记的尾部数据，返回是否为续传"""
+        saved = self._load_saved()
+        if not os.path.exists(self.output_path):
+            if saved:
+                print(f"⚠️ 索引存在但输出文件 {self.output_path} 不存在，将从头导出")
+            return False
+        if saved is None:
+            raise RuntimeError(f"{self.output_path} 缺少索引文件 {self.path}，无法续传，请使用 --restart 重新导出")
+        self.segments = saved.get('segments') or []
+        end = sum(seg['length'] for seg in self.segments)
+        with open(self.output_path, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size < end:
+                raise RuntimeError(f"{self.output_path} 比索引记录的短（{size} < {end} 字节），请使用 --restart 重新导出")
+            if size > end:
+                print(f"🩹 输出文件末尾有 {size - end} 字节未登记的段，已截断（该段记录将重新拉取）")
+                f.truncate(end)
+        self.offset = end
+        self.last_id = max((seg['last_id'] for seg in self.segments), default=0)
+        self.count = sum(seg['count'] for seg in self.segments)
+        self.imported_id = min(int(saved.get('imported_id') or 0), self.last_id)
+        return bool(self.segments)
+
+    def save(self):
+        self._sync_imported()
+        data = dict(self._options(), format='zstd', segment_records=self.segment_records, last_id=self.last_id,
+                    offset=self.offset, count=self.count, imported_id=self.imported_id, segments=self.segments,
+                    updated_at=datetime.datetime.now().isoformat(timespec='seconds'))
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def write(self, f, record: dict):
+        rid, date = int(record.get('id') or 0), record.get('date')
+        if not self._buffer:
+            self._meta = {'first_id': rid, 'last_id': rid, 'first_date': None, 'last_date': None}
+        self._meta['last_id'] = rid
+        if date:
+            self._meta['first_date'] = self._meta['first_date'] or date
+            self._meta['last_date'] = date
+        self._buffer.append((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        if len(self._buffer) >= self.segment_records:
+            self.commit(f)
+
+    def commit(self, f):
+        """把缓存的记录压缩成一段写入，落盘后登记索引（结束/中断时最后一段可能不满）；
+        没有缓存的记录时也保存索引（推进 imported_id）"""
+        if not self._buffer:
+            self.save()
+            return
+        frame = self._compressor.compress(b''.join(self._buffer))
+        f.write(frame)
+        f.flush()
+        os.fsync(f.fileno())
+        self.segments.append(dict(self._meta, offset=self.offset, length=len(frame), count=len(self._buffer)))
+        self.offset += len(frame)
+        self.count += len(self._buffer)
+        self.last_id = max(self.last_id, self._meta['last_id'])
+        self._buffer = []
+        self.save()
+
+    def iter_records(self, after_id: int = 0) -> Iterator[dict]:
+        yield from SegmentReader(self.output_path).iter_records(min_id=after_id + 1)
+
+
+class SegmentReader:
+    """按索引读取分段导出文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(index_path(path), 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        self.segments: List[Dict[str, Any]] = self.index.get('segments') or []
+
+    def select(self, min_id: Optional[int] = None, max_id: Optional[int] = None,
+               since=None, until=None) -> List[Dict[str, Any]]:
+        """消息ID / 日期范围有交集的段（日期缺失的段不按日期排除）"""
+        since_dt, until_dt = _parse_date(since), _parse_date(until)
+        chosen = []
+        for seg in self.segments:
+            if min_id is not None and seg['last_id'] < min_id:
+                continue
+            if max_id is not None and seg['first_id'] > max_id:
+                continue
+            last_dt, first_dt = _parse_date(seg.get('last_date')), _parse_date(seg.get('first_date'))
+            if since_dt is not None and last_dt is not None and last_dt < since_dt:
+                continue
+            if until_dt is not None and first_dt is not None and first_dt >= until_dt:
+                continue
+            chosen.append(seg)
+        return chosen
+
+    def _read_segment(self, seg: Dict[str, Any]) -> List[dict]:
+        with open(self.path, 'rb') as f:
+            f.seek(seg['offset'])
+            frame = f.read(seg['length'])
+        data = _zstd().ZstdDecompressor().decompressobj().decompress(frame)
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+    def iter_records(self, min_id: Optional[int] = None, max_id: Optional[int] = None,
+                     since=None, until=None, workers: int = 1) -> Iterator[dict]:
+        """按原顺序输出范围内的记录；workers > 1 时并行解压后续的段"""
+        since_dt, until_dt = _parse_date(since), _parse_date(until)
+        segments = self.select(min_id, max_id, since, until)
+        for records in self._read_segments(segments, workers):
+            for record in records:
+                rid = int(record.get('id') or 0)
+                if (min_id is not None and rid < min_id) or (max_id is not None and rid > max_id):
+                    continue
+                if since_dt is not None or until_dt is not None:
+                    dt = _parse_date(record.get('date'))
+                    if dt is not None and ((since_dt is not None and dt < since_dt) or (until_dt is not None and dt >= until_dt)):
+                        continue
+                yield record
+
+    def _read_segments(self, segments: List[Dict[str, Any]], workers: int) -> Iterator[List[dict]]:
+        """按顺序产出各段的记录；并行时最多预读 workers * 2 段，避免解压结果堆积在内存里"""
+        if workers <= 1 or len(segments) <= 1:
+            for seg in segments:
+                yield self._read_segment(seg)
+            return
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                for seg in segments:
+                    pending.append(pool.submit(self._read_segment, seg))
+                    if len(pending) >= workers * 2:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for fut in pending:
+                    fut.cancel()
+
+
+def iter_export_records(path: str, min_id: Optional[int] = None, max_id: Optional[int] = None,
+                        since=None, until=None, workers: int = 1) -> Iterator[dict]:
+    """读取导出文件（分段压缩格式按索引只读需要的段；普通 JSONL 顺序读取并过滤）"""
+    if is_segmented(path):
+        yield from SegmentReader(path).iter_records(min_id, max_id, since, until, workers=workers)
+        return
+    since_dt, until_dt = _parse_date(since), _parse_date(until)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except Exception:
+                continue
+            rid = int(record.get('id') or 0)
+            if (min_id is not None and rid < min_id) or (max_id is not None and rid > max_id):
+                continue
+            if since_dt is not None or until_dt is not None:
+                dt = _parse_date(record.get('date'))
+                if dt is not None and ((since_dt is not None and dt < since_dt) or (until_dt is not None and dt >= until_dt)):
+                    continue
+            yield record
@@ -1,7 +1,13 @@
 from model import create_tables, Channel, engine
+from message_store import backfill_message_links, rebuild_tag_counts
+from migrations import run_migrations
 from sqlalchemy.orm import Session
 from config import settings
 
+def upgrade_schema():
+    """执行尚未执行的版本化迁移（见 migrations.py）"""
+    run_migrations()
+
 def init_channels():
     # 从配置中获取默认频道列表
     default_channels = settings.DEFAULT_CHANNELS.split(',')
@@ -25,9 +31,32 @@ def init_channels():
         # 提交更改
         session.commit()
 
+def init_message_links(force: bool = False):
+    """把已有 messages.links 回填到 message_links（表为空时才执行，force 则总是执行）"""
+    with Session(engine) as session:
+        added = backfill_message_links(session, only_if_empty=not force)
+    if added:
+        print(f"已回填链接索引: {added} 条")
+
+def init_tag_counts():
+    """按 messages 重新聚合标签计数（初始计数由迁移 2 建触发器时在同一事务里聚合，这里只用于修复偏差）"""
+    with Session(engine) as session:
+        count = rebuild_tag_counts(session)
+    print(f"已重建标签计数: {count} 个标签")
+
 if __name__ == "__main__":
+    import sys
     print("正在创建表...")
     create_tables()
+    print("正在执行数据库迁移...")
+    upgrade_schema()
     print("正在初始化频道...")
     init_channels()
+    print("正在回填链接索引...")
+    init_message_links(force="--backfill-links" in sys.argv)
+    if "--rebuild-tag-counts" in sys.argv:
+        print("正在重建标签计数...")
+        init_tag_counts()
+    else:
+        print("（标签计数与消息不一致时，可运行 python init_db.py --rebuild-tag-counts 重新聚合，监控运行中也可执行）")
     print("初始化完成！")
\ No newline at end of file
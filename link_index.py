@@ -0,0 +1,201 @@
+"""导入用的紧凑链接索引（逐条导入路径 import_from_txt(bulk=False) / 2222.py 使用）
+
+原来每次导入都把 message_links 全部读成 {url: message_id} 字典，链接数百万时要占用数 GB 内存、启动数分钟。
+这里只保存链接的 64 位哈希：
+- 按哈希排序的 uint64 数组 + 对齐的 message_id 数组，存成 .npy 快照（LINK_INDEX_PATH），以 mmap 方式打开，几乎不占启动时间
+- 快照记录生成时 message_links 的最大行ID（高水位），之后的运行只读取高水位之后新增的链接行
+- 哈希未命中即可确定链接不存在；命中时（可能是哈希碰撞，或链接已改指向其他消息 / 已删除）
+  一律按原始 url 回数据库确认，结果始终以数据库为准
+
+python link_index.py --rebuild   从数据库重建快照
+python link_index.py --stats     查看快照信息
+"""
+import hashlib
+import json
+import os
+import sys
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from model import Message, MessageLink
+
+# 快照之后新增的链接超过这么多条时，save() 会合并成新快照
+SNAPSHOT_MERGE_THRESHOLD = 100000
+
+_DTYPE = np.dtype([('hash', '<u8'), ('message_id', '<i8')])
+
+
+def url_hash(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _meta_path(path: str) -> str:
+    return path + '.json'
+
+
+def _build(rows: Iterable[Tuple[str, int]]) -> np.ndarray:
+    """(url, message_id) -> 按哈希排序的快照数组；同一哈希保留最后出现的一条"""
+    hashes, ids = array('Q'), array('q')
+    for url, mid in rows:
+        hashes.append(url_hash(url))
+        ids.append(mid)
+    return _merge(np.empty(0, dtype=_DTYPE), np.frombuffer(hashes, dtype='<u8'), np.frombuffer(ids, dtype='<i8'))
+
+
+def _merge(base: np.ndarray, hashes: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """把新条目合并进已排序的快照数组，哈希相同时新条目覆盖旧条目"""
+    keys = np.concatenate([base['hash'], hashes])
+    vals = np.concatenate([base['message_id'], ids])
+    order = np.argsort(keys, kind='stable')
+    keys, vals = keys[order], vals[order]
+    keep = np.ones(len(keys), dtype=bool)
+    keep[:-1] = keys[1:] != keys[:-1]
+    out = np.empty(int(keep.sum()), dtype=_DTYPE)
+    out['hash'], out['message_id'] = keys[keep], vals[keep]
+    return out
+
+
+def _max_link_id(session: Session) -> int:
+    return session.execute(select(func.coalesce(func.max(MessageLink.id), 0))).scalar()
+
+
+class LinkIndex:
+    """url 哈希 -> message_id；用法与原来的 {url: message_id} 字典相近"""
+
+    def __init__(self, snapshot: np.ndarray, high_water: int, path: Optional[str] = None):
+        self.path = path
+        self.snapshot = snapshot
+        self.high_water = high_water
+        # 快照之后数据库新增的链接
+        self.delta: Dict[int, int] = {}
+        self.delta_high_water = high_water
+        # 本次运行写入的条目（-1 表示已决定插入、尚未提交）
+        self.overlay: Dict[int, int] = {}
+
+    @classmethod
+    def open(cls, session: Session, path: Optional[str] = None) -> 'LinkIndex':
+        """载入快照（没有或失效时从数据库重建），再读入高水位之后的链接"""
+        path = path or settings.LINK_INDEX_PATH
+        index = None
+        current_max = _max_link_id(session)
+        try:
+            with open(_meta_path(path), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            snapshot = np.load(path, mmap_mode='r')
+            if snapshot.dtype != _DTYPE or len(snapshot) != meta['count']:
+                raise ValueError("快照与元数据不一致")
+            if meta['high_water'] > current_max:
+                raise ValueError("数据库链接表比快照旧（可能已重建）")
+            index = cls(snapshot, meta['high_water'], path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ 链接索引快照不可用，将重建: {e}")
+        if index is None:
+            index = cls.rebuild(session, path)
+        index.load_delta(session)
+        return index
+
+    @classmethod
+    def rebuild(cls, session: Session, path: Optional[str] = None) -> 'LinkIndex':
+        path = path or settings.LINK_INDEX_PATH
+        high_water = _max_link_id(session)
+        rows = session.execute(
+            select(MessageLink.url, MessageLink.message_id)
+            .where(MessageLink.id <= high_water)
+            .order_by(MessageLink.id)
+            .execution_options(yield_per=50000)
+        )
+        index = cls(_build(rows), high_water, path)
+        index.write()
+        print(f"🧩 已重建链接索引快照（{len(index.snapshot)} 条，高水位 {high_water}）")
+        return index
+
+    def load_delta(self, session: Session) -> int:
+        """读入高水位之后新增的链接行，返回条数"""
+        rows = session.execute(
+            select(MessageLink.id, MessageLink.url, MessageLink.message_id)
+            .where(MessageLink.id > self.delta_high_water)
+            .order_by(MessageLink.id)
+        )
+        n = 0
+        for link_id, url, mid in rows:
+            self.delta[url_hash(url)] = mid
+            self.delta_high_water = link_id
+            n += 1
+        return n
+
+    def write(self):
+        """原子地写入快照与元数据（先写临时文件再替换）"""
+        tmp = self.path + '.tmp.npy'
+        np.save(tmp, np.asarray(self.snapshot, dtype=_DTYPE))
+        os.replace(tmp, self.path)
+        meta = {'high_water': self.high_water, 'count': len(self.snapshot), 'hash': 'blake2b-64'}
+        with open(_meta_path(self.path) + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(_meta_path(self.path) + '.tmp', _meta_path(self.path))
+
+    def save(self, session: Session, force: bool = False):
+        """导入结束后调用：读入本次写入的链接，新增较多时合并成新快照"""
+        self.load_delta(session)
+        if not self.delta or (not force and len(self.delta) < SNAPSHOT_MERGE_THRESHOLD):
+            return
+        hashes = np.fromiter(self.delta.keys(), dtype='<u8', count=len(self.delta))
+        ids = np.fromiter(self.delta.values(), dtype='<i8', count=len(self.delta))
+        self.snapshot = _merge(np.asarray(self.snapshot), hashes, ids)
+        self.high_water = self.delta_high_water
+        self.delta = {}
+        self.write()
+        print(f"🧩 链接索引快照已更新（{len(self.snapshot)} 条，高水位 {self.high_water}）")
+
+    def __len__(self):
+        return len(self.snapshot) + len(self.delta)
+
+    def __setitem__(self, url: str, message_id: int):
+        self.overlay[url_hash(url)] = message_id
+
+    def _maybe_contains(self, h: int) -> bool:
+        if h in self.delta:
+            return True
+        i = int(np.searchsorted(self.snapshot['hash'], np.uint64(h)))
+        return i < len(self.snapshot) and int(self.snapshot['hash'][i]) == h
+
+    def find(self, session: Session, urls: Iterable[str]) -> Optional[int]:
+        """返回链接当前所属的消息ID（属于多条消息时取时间最新的一条，与实时写入 UPSERT_BY_LINKS_SQL 相同；
+        -1 表示本次运行中已决定插入、尚未提交），都不存在返回 None"""
+        candidates = []
+        for u in urls:
+            h = url_hash(u)
+            if self.overlay.get(h) == -1:
+                return -1
+            if h in self.overlay or self._maybe_contains(h):
+                candidates.append(u)
+        if not candidates:
+            return None
+        # 哈希命中：按原始 url 到数据库确认（排除碰撞与已改指向/已删除的链接）
+        owners = session.execute(
+            select(Message.timestamp, Message.id)
+            .join(MessageLink, MessageLink.message_id == Message.id)
+            .where(MessageLink.url.in_(candidates))
+        ).all()
+        return max(owners)[1] if owners else None
+
+
+def main():
+    from model import engine
+    with Session(engine) as session:
+        if '--rebuild' in sys.argv:
+            LinkIndex.rebuild(session)
+            return
+        index = LinkIndex.open(session)
+        print(f"🧩 链接索引：快照 {len(index.snapshot)} 条（高水位 {index.high_water}，"
+              f"{index.snapshot.nbytes / 1024 / 1024:.1f} MB），快照之后新增 {len(index.delta)} 条")
+
+
+if __name__ == '__main__':
+    main()
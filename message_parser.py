@@ -0,0 +1,233 @@
+"""消息文本解析（monitor / 回溯 / 导出导入 共用）
+
+所有正则在模块加载时编译一次；描述区的“网盘名：链接”、裸链接、#标签、网盘名关键词
+由同一个扫描器一趟提取完成。遇到极少数会让单趟结果与旧版逐段 findall+sub 不一致的
+重叠写法时（如链接内部又嵌了“名称:链接”），自动回退到逐段处理，保证输出完全一致。
+"""
+import re
+from typing import Dict, Any, List, Tuple
+
+from netdisk import get_provider
+
+# 描述中需要移除的网盘名关键词（顺序即匹配优先级）
+NETDISK_NAMES = ['夸克', '迅雷', '百度', 'UC', '阿里', '天翼', '115', '123云盘']
+
+_KEY_CHARS = r'[\u4e00-\u9fa5A-Za-z0-9#]+'
+# “名称”只可能从连续名称字符的开头匹配（最左匹配必然如此），加上后顾断言避免长中文段落里逐字回溯
+_KEY_START = r'(?<![\u4e00-\u9fa5A-Za-z0-9#])'
+_URL = r'https?://[^\s]+'
+_TAG_CHARS = r'[\u4e00-\u9fa5A-Za-z0-9_]+'
+_NAMES = '|'.join(NETDISK_NAMES)
+
+# 旧版逐段处理使用的各个模式（回退路径）
+PAIR_PATTERN = re.compile(_KEY_START + r'(' + _KEY_CHARS + r')[：:](' + _URL + r')')
+URL_PATTERN = re.compile(r'(' + _URL + r')')
+TAG_PATTERN = re.compile(r'#(' + _TAG_CHARS + r')')
+NETDISK_NAME_PATTERN = re.compile(r'(' + _NAMES + r')')
+_PUNCT_LINE = re.compile(r'[.。·、,，-]+')
+_LINE_PREFIX = re.compile(r'🏷 标签：|标签：|描述：|链接：|🎉 来自：|📢 频道：|👥 群组：|🤖 投稿：')
+
+# 单趟扫描：只锚定 冒号+链接 / 裸链接 / #标签 / 网盘名 四类起点（不带捕获组，便于 re 做首字符快速跳过），
+# “名称:链接”的名称部分由命中冒号后向前回看得到
+SCAN_PATTERN = re.compile(r'[：:]' + _URL + r'|' + _URL + r'|#' + _TAG_CHARS + r'|' + _NAMES)
+_KEY_CHAR_SET = frozenset('#0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+
+
+class _Overlap(Exception):
+    """单趟扫描遇到与逐段处理语义不一致的重叠写法"""
+
+
+def _is_key_char(ch: str) -> bool:
+    return ch in _KEY_CHAR_SET or '\u4e00' <= ch <= '\u9fa5'
+
+
+def _scan_description(desc_text: str) -> Tuple[List[Tuple[str, str]], List[str], List[str], str]:
+    """单趟提取 (名称:链接对, 裸链接, 标签, 剩余文本)"""
+    # 命中项 (起点, 终点, 类型, 值)，按起点有序
+    items: List[Tuple[int, int, str, Any]] = []
+    for m in SCAN_PATTERN.finditer(desc_text):
+        start, end = m.span()
+        token = m.group()
+        head = token[0]
+        if head == ':' or head == '：':
+            key_start = start
+            while key_start > 0 and _is_key_char(desc_text[key_start - 1]):
+                key_start -= 1
+            if key_start == start:
+                # 冒号前没有名称，按裸链接处理
+                head, start, token = 'h', start + 1, token[1:]
+            else:
+                # 名称里先命中的标签/网盘名归入该“名称:链接”对
+                while items and items[-1][0] >= key_start:
+                    items.pop()
+                if items and items[-1][1] > key_start:
+                    raise _Overlap
+                items.append((key_start, end, 'pair', (desc_text[key_start:start], token[1:])))
+                continue
+        if head == 'h':
+            # 链接内部还藏着“名称:链接”，逐段处理会先把它拆出来
+            if ':http' in token or '：http' in token:
+                raise _Overlap
+            items.append((start, end, 'url', token))
+        elif head == '#':
+            # 标签以 http(s) 结尾且紧跟 ://，逐段处理会先把后半截当作裸链接
+            if desc_text.startswith('://', end):
+                raise _Overlap
+            items.append((start, end, 'tag', token[1:]))
+        else:
+            items.append((start, end, 'name', None))
+
+    pairs: List[Tuple[str, str]] = []
+    urls: List[str] = []
+    tags: List[str] = []
+    kept: List[str] = []
+    pos = 0
+    for start, end, kind, value in items:
+        if kind == 'pair':
+            pairs.append(value)
+        elif kind == 'url':
+            urls.append(value)
+        elif kind == 'tag':
+            tags.append(value)
+        kept.append(desc_text[pos:start])
+        pos = end
+    kept.append(desc_text[pos:])
+    return pairs, urls, tags, ''.join(kept)
+
+
+def _scan_description_legacy(desc_text: str) -> Tuple[List[Tuple[str, str]], List[str], List[str], str]:
+    """逐段 findall+sub 处理，与单趟扫描返回同样的结构"""
+    pairs = PAIR_PATTERN.findall(desc_text)
+    desc_text = PAIR_PATTERN.sub('', desc_text)
+    urls = URL_PATTERN.findall(desc_text)
+    desc_text = URL_PATTERN.sub('', desc_text)
+    tags = TAG_PATTERN.findall(desc_text)
+    if tags:
+        desc_text = TAG_PATTERN.sub('', desc_text)
+    desc_text = NETDISK_NAME_PATTERN.sub('', desc_text)
+    return pairs, urls, tags, desc_text
+
+
+def parse_message(text: str, single_pass: bool = True) -> Dict[str, Any]:
+    """解析消息内容，提取标题、描述、链接等信息（支持一行多网盘名链接提取和全局标签提取）"""
+    lines = text.split('\n')
+    title = ''
+    links = {}
+    tags = []
+    source = ''
+    channel = ''
+    group = ''
+    bot = ''
+    desc_lines = []
+
+    # 1. 标题提取：优先"名称："，否则第一行直接当title
+    if lines and lines[0].strip():
+        if lines[0].startswith('名称：'):
+            title = lines[0].replace('名称：', '').strip()
+        else:
+            title = lines[0].strip()
+
+    # 2. 遍历其余行，提取描述、链接、标签等（行首前缀用一次预编译匹配分派）
+    for line in (lines[1:] if title else lines):
+        line = line.strip()
+        if not line:
+            continue
+        m = _LINE_PREFIX.match(line)
+        prefix = m.group(0) if m else None
+        # 兼容多种标签前缀
+        if prefix == '🏷 标签：' or prefix == '标签：':
+            tags.extend([tag.strip('#') for tag in line.replace('🏷 标签：', '').replace('标签：', '').split() if tag.strip('#')])
+        elif prefix == '描述：':
+            desc_lines.append(line.replace('描述：', '').strip())
+        elif prefix == '链接：':
+            url = line.replace('链接：', '').strip()
+            if not url:
+                continue  # 跳过空链接
+            links[get_provider(url) or '其他'] = url
+        elif prefix == '🎉 来自：':
+            source = line.replace('🎉 来自：', '').strip()
+        elif prefix == '📢 频道：':
+            channel = line.replace('📢 频道：', '').strip()
+        elif prefix == '👥 群组：':
+            group = line.replace('👥 群组：', '').strip()
+        elif prefix == '🤖 投稿：':
+            bot = line.replace('🤖 投稿：', '').strip()
+        else:
+            desc_lines.append(line)
+
+    # 3. 描述区：提取“网盘名：链接”对、裸链接、#标签，并移除它们与网盘名关键词
+    desc_text = '\n'.join(desc_lines)
+    try:
+        if not single_pass:
+            raise _Overlap
+        pairs, urls, found_tags, desc_text = _scan_description(desc_text)
+    except _Overlap:
+        pairs, urls, found_tags, desc_text = _scan_description_legacy(desc_text)
+    for key, url in pairs:
+        links[get_provider(url, key) or key.strip()] = url
+    for url in urls:
+        links[get_provider(url) or '其他'] = url
+    tags.extend(found_tags)
+    # 去重
+    tags = list(set(tags))
+
+    # 4. 最终description，去除无意义符号行
+    desc_lines_final = [line for line in desc_text.strip().split('\n') if line.strip() and not _PUNCT_LINE.fullmatch(line.strip())]
+    description = '\n'.join(desc_lines_final)
+
+    return {
+        'title': title,
+        'description': description,
+        'links': links,
+        'tags': tags,
+        'source': source,
+        'channel': channel,
+        'group_name': group,
+        'bot': bot
+    }
+
+
+def _iter_export_texts(path: str):
+    import json
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                text = (json.loads(line).get('text') or '').strip()
+            except Exception:
+                continue
+            if text:
+                yield text
+
+
+if __name__ == '__main__':
+    # 用导出的 JSONL 做回归/压测：
+    #   python message_parser.py --verify export_bsbdbfjfjff_all.txt   单趟与逐段结果逐条比对
+    #   python message_parser.py --bench export_bsbdbfjfjff_all.txt    单趟与逐段耗时对比
+    import sys
+    import time
+    if len(sys.argv) < 3 or sys.argv[1] not in ('--verify', '--bench'):
+        print("用法: python message_parser.py --verify|--bench <export.jsonl>")
+        sys.exit(1)
+    texts = list(_iter_export_texts(sys.argv[2]))
+    if sys.argv[1] == '--verify':
+        diff = 0
+        for text in texts:
+            a = parse_message(text)
+            b = parse_message(text, single_pass=False)
+            a['tags'], b['tags'] = sorted(a['tags']), sorted(b['tags'])
+            if a != b:
+                diff += 1
+                if diff <= 5:
+                    print(f"❌ 结果不一致：{text[:80]!r}")
+        print(f"{'✅' if not diff else '❌'} 共比对 {len(texts)} 条，不一致 {diff} 条")
+        sys.exit(1 if diff else 0)
+    for single_pass in (False, True):
+        t0 = time.perf_counter()
+        for text in texts:
+            parse_message(text, single_pass=single_pass)
+        cost = time.perf_counter() - t0
+        rate = len(texts) / cost if cost else 0
+        print(f"{'单趟扫描' if single_pass else '逐段处理'}: {len(texts)} 条 {cost:.3f}s（{rate:.0f} 条/秒）")
@@ -0,0 +1,192 @@
+"""按链接去重的消息写入（monitor / 回溯 / 导入 共用）
+
+链接唯一性由 message_links 表（url 唯一索引）维护：
+- 写入一条消息只需一条 SQL：按唯一索引查命中 -> 覆盖更新或插入 -> INSERT ... ON CONFLICT 同步链接
+- 已有数据通过 backfill_message_links() 从 messages.links 回填
+
+标签计数由 tag_counts 表维护（前台标签云直接读取）：messages 上的语句级触发器（migrations.py 创建）按本条语句
+插入/覆盖/删除的行算出每个标签的增减量，一条 UPSERT 累加（批量写入也只更新一次）；
+计数出现偏差（如 TRUNCATE）时用 rebuild_tag_counts() 在数据库内重新聚合
+"""
+import json
+import datetime
+from typing import Dict, Any, List, Tuple, Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from model import MessageLink
+
+# 单次往返完成“按链接去重写入”：
+# hit    -> 任一链接（match_urls，默认即本条消息的链接）已存在时取最新的那条消息（时间相同取 id 较大的）
+# upd    -> 命中则覆盖更新该消息
+# ins    -> 未命中则插入新消息
+# stale  -> 清理目标消息上已不存在的旧链接
+# linked -> 新链接写入/改指向目标消息
+UPSERT_BY_LINKS_SQL = text("""
+WITH hit AS (
+    SELECT m.id
+    FROM message_links AS l
+    JOIN messages AS m ON m.id = l.message_id
+    WHERE l.url = ANY(CAST(:match_urls AS varchar[]))
+    ORDER BY m.timestamp DESC, m.id DESC
+    LIMIT 1
+), upd AS (
+    UPDATE messages AS m
+    SET timestamp = :timestamp,
+        title = :title,
+        description = :description,
+        links = CAST(:links AS jsonb),
+        tags = CAST(:tags AS varchar[]),
+        source = :source,
+        channel = :channel,
+        group_name = :group_name,
+        bot = :bot
+    FROM hit
+    WHERE m.id = hit.id
+    RETURNING m.id
+), ins AS (
+    INSERT INTO messages (timestamp, created_at, title, description, links, tags, source, channel, group_name, bot)
+    SELECT :timestamp, :timestamp, :title, :description, CAST(:links AS jsonb), CAST(:tags AS varchar[]),
+           :source, :channel, :group_name, :bot
+    WHERE NOT EXISTS (SELECT 1 FROM hit)
+    RETURNING id
+), target AS (
+    SELECT id, 'updated' AS op FROM upd
+    UNION ALL
+    SELECT id, 'inserted' AS op FROM ins
+), stale AS (
+    DELETE FROM message_links AS l
+    USING target
+    WHERE l.message_id = target.id AND l.url <> ALL(CAST(:urls AS varchar[]))
+), linked AS (
+    INSERT INTO message_links (url, message_id, provider)
+    SELECT u.url, target.id, u.provider
+    FROM target, unnest(CAST(:urls AS varchar[]), CAST(:providers AS varchar[])) AS u(url, provider)
+    ON CONFLICT (url) DO UPDATE SET message_id = EXCLUDED.message_id, provider = EXCLUDED.provider
+)
+SELECT id, op FROM target
+""")
+
+# 从 messages.links 回填 message_links；同一链接出现在多条消息时归属最新的一条
+BACKFILL_LINKS_SQL = text("""
+INSERT INTO message_links (url, message_id, provider)
+SELECT DISTINCT ON (l.value) l.value, m.id, l.key
+FROM messages AS m, jsonb_each_text(m.links) AS l
+WHERE m.links IS NOT NULL
+  AND jsonb_typeof(m.links) = 'object'
+  AND l.value IS NOT NULL AND l.value <> ''
+ORDER BY l.value, m.timestamp DESC, m.id DESC
+ON CONFLICT (url) DO NOTHING
+""")
+
+
+def link_pairs(links: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """links {网盘类型: url} -> (urls, providers)，同一 url 只保留一次"""
+    by_url: Dict[str, str] = {}
+    for provider, url in (links or {}).items():
+        if url and isinstance(url, str):
+            by_url[url] = provider
+    return list(by_url.keys()), list(by_url.values())
+
+
+def upsert_message_by_links(session: Session, parsed_data: dict, timestamp: datetime.datetime, commit: bool = True,
+                            match_urls: Optional[Iterable[str]] = None) -> str:
+    """基于链接去重的写入逻辑：
+    - 若 parsed_data 中包含 links，则以链接为唯一键：
+      1) 数据库中存在任意相同链接：覆盖并更新该条消息
+      2) 不存在：插入新消息
+    - 若不包含 links：插入新消息
+    match_urls 用于判重的链接集合（批量写入合并多条记录时传入它们链接的并集），默认取 links
+    返回："updated" 或 "inserted"
+    """
+    row = session.execute(UPSERT_BY_LINKS_SQL, upsert_params(parsed_data, timestamp, match_urls)).one()
+    if commit:
+        session.commit()
+    return report_upsert(row)
+
+
+def upsert_params(parsed_data: dict, timestamp: datetime.datetime, match_urls: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """UPSERT_BY_LINKS_SQL 的参数（同步/异步写入共用）"""
+    urls, providers = link_pairs(parsed_data.get('links'))
+    links = parsed_data.get('links')
+    return {
+        'urls': urls,
+        'match_urls': list(match_urls) if match_urls is not None else urls,
+        'providers': providers,
+        'timestamp': timestamp,
+        'title': parsed_data.get('title'),
+        'description': parsed_data.get('description'),
+        'links': json.dumps(links, ensure_ascii=False) if links is not None else None,
+        'tags': parsed_data.get('tags'),
+        'source': parsed_data.get('source'),
+        'channel': parsed_data.get('channel'),
+        'group_name': parsed_data.get('group_name'),
+        'bot': parsed_data.get('bot'),
+    }
+
+
+def report_upsert(row) -> str:
+    """打印 UPSERT_BY_LINKS_SQL 的结果行，返回 'updated' 或 'inserted'"""
+    if row.op == 'updated':
+        print(f"♻️ 已覆盖更新现有消息(id={row.id})，按链接去重")
+    else:
+        print("✅ 新消息已保存（无重复链接）")
+    return row.op
+
+
+def save_message_links(session: Session, rows: List[Dict[str, Any]]):
+    """批量写入 message_links 行 {url, message_id, provider}，链接已存在则改指向新的消息"""
+    by_url = {r['url']: r for r in rows if r.get('url')}
+    if not by_url:
+        return
+    stmt = pg_insert(MessageLink).values(list(by_url.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MessageLink.url],
+        set_={'message_id': stmt.excluded.message_id, 'provider': stmt.excluded.provider},
+    )
+    session.execute(stmt)
+
+
+def sync_message_links(session: Session, message_id: int, links: Dict[str, str]):
+    """让某条消息在 message_links 中的链接与其 links 字段一致"""
+    urls, providers = link_pairs(links)
+    session.query(MessageLink).filter(
+        MessageLink.message_id == message_id,
+        MessageLink.url.notin_(urls),
+    ).delete(synchronize_session=False)
+    save_message_links(session, [
+        {'url': u, 'message_id': message_id, 'provider': p} for u, p in zip(urls, providers)
+    ])
+
+
+def backfill_message_links(session: Session, only_if_empty: bool = False) -> int:
+    """从 messages.links 回填 message_links，返回新写入的链接数"""
+    if only_if_empty and session.query(MessageLink.id).first() is not None:
+        return 0
+    result = session.execute(BACKFILL_LINKS_SQL)
+    session.commit()
+    return result.rowcount or 0
+
+
+# 全量重新聚合（修复计数偏差）。先以 EXCLUSIVE 锁住 tag_counts（不阻塞读）：已经累加过计数的写入事务提交后才拿到锁，
+# 其消息包含在聚合结果里；之后的写入在触发器累加计数时等待，本事务提交后再累加，不会重复或丢失
+REBUILD_TAG_COUNTS_SQL = [
+    text("LOCK TABLE tag_counts IN EXCLUSIVE MODE"),
+    text("DELETE FROM tag_counts"),
+    text("""
+INSERT INTO tag_counts (tag, count)
+SELECT t, count(*) FROM messages, unnest(messages.tags) AS t
+WHERE t IS NOT NULL
+GROUP BY t
+"""),
+]
+
+
+def rebuild_tag_counts(session: Session) -> int:
+    """在数据库内重新聚合 tag_counts，返回标签数"""
+    for stmt in REBUILD_TAG_COUNTS_SQL:
+        result = session.execute(stmt)
+    session.commit()
+    return result.rowcount or 0
@@ -0,0 +1,139 @@
+"""写入队列：事件处理器只把解析结果放入队列，由单个后台任务批量落库
+
+- 队列有上限，满了 put() 会等待（背压），不会无限堆积内存
+- 写入任务按“条数上限 / 时间窗口”攒批，一批一个事务，经异步数据访问层（async_db）写入，不阻塞 Telethon 事件循环
+- 同一批内链接有重叠的记录合并为最后一条（与逐条覆盖写入的最终结果一致）
+- close() 会把队列中剩余记录全部写完再返回
+"""
+import asyncio
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from async_db import AsyncSessionLocal, upsert_message_by_links
+
+Record = Tuple[dict, datetime.datetime]
+
+
+def coalesce_records(records: List[Record]) -> Tuple[List[Dict[str, Any]], int]:
+    """合并同一批内链接重叠的记录，后到的覆盖先到的
+
+    返回 ([{parsed, timestamp, match_urls}], 被合并掉的条数)；match_urls 为被合并记录链接的并集，
+    保证合并后仍能命中数据库里与任一被合并记录重复的消息。
+    """
+    entries: List[Optional[Dict[str, Any]]] = []
+    owner: Dict[str, int] = {}
+    merged = 0
+    for parsed, ts in records:
+        urls = {u for u in (parsed.get('links') or {}).values() if u}
+        match = set(urls)
+        for u in urls:
+            j = owner.get(u)
+            if j is not None and entries[j] is not None:
+                match |= entries[j]['match_urls']
+                entries[j] = None
+                merged += 1
+        idx = len(entries)
+        entries.append({'parsed': parsed, 'timestamp': ts, 'match_urls': match})
+        for u in match:
+            owner[u] = idx
+    return [e for e in entries if e is not None], merged
+
+
+async def write_batch(records: List[Record]) -> Dict[str, int]:
+    """在一个事务里写入一批记录，返回各类计数"""
+    entries, merged = coalesce_records(records)
+    stats = {'inserted': 0, 'updated': 0, 'merged': merged, 'failed': 0}
+    async with AsyncSessionLocal() as session:
+        try:
+            for e in entries:
+                r = await upsert_message_by_links(session, e['parsed'], e['timestamp'], commit=False, match_urls=e['match_urls'])
+                stats[r] += 1
+            await session.commit()
+            return stats
+        except Exception as ex:
+            await session.rollback()
+            print(f"⚠️ 批量写入失败，改为逐条写入: {ex}")
+    # 整批失败时逐条重试，避免一条坏数据拖垮整批
+    stats = {'inserted': 0, 'updated': 0, 'merged': merged, 'failed': 0}
+    for e in entries:
+        async with AsyncSessionLocal() as session:
+            try:
+                r = await upsert_message_by_links(session, e['parsed'], e['timestamp'], match_urls=e['match_urls'])
+                stats[r] += 1
+            except Exception as ex:
+                await session.rollback()
+                stats['failed'] += 1
+                print(f"❌ 写入失败，已丢弃 | 标题: {e['parsed'].get('title', '')} | {ex}")
+    return stats
+
+
+class MessageWriter:
+    """按批写库的后台写入任务"""
+
+    def __init__(self, batch_size: Optional[int] = None, window_sec: Optional[float] = None, maxsize: Optional[int] = None):
+        self.batch_size = batch_size or settings.WRITE_BATCH_SIZE
+        self.window_sec = window_sec if window_sec is not None else settings.WRITE_BATCH_WINDOW_MS / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize or settings.WRITE_QUEUE_MAXSIZE)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, parsed: dict, timestamp: datetime.datetime):
+        """放入一条待写记录；队列满时等待写入任务腾出空间"""
+        if self._closing:
+            raise RuntimeError("写入队列已关闭")
+        if self.queue.full():
+            print(f"⏳ 写入队列已满（{self.queue.maxsize}），等待落库...")
+        await self.queue.put((parsed, timestamp))
+
+    async def _next_batch(self) -> List[Record]:
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.window_sec
+        while len(batch) < self.batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Record]):
+        try:
+            stats = await write_batch(batch)
+            print(f"💾 批量写入 {len(batch)} 条：新增 {stats['inserted']}，覆盖更新 {stats['updated']}，"
+                  f"批内合并 {stats['merged']}，失败 {stats['failed']}（队列剩余 {self.queue.qsize()}）")
+        except Exception as e:
+            print(f"❌ 批量写入异常: {e}")
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            await self._flush(batch)
+
+    async def close(self):
+        """停止接收新记录，写完队列中剩余的记录"""
+        self._closing = True
+        if self._task is not None:
+            await self.queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 写入任务未启动或已退出时，直接在这里把剩余记录写完
+        rest: List[Record] = []
+        while not self.queue.empty():
+            rest.append(self.queue.get_nowait())
+        for i in range(0, len(rest), self.batch_size):
+            await self._flush(rest[i:i + self.batch_size])
+        print("💾 写入队列已清空")
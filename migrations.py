@@ -0,0 +1,288 @@
+"""版本化的数据库迁移（init_db.py 执行）
+
+- 每个迁移有递增的版本号，已执行的版本记录在 schema_migrations 表，重复运行只执行尚未执行的迁移
+- 普通迁移的全部语句与版本记录在同一个事务里执行，失败则整体回滚
+- 建索引的迁移用 CREATE INDEX CONCURRENTLY（建索引期间不阻塞写入，监控可以照常入库）；
+  这类语句不能放在事务里，以自动提交方式逐条执行，每条都可重复执行，中途失败重跑时从该迁移开头继续；
+  CONCURRENTLY 失败会留下无效（INVALID）索引，重跑前先删掉
+- 多个进程同时执行迁移时用 advisory lock 串行
+- 已发布的迁移不要修改，结构变化一律追加新的迁移
+
+python migrations.py           建表（model.create_tables）并执行尚未执行的迁移
+python migrations.py --status  查看各迁移的执行情况
+"""
+import datetime
+import sys
+from typing import Any, Dict, List, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from model import create_tables, engine
+
+# 串行执行迁移的 advisory lock 键
+MIGRATION_LOCK_KEY = 7262001
+# 改列类型等需要排它锁的语句最多等待多久（等不到锁就失败，重跑即可，不会长时间挡住写入）
+LOCK_TIMEOUT = '30s'
+
+_CREATE_VERSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version integer PRIMARY KEY,
+    name varchar NOT NULL,
+    applied_at timestamp NOT NULL
+)
+"""
+
+# 迁移中的一步：SQL 语句，或 concurrent_index() 生成的建索引步骤
+Step = Union[str, Dict[str, str]]
+
+
+def concurrent_index(name: str, definition: str) -> Dict[str, str]:
+    """不阻塞写入的建索引步骤；definition 为 ON 之后的部分"""
+    return {'index': name, 'sql': f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"}
+
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "channels 新增列（频道实体登记 / 账号分片 / 加入状态）", [
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS tg_id BIGINT",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS access_hash BIGINT",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS title VARCHAR",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS resolved_at TIMESTAMP",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS resolve_error VARCHAR",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS account VARCHAR",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS join_status VARCHAR",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS join_attempt_at TIMESTAMP",
+        "ALTER TABLE channels ADD COLUMN IF NOT EXISTS join_error VARCHAR",
+    ]),
+    (2, "前台搜索分词函数、标签计数触发器", [
+        # 标题/描述/频道/来源 -> 小写二元组数组（跳过含空白的二元组，重复的由 GIN 去重）
+        r"""
+CREATE OR REPLACE FUNCTION tg_search_tokens(VARIADIC parts text[]) RETURNS text[]
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    t text := translate(lower(array_to_string(parts, ' ')), E'\t\n\r\f\x0b' || chr(12288) || chr(160), '       ');
+    tokens text[] := '{}';
+    tok text;
+BEGIN
+    FOR i IN 1 .. char_length(t) - 1 LOOP
+        tok := substr(t, i, 2);
+        IF strpos(tok, ' ') = 0 THEN
+            tokens := tokens || tok;
+        END IF;
+    END LOOP;
+    RETURN tokens;
+END
+$$
+""",
+        # 触发器写入 tag_counts：不依赖调用方先执行 create_tables()，否则建好触发器后 messages 的每次写入都会失败
+        "CREATE TABLE IF NOT EXISTS tag_counts (tag varchar PRIMARY KEY, count bigint NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_tag_counts_count ON tag_counts (count)",
+        # 语句级触发器：按本条语句插入/覆盖/删除的行算出各标签增减量，按标签顺序累加到 tag_counts
+        """
+CREATE OR REPLACE FUNCTION tag_counts_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    delta_tags varchar[];
+    delta_counts bigint[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(t ORDER BY t), array_agg(n ORDER BY t) INTO delta_tags, delta_counts
+        FROM (SELECT t, count(*) AS n FROM new_rows, unnest(new_rows.tags) AS t GROUP BY t) AS d;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(t ORDER BY t), array_agg(n ORDER BY t) INTO delta_tags, delta_counts
+        FROM (
+            SELECT t, sum(n) AS n FROM (
+                SELECT unnest(new_rows.tags) AS t, 1 AS n FROM new_rows
+                UNION ALL
+                SELECT unnest(old_rows.tags), -1 FROM old_rows
+            ) AS u
+            GROUP BY t
+            HAVING sum(n) <> 0
+        ) AS d;
+    ELSE
+        SELECT array_agg(t ORDER BY t), array_agg(n ORDER BY t) INTO delta_tags, delta_counts
+        FROM (SELECT t, -count(*) AS n FROM old_rows, unnest(old_rows.tags) AS t GROUP BY t) AS d;
+    END IF;
+    IF delta_tags IS NULL THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO tag_counts AS c (tag, count)
+    SELECT d.tag, d.n FROM unnest(delta_tags, delta_counts) AS d(tag, n)
+    WHERE d.tag IS NOT NULL
+    ORDER BY d.tag
+    ON CONFLICT (tag) DO UPDATE SET count = c.count + EXCLUDED.count;
+    DELETE FROM tag_counts WHERE count <= 0 AND tag = ANY(delta_tags);
+    RETURN NULL;
+END
+$$
+""",
+        "DROP TRIGGER IF EXISTS tag_counts_insert ON messages",
+        "CREATE TRIGGER tag_counts_insert AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION tag_counts_sync()",
+        "DROP TRIGGER IF EXISTS tag_counts_update ON messages",
+        "CREATE TRIGGER tag_counts_update AFTER UPDATE ON messages REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION tag_counts_sync()",
+        "DROP TRIGGER IF EXISTS tag_counts_delete ON messages",
+        "CREATE TRIGGER tag_counts_delete AFTER DELETE ON messages REFERENCING OLD TABLE AS old_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION tag_counts_sync()",
+        # 在同一事务里按已有消息聚合初始计数：CREATE TRIGGER 持有的 messages 锁到提交才释放，
+        # 期间的写入等到提交后由触发器累加，不会漏计或重复计数（后续迁移执行期间写入的消息也已由触发器计入）
+        "DELETE FROM tag_counts",
+        """
+INSERT INTO tag_counts (tag, count)
+SELECT t, count(*) FROM messages, unnest(messages.tags) AS t
+WHERE t IS NOT NULL
+GROUP BY t
+""",
+    ]),
+    (3, "messages.links 改为 JSONB", [
+        # links 的键（网盘类型）数组，网盘筛选的 GIN 索引建在它上面（索引在下一个迁移里重建）
+        """
+CREATE OR REPLACE FUNCTION tg_link_providers(links jsonb) RETURNS varchar[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+SELECT CASE WHEN jsonb_typeof(links) = 'object' THEN ARRAY(SELECT jsonb_object_keys(links))::varchar[] ELSE '{}' END
+$$
+""",
+        f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'",
+        # 重写整张表（期间持有排它锁）；已是 JSONB 时不做任何事。
+        # 改类型会连带重建表上全部索引，先删掉建得慢的 GIN 索引，由下一个迁移以 CONCURRENTLY 重建
+        """
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'messages' AND column_name = 'links') = 'json' THEN
+        DROP INDEX IF EXISTS ix_messages_providers;
+        DROP INDEX IF EXISTS ix_messages_search;
+        DROP INDEX IF EXISTS ix_messages_tags;
+        ALTER TABLE messages ALTER COLUMN links TYPE jsonb USING links::jsonb;
+    END IF;
+END
+$$
+""",
+        "DROP FUNCTION IF EXISTS tg_link_providers(json)",
+    ]),
+    (4, "messages 索引：时间倒序分页 / 频道 / created_at(BRIN) / 搜索 / 网盘类型 / 标签", [
+        concurrent_index("ix_messages_timestamp_id", "messages (timestamp DESC, id DESC)"),
+        concurrent_index("ix_messages_channel", "messages (channel)"),
+        concurrent_index("ix_messages_created_at_brin", "messages USING brin (created_at)"),
+        concurrent_index("ix_messages_search", "messages USING gin (tg_search_tokens(title, description, channel, source))"),
+        concurrent_index("ix_messages_providers", "messages USING gin (tg_link_providers(links))"),
+        concurrent_index("ix_messages_tags", "messages USING gin (tags)"),
+        # 表达式索引需要统计信息，计划器才能估算筛选行数
+        "ANALYZE messages",
+    ]),
+    (5, "messages 变更计数（删除 / 旧时间戳覆盖也能让前台缓存失效）", [
+        "CREATE TABLE IF NOT EXISTS messages_version (id integer PRIMARY KEY, version bigint NOT NULL)",
+        "INSERT INTO messages_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+        # 语句级触发器：本条语句实际改动了行才加一（没删到行的规则清理不会让各页面的缓存失效）。
+        # 计数行的行锁持有到事务提交，写入 messages 的事务因此依次提交（与 tag_counts 的标签行锁相同）
+        """
+CREATE OR REPLACE FUNCTION messages_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM 1 FROM new_rows LIMIT 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM 1 FROM old_rows LIMIT 1;
+    END IF;
+    IF FOUND OR TG_OP = 'TRUNCATE' THEN
+        UPDATE messages_version SET version = version + 1 WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END
+$$
+""",
+        "DROP TRIGGER IF EXISTS messages_version_insert ON messages",
+        "CREATE TRIGGER messages_version_insert AFTER INSERT ON messages REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION messages_version_bump()",
+        "DROP TRIGGER IF EXISTS messages_version_update ON messages",
+        "CREATE TRIGGER messages_version_update AFTER UPDATE ON messages REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION messages_version_bump()",
+        "DROP TRIGGER IF EXISTS messages_version_delete ON messages",
+        "CREATE TRIGGER messages_version_delete AFTER DELETE ON messages REFERENCING OLD TABLE AS old_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION messages_version_bump()",
+        "DROP TRIGGER IF EXISTS messages_version_truncate ON messages",
+        "CREATE TRIGGER messages_version_truncate AFTER TRUNCATE ON messages "
+        "FOR EACH STATEMENT EXECUTE FUNCTION messages_version_bump()",
+    ]),
+]
+
+
+def _applied(conn: Connection) -> Dict[int, Any]:
+    return {v: at for v, at in conn.execute(text("SELECT version, applied_at FROM schema_migrations"))}
+
+
+def _record(conn: Connection, version: int, name: str):
+    conn.execute(text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :at)"),
+                 {'v': version, 'n': name, 'at': datetime.datetime.utcnow()})
+
+
+def _drop_invalid_index(conn: Connection, name: str):
+    invalid = conn.execute(text("""
+SELECT 1 FROM pg_index AS i JOIN pg_class AS c ON c.oid = i.indexrelid
+WHERE c.relname = :name AND c.relnamespace = current_schema()::regnamespace AND NOT i.indisvalid
+"""), {'name': name}).first()
+    if invalid:
+        print(f"  · 删除上次未建完的无效索引 {name}")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def _is_concurrent(steps: List[Step]) -> bool:
+    return any(isinstance(step, dict) for step in steps)
+
+
+def _apply(version: int, name: str, steps: List[Step]):
+    if not _is_concurrent(steps):
+        with engine.begin() as conn:
+            for step in steps:
+                conn.execute(text(step))
+            _record(conn, version, name)
+        return
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        for step in steps:
+            if isinstance(step, dict):
+                _drop_invalid_index(conn, step['index'])
+                print(f"  · 建索引 {step['index']}（CONCURRENTLY，不阻塞写入）")
+                conn.execute(text(step['sql']))
+            else:
+                conn.execute(text(step))
+        _record(conn, version, name)
+
+
+def run_migrations() -> int:
+    """执行尚未执行的迁移，返回本次执行的个数"""
+    with engine.connect() as lock_conn:
+        lock_conn = lock_conn.execution_options(isolation_level='AUTOCOMMIT')
+        lock_conn.execute(text(_CREATE_VERSIONS_SQL))
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {'k': MIGRATION_LOCK_KEY})
+        try:
+            applied = _applied(lock_conn)
+            count = 0
+            for version, name, steps in MIGRATIONS:
+                if version in applied:
+                    continue
+                print(f"🛠️ 执行迁移 {version}：{name}")
+                _apply(version, name, steps)
+                count += 1
+            return count
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': MIGRATION_LOCK_KEY})
+
+
+def main():
+    if '--status' in sys.argv:
+        with engine.begin() as conn:
+            conn.execute(text(_CREATE_VERSIONS_SQL))
+            applied = _applied(conn)
+        for version, name, _ in MIGRATIONS:
+            state = f"已执行（{applied[version]:%Y-%m-%d %H:%M:%S}）" if version in applied else "未执行"
+            print(f"{version:>3}  {state:<24} {name}")
+        return
+    create_tables()
+    count = run_migrations()
+    print(f"✅ 迁移完成（本次执行 {count} 个）" if count else "✅ 数据库结构已是最新")
+
+
+if __name__ == '__main__':
+    main()
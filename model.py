@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ARRAY, create_engine, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, ARRAY, create_engine, Boolean, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 from config import settings
@@ -12,7 +13,7 @@ class Message(Base):
     timestamp = Column(DateTime, nullable=False)
     title = Column(String)
     description = Column(String)
-    links = Column(JSON)  # 存储各种网盘链接
+    links = Column(JSONB)  # 存储各种网盘链接 {网盘类型: url}
     tags = Column(ARRAY(String))  # 标签数组
     source = Column(String)  # 来源
     channel = Column(String)  # 频道
@@ -20,6 +21,35 @@ class Message(Base):
     bot = Column(String)  # 机器人
     created_at = Column(DateTime, default=datetime.utcnow)
 
+# 链接 -> 消息 的归一化索引：每个网盘链接唯一，按链接去重写入时走唯一索引而不是扫描 messages.links
+class MessageLink(Base):
+    __tablename__ = "message_links"
+    __table_args__ = (
+        Index("ux_message_links_url", "url", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, nullable=False)
+    message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True)
+    provider = Column(String)  # 网盘类型（即 messages.links 中的键）
+
+# 标签计数（前台标签云）：由 messages 上的触发器增量维护，见 migrations.py
+class TagCount(Base):
+    __tablename__ = "tag_counts"
+    __table_args__ = (
+        Index("ix_tag_counts_count", "count"),
+    )
+
+    tag = Column(String, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+
+# messages 的变更计数（只有 id=1 一行）：插入/覆盖/删除时由触发器加一，前台据此判断结果缓存是否过时，见 migrations.py
+class MessagesVersion(Base):
+    __tablename__ = "messages_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
 class Credential(Base):
     __tablename__ = "credentials"
     id = Column(Integer, primary_key=True, index=True)
@@ -30,6 +60,25 @@ class Channel(Base):
     __tablename__ = "channels"
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, nullable=False)
+    # 频道实体登记：解析一次后持久化，monitor 启动/重绑时直接构造 InputPeer，无需再请求 Telegram
+    tg_id = Column(BigInteger, nullable=True)  # Telegram 频道ID（未解析或解析失败为空）
+    access_hash = Column(BigInteger, nullable=True)
+    title = Column(String, nullable=True)  # 频道名称
+    resolved_at = Column(DateTime, nullable=True)  # 最近一次解析时间（成功或失败）
+    resolve_error = Column(String, nullable=True)  # 最近一次解析失败原因，成功为空
+    account = Column(String, nullable=True)  # 负责该频道的监控账号（access_hash 与加入状态都属于该账号）
+    # 加入状态：joined 已加入 / private 私有需邀请 / invalid 用户名无效 / failed 加入失败（到期重试）；空表示未尝试
+    join_status = Column(String, nullable=True)
+    join_attempt_at = Column(DateTime, nullable=True)  # 最近一次尝试加入的时间
+    join_error = Column(String, nullable=True)
+
+# 回溯进度：每个频道已回溯到的最大消息ID（高水位），重跑时从 min_id 继续
+class BackfillCheckpoint(Base):
+    __tablename__ = "backfill_checkpoints"
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String, nullable=False, unique=True)
+    last_message_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class TelegramConfig(Base):
     __tablename__ = "telegram_config"
@@ -67,7 +116,7 @@ DATABASE_URL = settings.DATABASE_URL
 # 创建数据库引擎
 engine = create_engine(DATABASE_URL)
 
-# 创建所有表
+# 创建所有表（已有表的结构变化、索引、函数与触发器见 migrations.py，由 init_db.py 执行）
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
@@ -1,12 +1,15 @@
-from telethon import TelegramClient, events
-from telethon.sessions import StringSession
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, cast, String
-from model import Message, engine, Channel, Credential, TelegramConfig, ChannelRule, create_tables
+from model import Message, engine, create_tables
+from parse_pool import ParseBatcher, close_parse_pool
+from message_writer import MessageWriter
+import async_db
+from channel_registry import ChannelRegistry
+from accounts import AccountPool
+from backfill import run_backfill
+from change_feed import ChangeFeed, KINDS
 import datetime
 from datetime import timezone, timedelta
 import json
-import re
 import sys
 import os
 from config import settings
@@ -27,89 +30,18 @@ def to_beijing_time(dt):
         dt = dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(BEIJING_TZ).replace(tzinfo=None)
 
-def get_api_credentials():
-    """获取 API 凭据，优先使用数据库中的凭据"""
-    with Session(engine) as session:
-        # 尝试从数据库获取凭据
-        cred = session.query(Credential).first()
-        if cred:
-            return int(cred.api_id), cred.api_hash
-    # 如果数据库中没有凭据，使用 .env 中的配置
-    return settings.TELEGRAM_API_ID, settings.TELEGRAM_API_HASH
+# 频道实体登记：频道ID / access_hash 持久化在 channels 表，重绑时无需逐个解析
+channel_registry = ChannelRegistry()
 
-def get_channels():
-    """获取频道列表，合并数据库和 .env 中的频道"""
-    channels = set()
-    
-    # 从数据库获取频道
-    with Session(engine) as session:
-        db_channels = [c.username for c in session.query(Channel).all()]
-        channels.update(db_channels)
-    
-    # 从 .env 获取默认频道
-    if hasattr(settings, 'DEFAULT_CHANNELS'):
-        env_channels = [c.strip() for c in settings.DEFAULT_CHANNELS.split(',') if c.strip()]
-        channels.update(env_channels)
-        
-        # 将 .env 中的频道添加到数据库
-        with Session(engine) as session:
-            for username in env_channels:
-                if username not in db_channels:
-                    channel = Channel(username=username)
-                    session.add(channel)
-            session.commit()
-    
-    return list(channels)
-
-def get_string_session():
-    """从数据库获取StringSession配置"""
-    try:
-        with Session(engine) as session:
-            config = session.query(TelegramConfig).first()
-            if config and config.string_session:
-                return config.string_session.strip()
-    except Exception as e:
-        print(f"⚠️ 读取StringSession配置失败: {e}")
-    return None
-
-# Telegram API 凭证
-# 使用数据库或.env中的API配置
-api_id, api_hash = get_api_credentials()
-
-# 优先使用.env中的StringSession，其次使用数据库中的StringSession，最后才使用session文件
-from config import settings
-# 优先从数据库读取 StringSession，其次才回退到 .env
-db_string = get_string_session()
-env_string = (settings.STRING_SESSION.strip() if hasattr(settings, 'STRING_SESSION') and settings.STRING_SESSION else None)
-string_session = db_string or env_string
-
-# 创建客户端（如果有StringSession则使用，否则使用session文件）
-if string_session:
-    client = TelegramClient(StringSession(string_session), api_id, api_hash)
-    print(f"🔑 使用{'数据库中的StringSession' if db_string else '.env中的StringSession'}进行身份验证")
-else:
-    client = TelegramClient('monitor_session', api_id, api_hash)
-    print("📁 使用session文件进行身份验证")
-
-# 获取频道列表
-channel_usernames = get_channels()
-
-# 规则缓存：{channel: {exclude_netdisks:set, exclude_keywords:[lower], exclude_tags:set}}
-RULES_CACHE = {}
+# 写入队列：on_new_message 只负责入队，落库由后台写入任务批量完成
+message_writer = MessageWriter()
+# 解析合并：同一轮事件循环里到达的新消息一起解析
+parse_batcher = ParseBatcher()
 
 # —— 无重启控制：通过控制文件动态暂停/恢复 ——
 IS_PAUSED = False
 CONTROL_FILE = "monitor_control.json"
 
-# 新增：自动加入频道所需的导入
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.errors import (
-    FloodWaitError,
-    UsernameInvalidError,
-    UsernameNotOccupiedError,
-    ChannelPrivateError,
-    UserAlreadyParticipantError,
-)
 import asyncio as _asyncio
 
 
@@ -129,241 +61,23 @@ def load_control_state():
         IS_PAUSED = paused
         print("⏸ 已暂停监控（无重启）" if IS_PAUSED else "▶️ 已恢复监控（无重启）")
 
-def load_rules_cache():
-    global RULES_CACHE
-    try:
-        with Session(engine) as session:
-            rules = session.query(ChannelRule).filter_by(enabled=True).all()
-            RULES_CACHE = {
-                r.channel: {
-                    'exclude_netdisks': set((r.exclude_netdisks or [])),
-                    'exclude_keywords': [kw.lower() for kw in (r.exclude_keywords or []) if kw],
-                    'exclude_tags': set((r.exclude_tags or [])),
-                }
-                for r in rules
-            }
-            print(f"⚙️ 已加载规则 {len(RULES_CACHE)} 条")
-    except Exception as e:
-        print(f"⚠️ 加载规则失败: {e}")
-
 async def get_channel_username(event) -> str:
+    # 已登记频道直接按 chat_id 查字典；只有未登记的会话才回退到 get_chat()，结果记入字典
+    uname = channel_registry.username_for(getattr(event, 'chat_id', None))
+    if uname:
+        return uname
     try:
         chat = await event.get_chat()
         uname = getattr(chat, 'username', None)
         if uname:
+            channel_registry.remember(event.chat_id, uname)
             return uname
     except Exception:
         pass
     return ''
 
-def should_drop_by_rules(channel: str, parsed: dict) -> bool:
-    if not channel:
-        return False
-    rule = RULES_CACHE.get(channel)
-    if not rule:
-        return False
-    # 1) 网盘类型命中
-    links = parsed.get('links') or {}
-    if links and rule['exclude_netdisks'] and (set(links.keys()) & rule['exclude_netdisks']):
-        return True
-    # 2) 关键词命中（标题/描述）
-    kws = rule['exclude_keywords']
-    if kws:
-        title = (parsed.get('title') or '').lower()
-        desc = (parsed.get('description') or '').lower()
-        for kw in kws:
-            if kw and (kw in title or kw in desc):
-                return True
-    # 3) 标签命中
-    tags = set(parsed.get('tags') or [])
-    if tags and rule['exclude_tags'] and (tags & rule['exclude_tags']):
-        return True
-    return False
-
-def parse_message(text):
-    """解析消息内容，提取标题、描述、链接等信息（更健壮，支持一行多网盘名链接提取和全局标签提取）"""
-    lines = text.split('\n')
-    title = ''
-    description = ''
-    links = {}
-    tags = []
-    source = ''
-    channel = ''
-    group = ''
-    bot = ''
-    current_section = None
-    desc_lines = []
-
-    # 网盘关键字与显示名映射
-    netdisk_map = [
-        (['quark', '夸克'], '夸克网盘'),
-        (['aliyundrive', 'aliyun', '阿里', 'alipan'], '阿里云盘'),
-        (['baidu', 'pan.baidu'], '百度网盘'),
-        (['115.com', '115网盘', '115pan'], '115网盘'),
-        (['cloud.189', '天翼', '189.cn'], '天翼云盘'),
-        (['123pan', '123.yun'], '123云盘'),
-        (['ucdisk', 'uc网盘', 'ucloud', 'drive.uc.cn'], 'UC网盘'),
-        (['xunlei', 'thunder', '迅雷'], '迅雷'),
-    ]
-
-    # 1. 标题提取：优先"名称："，否则第一行直接当title
-    if lines and lines[0].strip():
-        if lines[0].startswith('名称：'):
-            title = lines[0].replace('名称：', '').strip()
-        else:
-            title = lines[0].strip()
-
-    # 2. 遍历其余行，提取描述、链接、标签等
-    for idx, line in enumerate(lines[1:] if title else lines):
-        line = line.strip()
-        if not line:
-            continue
-        # 兼容多种标签前缀
-        if line.startswith('🏷 标签：') or line.startswith('标签：'):
-            tags.extend([tag.strip('#') for tag in line.replace('🏷 标签：', '').replace('标签：', '').split() if tag.strip('#')])
-            continue
-        if line.startswith('描述：'):
-            current_section = 'description'
-            desc_lines.append(line.replace('描述：', '').strip())
-        elif line.startswith('链接：'):
-            current_section = 'links'
-            url = line.replace('链接：', '').strip()
-            if not url:
-                continue  # 跳过空链接
-            # 智能识别网盘名
-            found = False
-            for keys, name in netdisk_map:
-                if any(k in url.lower() for k in keys):
-                    links[name] = url
-                    found = True
-                    break
-            if not found:
-                links['其他'] = url
-        elif line.startswith('🎉 来自：'):
-            source = line.replace('🎉 来自：', '').strip()
-        elif line.startswith('📢 频道：'):
-            channel = line.replace('📢 频道：', '').strip()
-        elif line.startswith('👥 群组：'):
-            group = line.replace('👥 群组：', '').strip()
-        elif line.startswith('🤖 投稿：'):
-            bot = line.replace('🤖 投稿：', '').strip()
-        elif current_section == 'description':
-            desc_lines.append(line)
-        else:
-            desc_lines.append(line)
-
-    # 3. 全局正则提取所有"网盘名：链接"对，并从描述中移除
-    desc_text = '\n'.join(desc_lines)
-    # 支持"网盘名：链接"对，允许多个，支持中文冒号和英文冒号
-    pattern = re.compile(r'([\u4e00-\u9fa5A-Za-z0-9#]+)[：:](https?://[^\s]+)')
-    matches = pattern.findall(desc_text)
-    for key, url in matches:
-        # 智能识别网盘名
-        found = False
-        for keys, name in netdisk_map:
-            if any(k in url.lower() or k in key for k in keys):
-                links[name] = url
-                found = True
-                break
-        if not found:
-            links[key.strip()] = url
-    # 从描述中移除所有"网盘名：链接"对
-    desc_text = pattern.sub('', desc_text)
-    # 4. 额外全局提取裸链接（http/https），也归类到links
-    url_pattern = re.compile(r'(https?://[^\s]+)')
-    for url in url_pattern.findall(desc_text):
-        found = False
-        for keys, name in netdisk_map:
-            if any(k in url.lower() for k in keys):
-                links[name] = url
-                found = True
-                break
-        if not found:
-            links['其他'] = url
-    # 从描述中移除裸链接
-    desc_text = url_pattern.sub('', desc_text)
-    # 5. 全局正则提取所有#标签，并从描述中移除
-    tag_pattern = re.compile(r'#([\u4e00-\u9fa5A-Za-z0-9_]+)')
-    found_tags = tag_pattern.findall(desc_text)
-    if found_tags:
-        tags.extend(found_tags)
-        desc_text = tag_pattern.sub('', desc_text)
-    # 去重
-    tags = list(set(tags))
-    # 移除所有网盘名关键词
-    netdisk_names = ['夸克', '迅雷', '百度', 'UC', '阿里', '天翼', '115', '123云盘']
-    netdisk_name_pattern = re.compile(r'(' + '|'.join(netdisk_names) + r')')
-    desc_text = netdisk_name_pattern.sub('', desc_text)
-    # 6. 最终description，去除无意义符号行
-    desc_lines_final = [line for line in desc_text.strip().split('\n') if line.strip() and not re.fullmatch(r'[.。·、,，-]+', line.strip())]
-    description = '\n'.join(desc_lines_final)
-
-    return {
-        'title': title,
-        'description': description,
-        'links': links,
-        'tags': tags,
-        'source': source,
-        'channel': channel,
-        'group_name': group,
-        'bot': bot
-    }
-
 # 动态绑定：替换静态装饰器，函数改名为 on_new_message
 # @client.on(events.NewMessage(chats=channel_usernames))
-def upsert_message_by_links(session: Session, parsed_data: dict, timestamp: datetime.datetime):
-    """基于链接去重的写入逻辑：
-    - 若 parsed_data 中包含 links，则以链接为唯一键：
-      1) 数据库中存在任意相同链接：覆盖并更新该条消息
-      2) 不存在：插入新消息
-    - 若不包含 links：沿用原有逻辑（插入新消息）
-    返回："updated" 或 "inserted"
-    """
-    links = parsed_data.get('links') or {}
-    urls = set(links.values()) if links else set()
-
-    # 只在存在链接时执行覆盖更新逻辑
-    if urls:
-        # 先在数据库层用 LIKE 限定候选集，再在 Python 层精确比对，避免误伤
-        like_filters = [cast(Message.links, String).like(f"%{u}%") for u in urls]
-        candidates = session.query(Message).filter(
-            Message.links.isnot(None),
-            or_(*like_filters)
-        ).order_by(Message.timestamp.desc()).all()
-
-        target = None
-        for msg in candidates:
-            try:
-                msg_links = (msg.links or {}).values()
-                # 精确匹配：完全相同的链接才算同一条
-                if any(u == v for u in urls for v in msg_links):
-                    target = msg
-                    break
-            except Exception:
-                continue
-
-        if target:
-            # 覆盖更新该条消息
-            target.timestamp = timestamp
-            target.title = parsed_data.get('title')
-            target.description = parsed_data.get('description')
-            target.links = parsed_data.get('links')
-            target.tags = parsed_data.get('tags')
-            target.source = parsed_data.get('source')
-            target.channel = parsed_data.get('channel')
-            target.group_name = parsed_data.get('group_name')
-            target.bot = parsed_data.get('bot')
-            session.commit()
-            print(f"♻️ 已覆盖更新现有消息(id={target.id})，按链接去重")
-            return "updated"
-
-    # 无链接或未命中：插入新消息
-    new_message = Message(timestamp=timestamp, created_at=timestamp, **parsed_data)
-    session.add(new_message)
-    session.commit()
-    print("✅ 新消息已保存（无重复链接）")
-    return "inserted"
-
 async def on_new_message(event):
     # 无重启暂停：如被暂停则直接忽略消息
     if IS_PAUSED:
@@ -398,149 +112,150 @@ async def on_new_message(event):
     # 在处理新消息处，统一使用UTC时间
     timestamp = get_beijing_time()
     
-    # 解析消息
-    parsed_data = parse_message(message)
+    # 识别频道用户名（优先用事件实体）
+    ch_username = await get_channel_username(event)
+
+    # 解析并按规则过滤：同一时刻到达的消息合并成一批，突发时交给多进程解析池（见 parse_pool.py）
+    status, parsed_data = await parse_batcher.parse(message, ch_username)
 
     # 若解析后无标题、无描述、无链接、无标签，则忽略
-    if not any([parsed_data.get('title'), parsed_data.get('description'), parsed_data.get('links'), parsed_data.get('tags')]):
+    if status == 'empty':
         print("🧹 已忽略无有效内容的消息（不入库）")
         return
 
-    # 识别频道用户名（优先用事件实体）
-    ch_username = await get_channel_username(event)
-    if ch_username:
-        parsed_data['channel'] = ch_username
-
     # 规则判断：命中则丢弃不入库
-    if should_drop_by_rules(parsed_data.get('channel', ''), parsed_data):
+    if status == 'dropped':
         print(f"🚫 按规则忽略消息 @ {parsed_data.get('channel','')} | 标题: {parsed_data.get('title','')}")
         return
     
-    # 基于链接唯一性的写入
-    with Session(engine) as session:
-        result = upsert_message_by_links(session, parsed_data, timestamp)
-    
-    print(f"[{timestamp}] 消息已写入数据库（{'覆盖更新' if result=='updated' else '新增'}）")
+    # 放入写入队列，由后台写入任务按批、按链接唯一性落库（不在事件循环里同步提交）
+    await message_writer.put(parsed_data, timestamp)
+    print(f"[{timestamp}] 消息已加入写入队列（待写 {message_writer.queue.qsize()} 条）")
+
+# 监控账号：频道按一致性哈希分给各账号，所有账号共用 on_new_message 与写入队列
+account_pool = AccountPool(channel_registry, on_new_message)
 
 # 动态事件绑定所需的全局变量与方法
-current_event_builder = None
 current_channels = []
 
-async def bind_channels():
-    """根据数据库与.env动态更新监听频道集合，并重绑事件处理器"""
-    global current_event_builder, current_channels
+async def bind_channels(force: bool = False):
+    """根据数据库与.env动态更新监听频道集合，按账号分配后重绑事件处理器；force 表示账号有变化，必须重新分配"""
     try:
-        new_channels = get_channels()
+        new_channels = await async_db.get_channels()
     except Exception as e:
         print(f"⚠️ 获取频道列表失败: {e}")
         return
-    # 若频道无变化则跳过
-    if set(new_channels) == set(current_channels):
+    if not account_pool.accounts:
+        print("⚠️ 没有可用的监控账号，暂不绑定频道")
+        return
+    assignment = account_pool.assign(new_channels)
+    # 加入失败到期重试的频道重新排队
+    for key, chans in assignment.items():
+        account_pool.accounts[key].joiner.submit(chans)
+    # 若频道与账号都无变化、且没有到期需要重试解析的频道则跳过
+    if (not force and set(new_channels) == set(current_channels)
+            and not any(channel_registry.pending(chans, key) for key, chans in assignment.items())):
         return
 
-    # 在绑定事件前，尝试自动加入公开频道（若已加入会抛出 UserAlreadyParticipantError，直接忽略）
-    async def _ensure_join_all(chs):
-        for uname in chs:
-            u = (uname or '').lstrip('@').strip()
-            if not u:
-                continue
-            try:
-                entity = await client.get_entity(u)
-                try:
-                    await client(JoinChannelRequest(entity))
-                    print(f"📥 已尝试加入频道 @{u}")
-                except UserAlreadyParticipantError:
-                    # 已经在频道中，忽略
-                    pass
-                except ChannelPrivateError:
-                    print(f"🚫 无法加入私有频道 @{u}（需要邀请链接）")
-                except FloodWaitError as fe:
-                    wait_s = getattr(fe, 'seconds', 5)
-                    print(f"⏳ 频率限制，等待 {wait_s}s 后继续加入 @{u}")
-                    await _asyncio.sleep(wait_s + 1)
-                except Exception as e:
-                    print(f"⚠️ 加入频道 @{u} 失败: {e}")
-            except (UsernameInvalidError, UsernameNotOccupiedError):
-                print(f"❓ 无效或不存在的频道用户名: @{u}")
-            except Exception as e:
-                print(f"⚠️ 解析频道实体失败 @{u}: {e}")
-
+    # 只解析从未解析过 / 换了账号 / 解析失败到期重试的频道，其余直接用登记的实体；各账号并行解析
     try:
-        await _ensure_join_all(new_channels)
+        await channel_registry.load()
+        await _asyncio.gather(*(
+            channel_registry.resolve_pending(account_pool.accounts[key].client, chans, key)
+            for key, chans in assignment.items() if chans
+        ))
     except Exception as e:
-        print(f"⚠️ 自动加入频道过程中发生错误: {e}")
-
-    # 先移除旧事件绑定
-    if current_event_builder is not None:
-        try:
-            client.remove_event_handler(on_new_message, current_event_builder)
-        except Exception as e:
-            print(f"⚠️ 移除旧事件处理器失败: {e}")
-    # 绑定新事件
-    from telethon import events as _events
-    ev = _events.NewMessage(chats=new_channels) if new_channels else _events.NewMessage()
-    client.add_event_handler(on_new_message, ev)
-    current_event_builder = ev
+        print(f"⚠️ 解析频道实体过程中发生错误: {e}")
+
+    for key, chans in assignment.items():
+        account = account_pool.accounts[key]
+        peers, unresolved = channel_registry.input_peers(chans, key)
+        if unresolved:
+            print(f"⚠️ 账号 {account.label} 以下频道尚未解析成功，暂不监听（{channel_registry.retry_sec}s 后重试）：{unresolved}")
+        # 新增或加入失败到期的频道交给该账号的后台加入任务（不等待加入完成，不阻塞绑定与消息处理）
+        account.joiner.submit(chans)
+        # 用登记的 InputPeerChannel 绑定，Telethon 无需再按用户名解析；没有配置频道时由主账号监听全部会话
+        if new_channels:
+            account_pool.bind(account, peers)
+        elif account is account_pool.primary:
+            account_pool.bind(account, None)
+        else:
+            account_pool.bind(account, [])
+        account.channels = chans
     current_channels[:] = list(new_channels)
     print(f"🎯 更新监听频道为 {len(new_channels)} 个：{new_channels}")
+    if len(account_pool.accounts) > 1:
+        for account in account_pool.accounts.values():
+            print(f"   · 账号 {account.label}: {len(account.channels)} 个频道")
 
-# 周期刷新监听列表
+# 事件驱动刷新监听列表/规则/暂停状态
 import asyncio as _asyncio
-async def channels_watcher(poll_sec: int = 1):
-    FLAG_CH = "channels_refresh.flag"
-    FLAG_RULES = "rules_refresh.flag"
+FLAG_CH = "channels_refresh.flag"
+FLAG_RULES = "rules_refresh.flag"
+
+def _take_flag(path: str) -> bool:
+    """兼容旧版后台的刷新标记文件：存在则删除并返回 True"""
+    if not os.path.exists(path):
+        return False
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+    return True
+
+async def channels_watcher(feed: ChangeFeed):
+    """收到后台的 NOTIFY 立即刷新对应内容；兜底轮询时全量刷新"""
     while True:
         try:
+            kinds = await feed.wait()
+            # 兜底轮询时顺带检查旧版刷新标记文件
+            if len(kinds) == len(KINDS):
+                if _take_flag(FLAG_CH):
+                    print("🔄 收到后台刷新信号，已立即更新监听频道")
+                if _take_flag(FLAG_RULES):
+                    print("🔄 收到规则刷新信号，已立即更新过滤规则")
             # 动态读取控制文件（暂停/恢复）
-            load_control_state()
-            # 频道刷新
-            if os.path.exists(FLAG_CH):
-                await bind_channels()
-                try:
-                    os.remove(FLAG_CH)
-                except Exception:
-                    pass
-                print("🔄 收到后台刷新信号，已立即更新监听频道")
-            else:
-                await bind_channels()
+            if 'control' in kinds:
+                load_control_state()
+            # 账号增减：重新分配全部频道
+            accounts_changed = 'accounts' in kinds and await account_pool.refresh()
+            # 频道刷新（无变化时 bind_channels 直接返回）
+            if 'channels' in kinds or accounts_changed:
+                await bind_channels(force=accounts_changed)
             # 规则刷新
-            if os.path.exists(FLAG_RULES):
-                load_rules_cache()
-                try:
-                    os.remove(FLAG_RULES)
-                except Exception:
-                    pass
-                print("🔄 收到规则刷新信号，已立即更新过滤规则")
+            if 'rules' in kinds:
+                await async_db.load_rules_cache()
+        except _asyncio.CancelledError:
+            raise
         except Exception as e:
             print(f"⚠️ 刷新任务时出错: {e}")
-        await _asyncio.sleep(poll_sec)
-
-# 启动阶段打印文案调整
-print("📡 正在动态绑定监听频道...")
-
-# 启动监控修改：启动后立即绑定，并后台刷新
-# 原：在 start_monitoring 中直接 run_until_disconnected
-# 现：先 bind_channels 再启动 watcher
-print(f"📡 准备监听 Telegram 频道：{channel_usernames}")
+            await _asyncio.sleep(1)
 
 async def start_monitoring():
     """启动监控"""
+    probe = async_db.LoopLagProbe()
+    change_feed = ChangeFeed()
     try:
         print("🔗 正在连接到Telegram...")
-        await client.start()
+        await account_pool.refresh()
+        if not account_pool.accounts:
+            raise RuntimeError("没有可用的监控账号")
         print("✅ Telegram连接成功！")
         
-        # 获取用户信息
-        me = await client.get_me()
-        print(f"👤 当前用户: {me.first_name} (@{me.username if me.username else 'N/A'})")
-        
-        # 动态绑定频道并启动后台刷新任务
+        # 启动写入任务与事件循环阻塞探测，再动态绑定频道并启动后台刷新任务
+        message_writer.start()
+        probe.start()
+        await change_feed.connect()
+        print("📡 正在动态绑定监听频道...")
+        await async_db.sync_env_channels()
+        load_control_state()
         await bind_channels()
-        load_rules_cache()
-        client.loop.create_task(channels_watcher())
-        print("🎯 频道监听已启动（后台自动感知新增频道/规则）")
+        await async_db.load_rules_cache()
+        watcher = _asyncio.get_running_loop().create_task(channels_watcher(change_feed))
+        print("🎯 频道监听已启动（后台自动感知新增频道/规则/账号）")
         
-        await client.run_until_disconnected()
+        await account_pool.run_until_disconnected()
+        watcher.cancel()
         
     except Exception as e:
         print(f"❌ 连接失败: {e}")
@@ -548,41 +263,34 @@ async def start_monitoring():
         print("   1. 检查网络连接")
         print("   2. 检查StringSession是否有效")
         print("   3. 检查API凭据是否正确")
-
-async def backfill_channel(channel_username: str):
-    """回溯抓取指定频道的历史消息，仅存入“包含网盘链接”的消息，并按链接唯一性覆盖更新。"""
-    uname = channel_username.lstrip('@') if channel_username else ''
-    if not uname:
-        print("❌ 请提供有效的频道用户名，例如：--backfill bsbdbfjfjff")
-        return
-
-    print(f"⏪ 开始回溯抓取频道: {uname}")
-    await client.start()
-
-    inserted, updated, skipped = 0, 0, 0
+    finally:
+        # 退出前把队列中尚未落库的消息写完
+        await message_writer.close()
+        await probe.stop()
+        await account_pool.close()
+        await change_feed.close()
+        close_parse_pool()
+        await async_db.async_engine.dispose()
+
+async def backfill_channels(channels, all_channels: bool = False, concurrency=None, url_only: bool = True, restart: bool = False):
+    """并发回溯多个频道的历史消息，仅存入“包含网盘链接”的消息，并按链接唯一性覆盖更新；按频道断点续传"""
     try:
-        async for msg in client.iter_messages(uname, limit=None):
-            text = getattr(msg, 'message', None) or getattr(msg, 'raw_text', None)
-            if not text or not text.strip():
-                continue
-            parsed = parse_message(text)
-            # 仅保存“关于网盘”的消息（必须包含 links）
-            if not parsed.get('links'):
-                skipped += 1
-                continue
-            parsed['channel'] = uname
-            if should_drop_by_rules(uname, parsed):
-                continue
-            ts = to_beijing_time(getattr(msg, 'date', None)) or get_beijing_time()
-            with Session(engine) as session:
-                r = upsert_message_by_links(session, parsed, ts)
-                if r == 'updated':
-                    updated += 1
-                else:
-                    inserted += 1
-        print(f"⏪ 回溯完成：新增 {inserted} 条，更新 {updated} 条，跳过非网盘 {skipped} 条")
+        if all_channels:
+            channels = list(channels) + await async_db.get_channels()
+        if not channels:
+            print("❌ 请提供有效的频道用户名，例如：--backfill bsbdbfjfjff")
+            return
+        await async_db.load_rules_cache()
+        await account_pool.refresh()
+        if not account_pool.accounts:
+            raise RuntimeError("没有可用的监控账号")
+        await run_backfill(account_pool, channels, concurrency=concurrency, url_only=url_only, restart=restart)
     except Exception as e:
         print(f"❌ 回溯抓取失败：{e}")
+    finally:
+        await account_pool.close()
+        close_parse_pool()
+        await async_db.async_engine.dispose()
 
 if __name__ == "__main__":
     if "--fix-tags" in sys.argv:
@@ -628,13 +336,22 @@ if __name__ == "__main__":
             else:
                 print("没有需要删除的重复网盘链接消息。")
     elif "--backfill" in sys.argv:
+        # python monitor.py --backfill <频道1> [频道2 ...] [--all] [--concurrency N] [--no-url-filter] [--restart]
         import asyncio
         idx = sys.argv.index("--backfill")
-        ch = sys.argv[idx+1] if len(sys.argv) > idx+1 else None
-        if not ch:
-            print("用法: python monitor.py --backfill <channel_username>")
+        args = sys.argv[idx+1:]
+        concurrency = None
+        if "--concurrency" in args:
+            try:
+                concurrency = int(args[args.index("--concurrency") + 1])
+            except Exception:
+                pass
+        chs = [a for i, a in enumerate(args) if not a.startswith("--") and (i == 0 or args[i-1] != "--concurrency")]
+        if not chs and "--all" not in args:
+            print("用法: python monitor.py --backfill <频道1> [频道2 ...] [--all] [--concurrency N] [--no-url-filter] [--restart]")
         else:
-            asyncio.run(backfill_channel(ch))
+            asyncio.run(backfill_channels(chs, all_channels="--all" in args, concurrency=concurrency,
+                                          url_only="--no-url-filter" not in args, restart="--restart" in args))
     else:
         import asyncio
         asyncio.run(start_monitoring())
\ No newline at end of file
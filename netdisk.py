@@ -0,0 +1,126 @@
+"""网盘链接识别：按域名判定网盘类型并提取分享ID
+
+先解析一次 host，按后缀逐级查预置域名表（O(len(host))）；只有域名不在表中时，
+才退回到旧的关键字匹配（链接/名称里出现“夸克”“xunlei”等）。
+"""
+import re
+from typing import Tuple
+from urllib.parse import parse_qs
+
+# 网盘类型（前台筛选、后台规则等处共用，顺序即展示顺序）
+NETDISK_TYPES = ['夸克网盘', '阿里云盘', '百度网盘', '115网盘', '天翼云盘', '123云盘', 'UC网盘', '迅雷']
+
+# 域名 -> 网盘类型；子域名按后缀命中（如 www.alipan.com 命中 alipan.com）
+DOMAIN_TABLE = {
+    'pan.quark.cn': '夸克网盘',
+    'quark.cn': '夸克网盘',
+    'alipan.com': '阿里云盘',
+    'aliyundrive.com': '阿里云盘',
+    'pan.baidu.com': '百度网盘',
+    'yun.baidu.com': '百度网盘',
+    '115.com': '115网盘',
+    '115cdn.com': '115网盘',
+    'anxia.com': '115网盘',
+    'cloud.189.cn': '天翼云盘',
+    '123pan.com': '123云盘',
+    '123pan.cn': '123云盘',
+    '123684.com': '123云盘',
+    '123865.com': '123云盘',
+    '123912.com': '123云盘',
+    'drive.uc.cn': 'UC网盘',
+    'fast.uc.cn': 'UC网盘',
+    'pan.xunlei.com': '迅雷',
+    'xunlei.com': '迅雷',
+}
+
+# 域名未知时的关键字兜底（顺序即优先级）
+NETDISK_KEYWORDS = [
+    (['quark', '夸克'], '夸克网盘'),
+    (['aliyundrive', 'aliyun', '阿里', 'alipan'], '阿里云盘'),
+    (['baidu', 'pan.baidu'], '百度网盘'),
+    (['115.com', '115网盘', '115pan'], '115网盘'),
+    (['cloud.189', '天翼', '189.cn'], '天翼云盘'),
+    (['123pan', '123.yun'], '123云盘'),
+    (['ucdisk', 'uc网盘', 'ucloud', 'drive.uc.cn'], 'UC网盘'),
+    (['xunlei', 'thunder', '迅雷'], '迅雷'),
+]
+
+# 所有关键字合成一个模式（零宽前瞻，重叠的关键字也都能命中），一次扫描后取优先级最高的网盘
+_KEYWORD_RANK = {}
+for _rank, (_keys, _name) in enumerate(NETDISK_KEYWORDS):
+    for _k in _keys:
+        _KEYWORD_RANK.setdefault(_k, (_rank, _name))
+_KEYWORD_PATTERN = re.compile('(?=(' + '|'.join(re.escape(k) for k in sorted(_KEYWORD_RANK, key=len, reverse=True)) + '))')
+
+# 分享ID：/s/<id>、/t/<id> 路径段，或 surl=/code=/shareId= 查询参数
+_SHARE_PATH_PREFIXES = ('s', 't')
+_SHARE_QUERY_KEYS = ('surl', 'code', 'shareId', 'share_id')
+
+
+def get_host(url: str) -> str:
+    """取链接的主机名（小写，去掉端口/用户信息），无法解析返回空串"""
+    rest = url.split('://', 1)[-1]
+    end = len(rest)
+    for sep in '/?#':
+        i = rest.find(sep, 0, end)
+        if i != -1:
+            end = i
+    host = rest[:end].rpartition('@')[2].split(':', 1)[0]
+    return host.lower().rstrip('.')
+
+
+def lookup_host(host: str) -> str:
+    """按后缀逐级查域名表，未命中返回空串"""
+    while host:
+        name = DOMAIN_TABLE.get(host)
+        if name:
+            return name
+        dot = host.find('.')
+        if dot == -1:
+            break
+        host = host[dot + 1:]
+    return ''
+
+
+def match_keywords(url: str, key: str = '') -> str:
+    """关键字兜底：链接（小写）或名称中出现网盘关键字，未命中返回空串"""
+    best = None
+    for text in (url.lower(), key):
+        for m in _KEYWORD_PATTERN.finditer(text):
+            hit = _KEYWORD_RANK[m.group(1)]
+            if best is None or hit < best:
+                best = hit
+    return best[1] if best else ''
+
+
+def get_share_id(url: str) -> str:
+    """从链接中提取分享ID，取不到返回空串"""
+    rest = url.split('://', 1)[-1]
+    path, _, query = rest.partition('?')
+    query = query.split('#', 1)[0]
+    segments = [s for s in path.split('#', 1)[0].split('/')[1:] if s]
+    if len(segments) >= 2 and segments[0] in _SHARE_PATH_PREFIXES:
+        share_id = segments[1]
+        return share_id[:-5] if share_id.endswith('.html') else share_id
+    if query:
+        params = parse_qs(query)
+        for k in _SHARE_QUERY_KEYS:
+            if params.get(k):
+                return params[k][0]
+    return ''
+
+
+def get_provider(url: str, key: str = '') -> str:
+    """识别链接所属网盘类型，非网盘链接返回空串
+
+    key 为“名称:链接”写法中的名称，仅在域名未知时参与关键字兜底。
+    """
+    return lookup_host(get_host(url)) or match_keywords(url, key)
+
+
+def classify_url(url: str, key: str = '') -> Tuple[str, str]:
+    """识别链接所属网盘，返回 (网盘类型, 分享ID)；非网盘链接返回 ('', '')"""
+    name = get_provider(url, key)
+    if not name:
+        return '', ''
+    return name, get_share_id(url)
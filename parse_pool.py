@@ -0,0 +1,235 @@
+"""多进程解析（导入 / 回溯 / 监控突发时共用）
+
+parse_message 与 should_drop_by_rules 是纯 CPU 计算，批量入库时单线程解析是瓶颈。
+ParsePool 把一批原始文本按块分给进程池解析并按规则过滤，结果按输入顺序返回：
+- 同步：imap(items) 边读边解析（在途块数有上限），供 JSONL 导入使用
+- 异步：parse_batch_async(items) 在事件循环外执行，供回溯与监控使用；ParseBatcher 把同一轮事件循环里
+  同时到达的新消息合并成一批，少量消息直接在事件循环内解析（与原来一致，无额外延迟），突发时才交给进程池
+- 工作进程启动时带上当前规则；规则变化后（refresh_rules）下一批会换用新的进程池
+- PARSE_WORKERS=0 表示按 CPU 核数；只有 1 核或批量很小时直接在当前进程解析
+
+python parse_pool.py --bench <export.jsonl>   不同进程数下的解析吞吐
+"""
+import asyncio
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import rules
+from config import settings
+from message_parser import parse_message
+
+# 每块文本条数（一次进程间往返）
+PARSE_CHUNK_SIZE = 256
+# 少于该条数的批量直接在当前进程解析（进程间传输的开销大于收益）
+MIN_PARALLEL_ITEMS = 64
+
+# (status, parsed)：status 为 ok / empty（空文本或无有效内容）/ skipped（无网盘链接）/ dropped（规则排除）；
+# skipped 不带解析结果（少传一些数据）
+ParseResult = Tuple[str, Optional[Dict[str, Any]]]
+
+
+def parse_and_filter(text: str, channel: Optional[str] = None, require_links: bool = True) -> ParseResult:
+    """解析一条消息并按规则过滤；require_links=True 时只保留含网盘链接的消息（导入/回溯），
+    否则只排除没有任何有效内容的消息（实时监控）"""
+    text = (text or '').strip()
+    if not text:
+        return 'empty', None
+    parsed = parse_message(text)
+    if channel:
+        parsed['channel'] = channel
+    if require_links:
+        if not parsed.get('links'):
+            return 'skipped', None
+    elif not any([parsed.get('title'), parsed.get('description'), parsed.get('links'), parsed.get('tags')]):
+        return 'empty', parsed
+    if rules.should_drop_by_rules(parsed.get('channel', ''), parsed):
+        return 'dropped', parsed
+    return 'ok', parsed
+
+
+def _rule_specs() -> Dict[str, tuple]:
+    """当前规则缓存 -> 可传给工作进程的原始规则"""
+    return {
+        ch: (sorted(r['exclude_netdisks']), list(r['exclude_keywords']), sorted(r['exclude_tags']))
+        for ch, r in rules.RULES_CACHE.items()
+    }
+
+
+def _init_worker(specs: Dict[str, tuple]):
+    rules.RULES_CACHE = {ch: rules.compile_rule(*spec) for ch, spec in specs.items()}
+
+
+def _parse_chunk(items: List[Tuple[str, Optional[str]]], require_links: bool) -> List[ParseResult]:
+    return [parse_and_filter(text, channel, require_links) for text, channel in items]
+
+
+def _chunks(seq: List, size: int) -> List[List]:
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+
+class ParsePool:
+    """解析进程池；workers <= 1 时在当前进程解析"""
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: Optional[int] = None):
+        if workers is None:
+            workers = settings.PARSE_WORKERS or os.cpu_count() or 1
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size or PARSE_CHUNK_SIZE
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._specs: Optional[Dict[str, tuple]] = None
+
+    @property
+    def parallel(self) -> bool:
+        return self.workers > 1
+
+    def _pool(self) -> ProcessPoolExecutor:
+        specs = _rule_specs()
+        if self._executor is not None and specs != self._specs:
+            # 规则已变化：旧进程池处理完手头的块后退出
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._executor is None:
+            # spawn：不继承父进程的事件循环、网络连接与线程
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker, initargs=(specs,))
+            self._specs = specs
+        return self._executor
+
+    def parse_batch(self, items: List[Tuple[str, Optional[str]]], require_links: bool = True) -> List[ParseResult]:
+        """解析一批 (text, channel)，按输入顺序返回"""
+        if not self.parallel or len(items) < MIN_PARALLEL_ITEMS:
+            return _parse_chunk(items, require_links)
+        pool = self._pool()
+        futures = [pool.submit(_parse_chunk, chunk, require_links) for chunk in _chunks(items, self.chunk_size)]
+        return [r for f in futures for r in f.result()]
+
+    async def parse_batch_async(self, items: List[Tuple[str, Optional[str]]], require_links: bool = True) -> List[ParseResult]:
+        if not self.parallel or len(items) < MIN_PARALLEL_ITEMS:
+            return _parse_chunk(items, require_links)
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        chunks = await asyncio.gather(*(loop.run_in_executor(pool, _parse_chunk, chunk, require_links)
+                                        for chunk in _chunks(items, self.chunk_size)))
+        return [r for chunk in chunks for r in chunk]
+
+    def imap(self, items: Iterable[Tuple[str, Optional[str], Any]], require_links: bool = True) -> Iterator[Tuple[Any, str, Optional[Dict[str, Any]]]]:
+        """逐条读入 (text, channel, extra)，按顺序产出 (extra, status, parsed)；extra 留在当前进程不传给工作进程"""
+        if not self.parallel:
+            for text, channel, extra in items:
+                yield (extra,) + parse_and_filter(text, channel, require_links)
+            return
+        pool = self._pool()
+        pending = deque()
+        max_pending = self.workers * 2
+
+        def drain(limit: int):
+            while len(pending) > limit:
+                extras, fut = pending.popleft()
+                for extra, result in zip(extras, fut.result()):
+                    yield (extra,) + result
+
+        chunk, extras = [], []
+        for text, channel, extra in items:
+            chunk.append((text, channel))
+            extras.append(extra)
+            if len(chunk) >= self.chunk_size:
+                pending.append((extras, pool.submit(_parse_chunk, chunk, require_links)))
+                chunk, extras = [], []
+                yield from drain(max_pending)
+        if chunk:
+            pending.append((extras, pool.submit(_parse_chunk, chunk, require_links)))
+        yield from drain(0)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+_shared_pool: Optional[ParsePool] = None
+
+
+def get_parse_pool() -> ParsePool:
+    """进程内共用的解析池（按需创建）"""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = ParsePool()
+    return _shared_pool
+
+
+def close_parse_pool():
+    global _shared_pool
+    if _shared_pool is not None:
+        _shared_pool.close()
+        _shared_pool = None
+
+
+class ParseBatcher:
+    """把同一轮事件循环里同时到达的解析请求合并成一批（实时监控使用）"""
+
+    def __init__(self, pool: Optional[ParsePool] = None):
+        self.pool = pool
+        self._pending: List[Tuple[str, Optional[str], asyncio.Future]] = []
+        self._scheduled = False
+
+    async def parse(self, text: str, channel: Optional[str] = None) -> ParseResult:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, channel, fut))
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(lambda: loop.create_task(self._flush()))
+        return await fut
+
+    async def _flush(self):
+        batch, self._pending, self._scheduled = self._pending, [], False
+        pool = self.pool or get_parse_pool()
+        if len(batch) >= MIN_PARALLEL_ITEMS and pool.parallel:
+            print(f"⚡ 突发 {len(batch)} 条消息，交给 {pool.workers} 个解析进程")
+        try:
+            results = await pool.parse_batch_async([(t, c) for t, c, _ in batch], require_links=False)
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, _, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+
+if __name__ == '__main__':
+    # 解析吞吐压测：python parse_pool.py --bench export_bsbdbfjfjff_all.txt [最大进程数]
+    import sys
+    import time
+    from message_parser import _iter_export_texts
+    if len(sys.argv) < 3 or sys.argv[1] != '--bench':
+        print("用法: python parse_pool.py --bench <export.jsonl> [最大进程数]")
+        sys.exit(1)
+    texts = list(_iter_export_texts(sys.argv[2]))
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else (os.cpu_count() or 1)
+    items = [(t, 'bench') for t in texts]
+
+    def _normalized(results):
+        return [(s, p and dict(p, tags=sorted(p['tags']))) for s, p in results]
+
+    baseline = None
+    base_rate = None
+    counts = sorted({1, 2, 4, 8, 16, 32, max_workers} & set(range(1, max_workers + 1)))
+    print(f"CPU 核数 {os.cpu_count()}，{len(texts)} 条消息")
+    for n in counts:
+        pool = ParsePool(workers=n)
+        if pool.parallel:
+            pool.parse_batch(items[:MIN_PARALLEL_ITEMS * n])  # 预热：启动工作进程
+        t0 = time.perf_counter()
+        results = _normalized(pool.parse_batch(items))
+        cost = time.perf_counter() - t0
+        pool.close()
+        rate = len(items) / cost if cost else 0
+        if baseline is None:
+            baseline, base_rate = results, rate
+        same = '一致' if results == baseline else '❌ 结果不一致'
+        print(f"{n:>3} 个进程: {cost:.3f}s（{rate:.0f} 条/秒，加速 {rate / base_rate:.2f}x，{same}）")
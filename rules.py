@@ -0,0 +1,176 @@
+"""频道过滤规则：加载、编译与判断（monitor / 回溯 / 导出导入 共用）
+
+每个频道的排除关键词在加载时编译成一个匹配器，一条消息只需扫描一遍标题+描述：
+关键词少时用一个合并的正则，多时用 Aho-Corasick 自动机（耗时与关键词数量无关）。
+"""
+import re
+from collections import deque
+from typing import Dict, Any, Iterable, List
+
+from sqlalchemy.orm import Session
+
+from model import engine, ChannelRule
+
+# 规则缓存：{channel: {exclude_netdisks:frozenset, exclude_keywords:[lower], exclude_tags:frozenset, keyword_matcher}}
+RULES_CACHE: Dict[str, Dict[str, Any]] = {}
+
+# 关键词数量超过该值时改用 Aho-Corasick（正则多选分支的耗时随关键词数线性增长）
+AC_THRESHOLD = 100
+
+# 标题与描述拼接后一起扫描，用关键词里不可能出现的字符分隔，避免跨字段误命中
+_FIELD_SEP = '\x00'
+
+
+class KeywordMatcher:
+    """判断文本中是否出现任一关键词（关键词需已转小写）"""
+
+    def __init__(self, keywords: Iterable[str]):
+        words = sorted({kw for kw in keywords if kw}, key=len, reverse=True)
+        self.size = len(words)
+        self._pattern = None
+        self._goto: List[Dict[str, int]] = []
+        self._fail: List[int] = []
+        self._out: List[bool] = []
+        if not words:
+            return
+        if len(words) <= AC_THRESHOLD:
+            self._pattern = re.compile('|'.join(re.escape(w) for w in words))
+        else:
+            self._build_automaton(words)
+
+    def _build_automaton(self, words: List[str]):
+        goto: List[Dict[str, int]] = [{}]
+        out = [False]
+        for w in words:
+            state = 0
+            for ch in w:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(False)
+                state = nxt
+            out[state] = True
+        # 按层构建失败指针，并把失败链上的命中状态并入当前状态
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                out[nxt] = out[nxt] or out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def search(self, text: str) -> bool:
+        if self._pattern is not None:
+            return self._pattern.search(text) is not None
+        if not self._goto:
+            return False
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                return True
+        return False
+
+
+def compile_rule(exclude_netdisks, exclude_keywords, exclude_tags) -> Dict[str, Any]:
+    """把一条频道规则编译成缓存项"""
+    keywords = [kw.lower() for kw in (exclude_keywords or []) if kw]
+    return {
+        'exclude_netdisks': frozenset(exclude_netdisks or []),
+        'exclude_keywords': keywords,
+        'exclude_tags': frozenset(exclude_tags or []),
+        'keyword_matcher': KeywordMatcher(keywords),
+    }
+
+
+def build_rules_cache(rules) -> Dict[str, Dict[str, Any]]:
+    """由 ChannelRule 行构建 {channel: 编译后的规则}"""
+    return {
+        r.channel: compile_rule(r.exclude_netdisks, r.exclude_keywords, r.exclude_tags)
+        for r in rules
+    }
+
+
+def install_rules_cache(rules):
+    """用已查出的 ChannelRule 行替换规则缓存（同步/异步加载共用）"""
+    global RULES_CACHE
+    RULES_CACHE = build_rules_cache(rules)
+    print(f"⚙️ 已加载规则 {len(RULES_CACHE)} 条")
+
+
+def load_rules_cache():
+    try:
+        with Session(engine) as session:
+            install_rules_cache(session.query(ChannelRule).filter_by(enabled=True).all())
+    except Exception as e:
+        print(f"⚠️ 加载规则失败: {e}")
+
+
+def should_drop_by_rules(channel: str, parsed: dict) -> bool:
+    if not channel:
+        return False
+    rule = RULES_CACHE.get(channel)
+    if not rule:
+        return False
+    # 1) 网盘类型命中
+    links = parsed.get('links') or {}
+    if links and rule['exclude_netdisks'] and not rule['exclude_netdisks'].isdisjoint(links):
+        return True
+    # 2) 关键词命中（标题/描述），一次扫描
+    matcher = rule['keyword_matcher']
+    if matcher.size:
+        text = (parsed.get('title') or '').lower() + _FIELD_SEP + (parsed.get('description') or '').lower()
+        if matcher.search(text):
+            return True
+    # 3) 标签命中
+    tags = parsed.get('tags')
+    if tags and rule['exclude_tags'] and not rule['exclude_tags'].isdisjoint(tags):
+        return True
+    return False
+
+
+def _legacy_keyword_hit(keywords: List[str], title: str, desc: str) -> bool:
+    for kw in keywords:
+        if kw and (kw in title or kw in desc):
+            return True
+    return False
+
+
+if __name__ == '__main__':
+    # 关键词匹配压测：python rules.py --bench
+    import random
+    import sys
+    import time
+    if '--bench' not in sys.argv:
+        print("用法: python rules.py --bench")
+        sys.exit(1)
+    rng = random.Random(0)
+    alphabet = [chr(c) for c in range(0x4e00, 0x4e00 + 3000)] + list('abcdefghijklmnopqrstuvwxyz0123456789')
+
+    def _word(lo, hi):
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(lo, hi)))
+
+    samples = [(_word(8, 30).lower(), _word(80, 400).lower()) for _ in range(2000)]
+    for n in (10, 1000, 10000):
+        keywords = list({_word(2, 5) for _ in range(n)})
+        matcher = KeywordMatcher(keywords)
+        t0 = time.perf_counter()
+        old_hits = sum(_legacy_keyword_hit(keywords, t, d) for t, d in samples)
+        t1 = time.perf_counter()
+        new_hits = sum(matcher.search(t + _FIELD_SEP + d) for t, d in samples)
+        t2 = time.perf_counter()
+        assert old_hits == new_hits, (n, old_hits, new_hits)
+        kind = 'Aho-Corasick' if n > AC_THRESHOLD else '合并正则'
+        print(f"{n:>6} 个关键词（{kind}）: 逐个查找 {(t1 - t0) / len(samples) * 1e6:.1f}µs/条，"
+              f"编译后 {(t2 - t1) / len(samples) * 1e6:.1f}µs/条，命中 {new_hits}/{len(samples)}")
@@ -0,0 +1,120 @@
+"""边导出边入库（export_import_bsbdbfjfjff.py --stream 使用）
+
+导出流程每输出一条记录就放入有上限的队列（满了导出会等待，内存不会无限增长），
+后台任务从队列取出记录，交给解析池（parse_pool.py）解析、按规则过滤，攒批后经 message_writer.write_batch 写库（按链接去重，与实时监控一致）。
+网络拉取与数据库写入同时进行，总耗时约为两者中较长的一个，而不是两者之和。
+
+已写库的最大消息ID（imported_id）随导出检查点一起保存；导出中断后续传时，
+先把文件中已导出但尚未写库的记录重新放入队列。某批有记录写库失败后 imported_id 不再推进，
+续传时从失败处重新入库（按链接去重写入，重复写入不会产生重复消息）。
+"""
+import asyncio
+import datetime
+from datetime import timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from parse_pool import get_parse_pool
+from message_writer import write_batch
+import async_db
+
+# 北京时间时区
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def _record_timestamp(record: Dict[str, Any]) -> datetime.datetime:
+    """导出记录的 date（UTC ISO 字符串）-> 北京时间；缺失或无法解析时取当前时间"""
+    dt = None
+    if record.get('date'):
+        try:
+            dt = datetime.datetime.fromisoformat(record['date'])
+        except Exception:
+            pass
+    if dt is None:
+        return datetime.datetime.now(BEIJING_TZ).replace(tzinfo=None)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(BEIJING_TZ).replace(tzinfo=None)
+
+
+class StreamImporter:
+    """导出记录 -> 解析 -> 批量写库 的后台任务"""
+
+    def __init__(self, channel: str, batch_size: Optional[int] = None, maxsize: Optional[int] = None):
+        self.channel = channel
+        self.batch_size = batch_size or settings.WRITE_BATCH_SIZE
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize or settings.WRITE_QUEUE_MAXSIZE)
+        self.imported_id = 0
+        self.stats = {'received': 0, 'inserted': 0, 'updated': 0, 'merged': 0, 'failed': 0, 'skipped': 0, 'dropped': 0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, imported_id: int = 0):
+        self.imported_id = imported_id
+        await async_db.load_rules_cache()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def put(self, record: Dict[str, Any]):
+        """放入一条导出记录；队列满时等待入库腾出空间"""
+        if self._task is not None and self._task.done():
+            # 写库任务已异常退出，不再接收（让导出停下，而不是永远等待）
+            self._task.result()
+        await self.queue.put(record)
+
+    async def replay(self, records) -> int:
+        """把已导出但尚未写库的记录重新放入队列，返回条数"""
+        count = 0
+        for record in records:
+            await self.put(record)
+            count += 1
+        return count
+
+    async def _parse(self, records: List[Dict[str, Any]]) -> List[tuple]:
+        results = await get_parse_pool().parse_batch_async([(r.get('text'), self.channel) for r in records])
+        parsed_records = []
+        for record, (status, parsed) in zip(records, results):
+            # 只导入“关于网盘”的消息
+            if status == 'ok':
+                parsed_records.append((parsed, _record_timestamp(record)))
+            elif status in ('skipped', 'dropped'):
+                self.stats[status] += 1
+        return parsed_records
+
+    async def _run(self):
+        while True:
+            # 取出当前排队的全部记录（最多 batch_size 条）：写库慢时批次自然变大
+            records = [await self.queue.get()]
+            while len(records) < self.batch_size and not self.queue.empty():
+                records.append(self.queue.get_nowait())
+            try:
+                batch = await self._parse(records)
+                if batch:
+                    result = await write_batch(batch)
+                    for k in ('inserted', 'updated', 'merged', 'failed'):
+                        self.stats[k] += result[k]
+                self.stats['received'] += len(records)
+                if not self.stats['failed']:
+                    self.imported_id = max(self.imported_id, max(int(r.get('id') or 0) for r in records))
+            finally:
+                for _ in records:
+                    self.queue.task_done()
+            if self.stats['received'] // self.batch_size != (self.stats['received'] - len(records)) // self.batch_size:
+                print(f"  · 入库进度：新增 {self.stats['inserted']}，更新 {self.stats['updated']}，"
+                      f"跳过非网盘 {self.stats['skipped']}（队列剩余 {self.queue.qsize()}）", flush=True)
+
+    async def close(self) -> Dict[str, int]:
+        """写完队列中剩余的记录后停止，返回计数"""
+        if self._task is not None:
+            waiter = asyncio.ensure_future(self.queue.join())
+            # 写库任务异常退出时不再等待队列清空
+            await asyncio.wait([waiter, self._task], return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print(f"❌ 边导出边入库任务异常退出（已入库到消息ID {self.imported_id}）: {e}")
+            self._task = None
+        return self.stats
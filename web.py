@@ -1,10 +1,12 @@
 import streamlit as st
 from sqlalchemy.orm import Session
 from model import Message, engine
+from netdisk import NETDISK_TYPES
+from web_query import PAGE_SIZE, TIME_RANGES, top_tags
+from web_live import get_poller
+from web_cache import get_result_cache, make_view
 import pandas as pd
 from datetime import datetime, timedelta, timezone
-from collections import Counter
-from sqlalchemy import or_, cast, String
 import json
 import os
 
@@ -12,6 +14,11 @@ import os
 if 'selected_tags' not in st.session_state:
     st.session_state['selected_tags'] = []
 
+def reset_paging():
+    """回到第1页（键集分页：page_cursors[i] 为第 i+1 页的起始游标，第1页为 None）"""
+    st.session_state['page_num'] = 1
+    st.session_state['page_cursors'] = [None]
+
 st.set_page_config(
     page_title="TG频道监控",
     page_icon="📱",
@@ -27,23 +34,20 @@ st.sidebar.header("筛选条件")
 # 时间范围选择
 time_range = st.sidebar.selectbox(
     "时间范围",
-    ["最近24小时", "最近7天", "最近30天", "全部"]
+    list(TIME_RANGES)
 )
 
-# 标签选择（标签云，显示数量，降序）
-@st.cache_data(ttl=300)
-def get_tag_data():
+# 标签选择（标签云，显示数量，降序）：读增量维护的 tag_counts 表
+@st.cache_data(ttl=60)
+def get_tag_data(selected: tuple = ()):
     with Session(engine) as session:
-        all_tags = session.query(Message.tags).all()
-    tag_list = [tag for tags in all_tags for tag in (tags[0] if tags[0] else [])]
-    tag_counter = Counter(tag_list)
-    tag_items = sorted(tag_counter.items(), key=lambda x: x[1], reverse=True)
+        tag_items = list(top_tags(session, include=selected).items())
     tag_options = [f"{tag} ({count})" for tag, count in tag_items]
     tag_map = {f"{tag} ({count})": tag for tag, count in tag_items}
     return tag_options, tag_map, {tag: count for tag, count in tag_items}
 
 try:
-    tag_options, tag_map, tag_counter = get_tag_data()
+    tag_options, tag_map, tag_counter = get_tag_data(tuple(sorted(st.session_state['selected_tags'])))
 except Exception:
     tag_options, tag_map, tag_counter = [], {}, {}
 
@@ -57,8 +61,7 @@ selected_tags = [tag_map[label] for label in selected_tag_labels]
 st.session_state['selected_tags'] = selected_tags
 
 # 网盘类型筛选
-netdisk_types = ['夸克网盘', '阿里云盘', '百度网盘', '115网盘', '天翼云盘', '123云盘', 'UC网盘', '迅雷']
-selected_netdisks = st.sidebar.multiselect("网盘类型", netdisk_types)
+selected_netdisks = st.sidebar.multiselect("网盘类型", NETDISK_TYPES)
 
 # 关键词模糊搜索（带搜索按钮）
 if 'search_query' not in st.session_state:
@@ -73,67 +76,50 @@ col_sa, col_sb = st.sidebar.columns([1, 1])
 with col_sa:
     if st.button("搜索", key="do_search"):
         st.session_state['search_query'] = _search_input.strip()
-        st.session_state['page_num'] = 1
+        reset_paging()
         st.rerun()
 with col_sb:
     if st.button("清空", key="clear_search"):
         st.session_state['search_query'] = ''
-        st.session_state['page_num'] = 1
+        reset_paging()
         st.rerun()
 if st.session_state.get('search_query'):
     st.sidebar.caption(f"当前搜索：{st.session_state['search_query']}")
 
-# 分页参数
-PAGE_SIZE = 50
-if 'page_num' not in st.session_state:
-    st.session_state['page_num'] = 1
-page_num = st.session_state['page_num']
-
-# 构建查询（服务端分页 + SQL端过滤）
-with Session(engine) as session:
-    query = session.query(Message)
-    # 应用时间范围过滤
-    if time_range == "最近24小时":
-        query = query.filter(Message.timestamp >= datetime.now() - timedelta(days=1))
-    elif time_range == "最近7天":
-        query = query.filter(Message.timestamp >= datetime.now() - timedelta(days=7))
-    elif time_range == "最近30天":
-        query = query.filter(Message.timestamp >= datetime.now() - timedelta(days=30))
-    # 应用标签过滤
-    if selected_tags:
-        filters = [Message.tags.any(tag) for tag in selected_tags]
-        query = query.filter(or_(*filters))
-    # 应用关键词模糊搜索（AND 组合多关键词，OR 匹配多个字段）
-    _q = st.session_state.get('search_query', '').strip()
-    if _q:
-        kws = [k for k in _q.split() if k]
-        for kw in kws:
-            pattern = f"%{kw}%"
-            query = query.filter(
-                or_(
-                    Message.title.ilike(pattern),
-                    Message.description.ilike(pattern),
-                    Message.channel.ilike(pattern),
-                    Message.source.ilike(pattern),
-                )
-            )
-    # 网盘类型在 SQL 侧过滤（无 JSONB：退化为字符串包含）
-    if selected_netdisks:
-        exprs = [cast(Message.links, String).ilike(f'%"{nd}"%') for nd in selected_netdisks]
-        query = query.filter(or_(*exprs))
-
-    # 统计总数并计算分页
-    total_count = query.order_by(None).count()
-    max_page = (total_count + PAGE_SIZE - 1) // PAGE_SIZE if total_count else 1
-    # 校正页码范围
-    if page_num < 1:
-        page_num = 1
-    if page_num > max_page:
-        page_num = max_page
-        st.session_state['page_num'] = page_num
+# 当前筛选条件（不含分页）；签名用于判断筛选是否变化（变化时重置到第1页），也是结果缓存的键
+_view = make_view(time_range, st.session_state.get('selected_tags', []), selected_netdisks,
+                  st.session_state.get('search_query', ''))
+_filter_sig = _view.signature
+_filter_changed = st.session_state.get('filter_sig') != _filter_sig
+if _filter_changed:
+    # 筛选条件发生变化：先重置分页（游标只对同一组筛选条件有效），再查询
+    reset_paging()
+    st.session_state['filter_sig'] = _filter_sig
 
-    start_idx = (page_num - 1) * PAGE_SIZE
-    messages_page = query.order_by(Message.timestamp.desc()).offset(start_idx).limit(PAGE_SIZE).all()
+# 分页参数（键集分页：按 (timestamp, id) 倒序，从本页起始游标之后取一页）
+if 'page_num' not in st.session_state or 'page_cursors' not in st.session_state:
+    reset_paging()
+page_num = st.session_state['page_num']
+page_cursors = st.session_state['page_cursors']
+if page_num > len(page_cursors):
+    page_num = len(page_cursors)
+    st.session_state['page_num'] = page_num
+
+# 本次渲染对应的消息高水位（查询前读取，之后到达的新消息一定会触发下一次刷新）
+st.session_state['seen_mark'] = get_poller().mark
+
+# 查询（服务端分页 + SQL端过滤）：经进程内共享的结果缓存（web_cache.py），
+# 同一筛选条件与页码在各页面之间只查一次库，有新消息时失效；有关键词时按相关度（标题命中数）排序，其次按时间
+results = get_result_cache()
+total_count, count_exact = results.count(_view)
+max_page = (total_count + PAGE_SIZE - 1) // PAGE_SIZE if total_count else 1
+
+messages_page, next_cursor = results.page(_view, page_cursors[page_num - 1])
+if not messages_page and page_num > 1:
+    # 本页的数据已被删除/覆盖：回到第1页
+    reset_paging()
+    page_num, page_cursors = 1, st.session_state['page_cursors']
+    messages_page, next_cursor = results.page(_view, None)
 
 # 显示消息列表（分页后）
 for msg in messages_page:
@@ -162,17 +148,24 @@ for msg in messages_page:
             st.markdown(tag_html, unsafe_allow_html=True)
 
 # 显示分页信息和跳转控件（按钮和页码信息同一行居中）
-if max_page > 1:
+if page_num > 1 or next_cursor is not None:
     col1, col2, col3 = st.columns([1,2,1])
     with col1:
         if st.button('上一页', disabled=page_num==1, key='prev_page'):
             st.session_state['page_num'] = max(1, page_num-1)
+            del st.session_state['page_cursors'][page_num:]
             st.rerun()
     with col2:
-        st.markdown(f"<div style='text-align:center;line-height:38px;'>共 {total_count} 条，当前第 {page_num} / {max_page} 页</div>", unsafe_allow_html=True)
+        if count_exact:
+            page_info = f"共 {total_count} 条，当前第 {page_num} / {max(max_page, page_num)} 页"
+        else:
+            page_info = f"约 {total_count} 条，当前第 {page_num} / 约 {max(max_page, page_num)} 页"
+        st.markdown(f"<div style='text-align:center;line-height:38px;'>{page_info}</div>", unsafe_allow_html=True)
     with col3:
-        if st.button('下一页', disabled=page_num==max_page, key='next_page'):
-            st.session_state['page_num'] = min(max_page, page_num+1)
+        if st.button('下一页', disabled=next_cursor is None, key='next_page'):
+            del st.session_state['page_cursors'][page_num:]
+            st.session_state['page_cursors'].append(next_cursor)
+            st.session_state['page_num'] = page_num+1
             st.rerun()
 
 # 处理点击条目标签筛选
@@ -203,46 +196,17 @@ def get_refresh_interval(default: int = 60) -> int:
     return default
 
 interval = get_refresh_interval()
-st.markdown(f"页面每{interval}秒自动刷新一次")
-
-# 交互无阻塞刷新：当筛选或分页变化时，跳过sleep，立即完成本次渲染
-import hashlib as _hashlib
+st.markdown(f"每{interval}秒检查一次新消息，有新消息时自动刷新")
 
-# 仅用于判断筛选是否变化（不含分页），变化时重置到第1页
-_filter_state = {
-    'time_range': time_range,
-    'selected_tags': sorted(st.session_state.get('selected_tags', [])),
-    'selected_netdisks': sorted(selected_netdisks),
-    'search_query': st.session_state.get('search_query', ''),
-}
-_filter_sig = _hashlib.md5(json.dumps(_filter_state, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
-_prev_filter_sig = st.session_state.get('filter_sig')
-if _prev_filter_sig != _filter_sig:
-    # 筛选条件发生变化，重置分页并记录签名
-    st.session_state['page_num'] = 1
-    st.session_state['filter_sig'] = _filter_sig
-    # 本次为交互变更，直接返回（不sleep），让界面立即更新
-    # 注意：Streamlit会在下一次空闲渲染时再进入自动刷新
-else:
-    # 用于判断交互是否发生（含分页在内的任何变化），变化时不sleep
-    _ui_state = {
-        'time_range': time_range,
-        'selected_tags': sorted(st.session_state.get('selected_tags', [])),
-        'selected_netdisks': sorted(selected_netdisks),
-        'page_num': st.session_state.get('page_num', 1),
-        'search_query': st.session_state.get('search_query', ''),
-    }
-    _ui_sig = _hashlib.md5(json.dumps(_ui_state, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
-    _prev_ui_sig = st.session_state.get('ui_sig')
-    if _prev_ui_sig != _ui_sig:
-        st.session_state['ui_sig'] = _ui_sig
-        # 本次为交互变更，直接返回（不sleep）
-    else:
-        # 无交互发生，进入自动拉取模式：sleep后自动重跑
-        import time as _time
-        _time.sleep(interval)
+# 新消息检测：定时只重跑这个片段，比较进程内共享的高水位（web_live.py，不查库、不占线程 sleep），
+# 高水位变化时才整页重跑（结果缓存随之失效，重新统计总数）
+@st.fragment(run_every=interval)
+def watch_new_messages():
+    if get_poller().mark != st.session_state.get('seen_mark'):
         st.rerun()
 
+watch_new_messages()
+
 # 添加全局CSS，强力覆盖expander内容区的gap，只保留一处，放在文件最后
 st.markdown("""
     <style>
@@ -0,0 +1,227 @@
+"""前台（web.py）各页面共享的查询结果缓存
+
+大多数访问者看的是同一个视图（如「最近24小时」第1页），原来每个页面每次重跑都要统计总数、查询本页。
+ResultCache 按 (筛选签名, 分页游标) 缓存本页行，按筛选签名缓存总数，在同一进程的所有页面之间共享：
+- 失效：messages 高水位（web_live.py 的共享轮询，含变更计数，新增 / 覆盖 / 删除都会使其变化）变化时整体清空；另外条目最多保留 RESULT_CACHE_TTL_SEC 秒，
+  让「最近N天」这类相对时间窗口的结果不会无限期停在旧的时间点
+- 容量：按 LRU 淘汰，缓存内容的估算内存不超过 WEB_CACHE_MB
+- 同一结果同时被多个页面请求时只有一个去查库，其余等待它的结果（有新消息后大家一起重跑时不会一起打到数据库）
+- 预热：启动时与每次高水位变化后，在后台线程里查好各时间范围无其他筛选条件时的总数与第1页
+
+python web_cache.py --bench   预热后对比命中 / 未命中的耗时
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from model import engine
+from web_live import get_poller
+from web_query import TIME_RANGES, Cursor, HighWater, build_filters, count_rows, fetch_page, search_rank
+
+# 条目最长保留秒数（高水位不变时也会过期）
+RESULT_CACHE_TTL_SEC = 300
+# 等待其他页面查询同一结果的最长秒数，超时则自己查
+LOAD_WAIT_SEC = 30
+
+
+class CachedMessage(NamedTuple):
+    """缓存的消息行（与 Message 同名字段，web.py 直接按属性读取；不持有数据库会话）"""
+    id: int
+    timestamp: Any
+    title: Optional[str]
+    description: Optional[str]
+    links: Optional[Dict[str, str]]
+    tags: Tuple[str, ...]
+
+
+class View(NamedTuple):
+    """一组筛选条件（不含分页）"""
+    time_range: str
+    tags: Tuple[str, ...]
+    netdisks: Tuple[str, ...]
+    search: str
+
+    @property
+    def signature(self) -> str:
+        state = {
+            'time_range': self.time_range,
+            'selected_tags': list(self.tags),
+            'selected_netdisks': list(self.netdisks),
+            'search_query': self.search,
+        }
+        return hashlib.md5(json.dumps(state, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def make_view(time_range: str, tags: Iterable[str] = (), netdisks: Iterable[str] = (), search: str = '') -> View:
+    return View(time_range, tuple(sorted(tags)), tuple(sorted(netdisks)), search or '')
+
+
+def default_views() -> List[View]:
+    """预热的视图：各时间范围、无其他筛选条件"""
+    return [make_view(time_range) for time_range in TIME_RANGES]
+
+
+def _approx_size(obj) -> int:
+    """估算对象占用的内存（字节）"""
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_approx_size(k) + _approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(_approx_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def _snapshot(msg) -> CachedMessage:
+    return CachedMessage(msg.id, msg.timestamp, msg.title, msg.description, msg.links, tuple(msg.tags or ()))
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    created_at: float
+
+
+class ResultCache:
+    """按高水位失效的 LRU 结果缓存（线程安全）"""
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: float = RESULT_CACHE_TTL_SEC,
+                 mark_source: Optional[Callable[[], Optional[HighWater]]] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else settings.WEB_CACHE_MB * 1024 * 1024
+        self.ttl = ttl
+        self._mark_source = mark_source or (lambda: get_poller().mark)
+        self._mark: Optional[HighWater] = None
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._loading: Dict[Hashable, threading.Event] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._warned = False
+
+    def _sync(self, mark: Optional[HighWater]):
+        """高水位变化：清空全部条目（调用方持有锁）"""
+        if mark != self._mark:
+            self._entries.clear()
+            self._bytes = 0
+            self._mark = mark
+
+    def _put(self, key: Hashable, value: Any, mark: Optional[HighWater]):
+        size = _approx_size(key) + _approx_size(value)
+        with self._lock:
+            if mark != self._mark or size > self.max_bytes:
+                # 查询期间高水位已变化（结果可能已过时），或单条就超过容量：不缓存
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = _Entry(value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """命中则直接返回；否则调用 loader() 查询并缓存（同一 key 同时只有一个调用方在查询）"""
+        while True:
+            mark = self._mark_source()
+            with self._lock:
+                self._sync(mark)
+                entry = self._entries.get(key)
+                if entry is not None and time.monotonic() - entry.created_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # 其他页面正在查询同一结果：等它查完再看缓存（它失败或结果未缓存时由本调用方查询）
+            if not loading.wait(LOAD_WAIT_SEC):
+                return loader()
+        try:
+            value = loader()
+            self._put(key, value, mark)
+            return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            loading.set()
+
+    def count(self, view: View) -> Tuple[int, bool]:
+        """view 的 (总数, 是否精确)，见 web_query.count_rows"""
+        def load():
+            with Session(engine) as session:
+                return count_rows(session, build_filters(view.time_range, list(view.tags), list(view.netdisks), view.search))
+        return self.get_or_load(('count', view.signature), load)
+
+    def page(self, view: View, cursor: Optional[Cursor] = None) -> Tuple[List[CachedMessage], Optional[Cursor]]:
+        """view 在 cursor 之后的一页 (本页消息, 下一页游标)，见 web_query.fetch_page"""
+        def load():
+            with Session(engine) as session:
+                filters = build_filters(view.time_range, list(view.tags), list(view.netdisks), view.search)
+                messages, next_cursor = fetch_page(session, filters, cursor, rank=search_rank(view.search))
+                return [_snapshot(m) for m in messages], next_cursor
+        return self.get_or_load(('page', view.signature, cursor), load)
+
+    def warm(self, views: Optional[Iterable[View]] = None):
+        """预先查好常用视图的总数与第1页"""
+        try:
+            for view in (default_views() if views is None else views):
+                self.count(view)
+                self.page(view)
+            self._warned = False
+        except Exception as e:
+            if not self._warned:
+                print(f"⚠️ 预热查询结果缓存失败: {e}")
+                self._warned = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """进程内共用的结果缓存；首次创建时在后台预热，之后每次高水位变化由轮询线程重新预热"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+            get_poller().add_listener(lambda mark: _cache.warm())
+            threading.Thread(target=_cache.warm, name='web-cache-warm', daemon=True).start()
+        return _cache
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['--bench']:
+        print("用法: python web_cache.py --bench")
+        sys.exit(1)
+    cache = ResultCache()
+    t0 = time.perf_counter()
+    cache.warm()
+    print(f"预热 {len(default_views())} 个视图: {time.perf_counter() - t0:.3f}s")
+    for view in default_views():
+        t0 = time.perf_counter()
+        n, exact = cache.count(view)
+        rows, _ = cache.page(view)
+        hit = time.perf_counter() - t0
+        with Session(engine) as session:
+            filters = build_filters(view.time_range, [], [], '')
+            t0 = time.perf_counter()
+            count_rows(session, filters)
+            fetch_page(session, filters)
+            miss = time.perf_counter() - t0
+        print(f"{view.time_range}: {'共' if exact else '约'} {n} 条，第1页 {len(rows)} 行；"
+              f"命中 {hit * 1000:.3f}ms，直接查库 {miss * 1000:.1f}ms")
+    print(cache.stats())
@@ -0,0 +1,104 @@
+"""前台（web.py）的新消息检测：进程内所有页面共用一个后台轮询线程
+
+原来每个打开的页面空闲时 sleep(interval) 再整页重跑：sleep 期间占着一个脚本线程，
+N 个页面每个周期就是 N 次相同的总数统计与分页查询。现在：
+- HighWaterPoller 每隔 WEB_POLL_SEC 秒查一次 messages 的高水位（web_query.high_water_mark：max(id) / max(timestamp) 索引各读一行，外加变更计数行），
+  查询次数与打开的页面数无关
+- 页面用 st.fragment(run_every=...) 定时只重跑一个小片段，比较内存里的高水位与本页渲染时的高水位：
+  没变就什么都不做（不查库、不占线程等待）；变了才整页重跑
+- 超过 IDLE_AFTER_SEC 没有页面读取高水位时轮询线程暂停，下次读取时当场查一次并恢复轮询
+- add_listener(fn) 注册的回调在高水位变化（含启动后第一次查到）时由轮询线程调用（如预热结果缓存）
+"""
+import threading
+import time
+from typing import Callable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from model import engine
+from web_query import HighWater, high_water_mark
+
+# 超过该秒数没有页面读取高水位时暂停轮询
+IDLE_AFTER_SEC = 300
+
+
+class HighWaterPoller:
+    """后台线程定时刷新 messages 高水位；mark 供各页面读取"""
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = max(1, interval if interval is not None else settings.WEB_POLL_SEC)
+        self._mark: Optional[HighWater] = None
+        self._polled_at = float('-inf')
+        self._last_read = time.monotonic()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._warned = False
+        self._listeners: List[Callable[[HighWater], None]] = []
+        self._notified: Optional[HighWater] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='web-high-water', daemon=True)
+            self._thread.start()
+
+    def add_listener(self, fn: Callable[[HighWater], None]):
+        """高水位变化时在轮询线程里调用 fn(mark)"""
+        self._listeners.append(fn)
+
+    @property
+    def mark(self) -> Optional[HighWater]:
+        """当前高水位（查询失败且从未成功时为 None）"""
+        now = time.monotonic()
+        self._last_read = now
+        if now - self._polled_at > self.interval * 2:
+            # 轮询暂停过或还没轮询过：当场查一次，并唤醒轮询线程
+            self._wake.set()
+            return self.poll()
+        return self._mark
+
+    def poll(self) -> Optional[HighWater]:
+        """查询一次高水位；失败时保留上一次的值"""
+        try:
+            with Session(engine) as session:
+                mark = high_water_mark(session)
+        except Exception as e:
+            if not self._warned:
+                print(f"⚠️ 查询消息高水位失败，稍后重试: {e}")
+                self._warned = True
+            return self._mark
+        self._warned = False
+        self._mark, self._polled_at = mark, time.monotonic()
+        return mark
+
+    def _run(self):
+        while True:
+            if time.monotonic() - self._last_read > IDLE_AFTER_SEC:
+                self._wake.wait()
+                self._wake.clear()
+            mark = self.poll()
+            if mark is not None and mark != self._notified:
+                self._notified = mark
+                self._notify(mark)
+            time.sleep(self.interval)
+
+    def _notify(self, mark: HighWater):
+        for fn in list(self._listeners):
+            try:
+                fn(mark)
+            except Exception as e:
+                print(f"⚠️ 高水位变化回调失败: {e}")
+
+
+_poller: Optional[HighWaterPoller] = None
+_poller_lock = threading.Lock()
+
+
+def get_poller() -> HighWaterPoller:
+    """进程内共用的高水位轮询（按需创建并启动；Streamlit 的各页面在同一进程的不同线程里运行）"""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = HighWaterPoller()
+        _poller.start()
+        return _poller
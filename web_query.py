@@ -0,0 +1,149 @@
+"""前台列表查询（web.py 使用）：筛选条件 -> SQL、键集分页、总数
+
+- 分页按 (timestamp, id) 倒序做键集分页：每页只取 page_size + 1 行，
+  下一页从上一页最后一行的 (timestamp, id) 之后继续，翻到多深都不需要跳过前面的行（不用 OFFSET）
+- 总数先做有上限的计数（最多数 COUNT_EXACT_LIMIT + 1 行）：不超过上限时即为精确值；
+  超过时改用查询计划器的估算行数，只显示约数
+- 下面用到的数据库函数与索引（tg_search_tokens / tg_link_providers / ix_messages_*）由 migrations.py 创建
+- 关键词搜索走 GIN 索引：标题/描述/频道/来源按相邻两个字符切分（中文无空格分词，二元切分即可命中任意子串），
+  每个关键词的二元组都必须包含在消息的二元组集合中（先由索引筛出候选行），再用原来的 ILIKE 精确确认；
+  多个关键词为 AND，结果按标题命中的关键词数排序，其次按时间。单字关键词没有二元组，只能逐行匹配
+- 网盘类型与标签筛选都是数组重叠（&&），分别走 links 键数组的 GIN 表达式索引与 tags 的 GIN 索引，
+  与时间范围等条件组合时由位图索引扫描合并（不再把整行 links 转成字符串做包含匹配）
+- 标签云读 tag_counts 表（写入时由触发器增量维护），一条按计数的索引查询取前 TAG_CLOUD_LIMIT 个
+- 高水位 (max(id), max(timestamp)) 用于判断有没有新消息（插入或按链接覆盖更新），两个聚合各走索引读一行
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import String, case, cast, func, literal, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+from model import Message, MessagesVersion, TagCount
+
+# 每页条数
+PAGE_SIZE = 50
+# 结果不超过该条数时给出精确总数，超过时给出估算值
+COUNT_EXACT_LIMIT = 10000
+# 标签云显示的标签数
+TAG_CLOUD_LIMIT = 500
+
+# 时间范围选项 -> 回看时长（None 为全部）
+TIME_RANGES = {
+    "最近24小时": timedelta(days=1),
+    "最近7天": timedelta(days=7),
+    "最近30天": timedelta(days=30),
+    "全部": None,
+}
+
+# 分页游标：某页最后一行的排序键（有搜索时为 (相关度, timestamp, id)，否则为 (timestamp, id)）
+Cursor = Tuple[Any, ...]
+# messages 的高水位：(max(id), max(timestamp), messages_version.version)
+HighWater = Tuple[Optional[int], Optional[datetime], Optional[int]]
+
+_SEARCH_COLUMNS = (Message.title, Message.description, Message.channel, Message.source)
+
+
+def _search_tokens(*parts):
+    return func.tg_search_tokens(*parts, type_=ARRAY(String))
+
+
+def search_keywords(search: str) -> List[str]:
+    return [kw for kw in (search or '').split() if kw]
+
+
+def search_rank(search: str):
+    """相关度：标题中命中的关键词数（没有搜索时为 None）"""
+    kws = search_keywords(search)
+    if not kws:
+        return None
+    return sum((case((Message.title.ilike(f"%{kw}%"), 1), else_=0) for kw in kws), literal(0))
+
+
+def build_filters(time_range: str, tags: List[str], netdisks: List[str], search: str,
+                  now: Optional[datetime] = None) -> List[Any]:
+    """筛选条件 -> WHERE 子句列表"""
+    filters = []
+    # 时间范围
+    span = TIME_RANGES.get(time_range)
+    if span is not None:
+        filters.append(Message.timestamp >= (now or datetime.now()) - span)
+    # 标签（命中任一）
+    if tags:
+        filters.append(Message.tags.op('&&')(cast(list(tags), ARRAY(String))))
+    # 关键词模糊搜索（AND 组合多关键词，OR 匹配多个字段）：先用二元组索引筛选候选行
+    kws = search_keywords(search)
+    if any(len(kw) >= 2 for kw in kws):
+        filters.append(_search_tokens(*_SEARCH_COLUMNS).contains(_search_tokens(*[kw for kw in kws if len(kw) >= 2])))
+    for kw in kws:
+        pattern = f"%{kw}%"
+        filters.append(or_(
+            Message.title.ilike(pattern),
+            Message.description.ilike(pattern),
+            Message.channel.ilike(pattern),
+            Message.source.ilike(pattern),
+        ))
+    # 网盘类型（命中任一）
+    if netdisks:
+        filters.append(func.tg_link_providers(Message.links, type_=ARRAY(String)).overlap(cast(list(netdisks), ARRAY(String))))
+    return filters
+
+
+def fetch_page(session: Session, filters: List[Any], cursor: Optional[Cursor] = None,
+               page_size: int = PAGE_SIZE, rank=None) -> Tuple[List[Message], Optional[Cursor]]:
+    """取 cursor 之后的一页，返回 (本页消息, 下一页游标)；没有下一页时游标为 None
+    rank 为相关度表达式（search_rank）时先按相关度、再按时间倒序"""
+    keys = [Message.timestamp, Message.id] if rank is None else [rank, Message.timestamp, Message.id]
+    query = session.query(Message, *keys[:-2]).filter(*filters)
+    if cursor is not None:
+        query = query.filter(tuple_(*keys) < tuple_(*cursor))
+    rows = query.order_by(*[k.desc() for k in keys]).limit(page_size + 1).all()
+    messages = [row[0] for row in rows] if rank is not None else rows
+    next_cursor = None
+    if len(messages) > page_size:
+        messages = messages[:page_size]
+        last = rows[page_size - 1]
+        next_cursor = (last[1], last[0].timestamp, last[0].id) if rank is not None else (last.timestamp, last.id)
+    return messages, next_cursor
+
+
+def _planner_rows(session: Session, query) -> int:
+    """查询计划器估算的结果行数（依赖 ANALYZE 统计信息，不执行查询）"""
+    compiled = query.statement.compile(dialect=session.get_bind().dialect)
+    plan = session.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_rows(session: Session, filters: List[Any], limit: int = COUNT_EXACT_LIMIT) -> Tuple[int, bool]:
+    """返回 (总数, 是否精确)：先数到 limit + 1 行为止，超过上限时返回计划器估算值（不小于 limit + 1）"""
+    query = session.query(Message.id).filter(*filters)
+    capped = query.limit(limit + 1).subquery()
+    n = session.query(func.count()).select_from(capped).scalar()
+    if n <= limit:
+        return n, True
+    try:
+        estimate = _planner_rows(session, query)
+    except Exception:
+        estimate = 0
+    return max(estimate, limit + 1), False
+
+
+def top_tags(session: Session, limit: int = TAG_CLOUD_LIMIT, include: Iterable[str] = ()) -> Dict[str, int]:
+    """计数最多的 limit 个标签 {标签: 计数}（按计数降序）；include 中的标签（如已选中的）即使不在前列也一并返回"""
+    rows = session.query(TagCount.tag, TagCount.count).order_by(TagCount.count.desc()).limit(limit).all()
+    counts = {tag: count for tag, count in rows}
+    extra = [tag for tag in include if tag not in counts]
+    if extra:
+        counts.update(session.query(TagCount.tag, TagCount.count).filter(TagCount.tag.in_(extra)).all())
+    return counts
+
+
+def high_water_mark(session: Session) -> HighWater:
+    """messages 的高水位 (max(id), max(timestamp), 变更计数)；新插入、覆盖更新（含旧时间戳的覆盖）、删除都会使其变化"""
+    version = select(MessagesVersion.version).where(MessagesVersion.id == 1).scalar_subquery()
+    max_id, max_ts, changes = session.query(func.max(Message.id), func.max(Message.timestamp), version).one()
+    return max_id, max_ts, changes
@@ -5,10 +5,27 @@ from datetime import datetime
 import json
 import os
 from config import settings
+from change_feed import notify_change
 
 st.set_page_config(page_title="后台管理", page_icon="🔧", layout="wide")
 st.title("后台管理")
 
+def notify_monitor(kind: str):
+    """通知监控端刷新（频道 channels / 规则 rules / 暂停恢复 control / 账号 accounts）
+
+    优先走 PostgreSQL NOTIFY（即时生效）；发送失败时写刷新标记文件，由监控端兜底轮询读取。
+    """
+    if notify_change(kind):
+        return
+    flag = {"channels": "channels_refresh.flag", "rules": "rules_refresh.flag"}.get(kind)
+    if not flag:
+        return
+    try:
+        with open(flag, "w") as f:
+            f.write("refresh")
+    except Exception as e:
+        st.warning(f"触发刷新失败: {e}")
+
 # 缓存与分页常量
 @st.cache_data(ttl=300)
 def get_telegram_cfg():
@@ -28,7 +45,7 @@ def get_credentials():
 def get_channels():
     with Session(engine) as session:
         rows = session.query(Channel).all()
-        return [(c.id, c.username) for c in rows]
+        return [(c.id, c.username, c.join_status) for c in rows]
 
 RULES_PAGE_SIZE = 50
 
@@ -73,6 +90,7 @@ with col1:
             except Exception as e:
                 st.warning(f"同步 API 凭据失败: {e}")
             session.commit()
+        notify_monitor("accounts")
         # 变更后清理缓存并刷新
         try:
             get_telegram_cfg.clear()
@@ -89,6 +107,7 @@ with col2:
                 cfg.string_session = None
                 cfg.updated_at = datetime.utcnow()
                 session.commit()
+        notify_monitor("accounts")
         # 变更后清理缓存并刷新
         try:
             get_telegram_cfg.clear()
@@ -97,6 +116,36 @@ with col2:
         st.session_state['clear_string_session_input'] = True
         st.rerun()
 
+# 多账号：每个 StringSession 是一个监控账号，频道按一致性哈希自动分配到各账号
+st.subheader("更多监控账号")
+st.caption("添加多个账号后，频道会自动分摊到各账号监听（第 N 个账号使用第 N 条 API 凭据，不足时使用第一条）。")
+with Session(engine) as session:
+    extra_cfgs = [(c.id, c.string_session) for c in session.query(TelegramConfig).order_by(TelegramConfig.id).all()[1:]]
+for cfg_id, cfg_ss in extra_cfgs:
+    col1, col2 = st.columns([6, 2])
+    masked = cfg_ss if not cfg_ss or len(cfg_ss) <= 12 else f"{cfg_ss[:6]}...{cfg_ss[-6:]}"
+    col1.write(f"账号 #{cfg_id}: {masked or '（未填写）'}")
+    if col2.button("删除", key=f"del_cfg_{cfg_id}"):
+        with Session(engine) as session:
+            obj = session.query(TelegramConfig).get(cfg_id)
+            if obj:
+                session.delete(obj)
+                session.commit()
+        notify_monitor("accounts")
+        st.rerun()
+with st.form("add_account_form"):
+    extra_string = st.text_area("新账号 StringSession", height=80)
+    if st.form_submit_button("添加账号") and extra_string.strip():
+        with Session(engine) as session:
+            if not session.query(TelegramConfig).first():
+                st.warning("请先在上方保存主账号的 StringSession")
+            else:
+                session.add(TelegramConfig(string_session=extra_string.strip()))
+                session.commit()
+                notify_monitor("accounts")
+                st.success("添加成功！")
+                st.rerun()
+
 st.markdown("---")
 
 # 🕒 首页自动刷新频率设置（秒）
@@ -122,7 +171,7 @@ def save_refresh_interval(val: int):
 
 st.header("首页自动刷新频率")
 current_interval = load_refresh_interval()
-new_interval = st.number_input("刷新频率（秒）", min_value=10, max_value=3600, step=10, value=current_interval, help="用于前台 web.py 首页的自动刷新间隔。")
+new_interval = st.number_input("刷新频率（秒）", min_value=10, max_value=3600, step=10, value=current_interval, help="前台 web.py 首页每隔多少秒检查一次新消息，有新消息时自动刷新。")
 if st.button("保存刷新频率"):
     save_refresh_interval(int(new_interval))
     st.success(f"已保存刷新频率为 {int(new_interval)} 秒。前台页面将按新频率刷新。")
@@ -160,6 +209,7 @@ for cred_id, api_id_val, api_hash_val in creds:
             if obj:
                 session.delete(obj)
                 session.commit()
+        notify_monitor("accounts")
         try:
             get_credentials.clear()
         except Exception:
@@ -174,6 +224,7 @@ with st.form("add_cred_form"):
         with Session(engine) as session:
             session.add(Credential(api_id=api_id, api_hash=api_hash))
             session.commit()
+        notify_monitor("accounts")
         try:
             get_credentials.clear()
         except Exception:
@@ -183,10 +234,11 @@ with st.form("add_cred_form"):
 
 # 频道管理
 st.header("监听频道管理")
+JOIN_STATUS_LABELS = {"joined": "已加入", "private": "私有频道，需邀请", "invalid": "用户名无效", "failed": "加入失败，稍后重试"}
 chans = get_channels()
-for chan_id, chan_username in chans:
+for chan_id, chan_username, join_status in chans:
     col1, col2 = st.columns([6, 2])
-    col1.write(f"频道: {chan_username}")
+    col1.write(f"频道: {chan_username}（{JOIN_STATUS_LABELS.get(join_status, '待加入')}）")
     if col2.button(f"删除", key=f"del_chan_{chan_id}"):
         with Session(engine) as session:
             obj = session.query(Channel).get(chan_id)
@@ -194,11 +246,7 @@ for chan_id, chan_username in chans:
                 session.delete(obj)
                 session.commit()
         # 触发监控端刷新
-        try:
-            with open("channels_refresh.flag", "w") as f:
-                f.write("refresh")
-        except Exception as e:
-            st.warning(f"触发刷新失败: {e}")
+        notify_monitor("channels")
         try:
             get_channels.clear()
         except Exception:
@@ -222,11 +270,7 @@ with st.form("add_chan_form"):
                     session.commit()
                     st.success("添加成功！")
                     # 触发监控端刷新
-                    try:
-                        with open("channels_refresh.flag", "w") as f:
-                            f.write("refresh")
-                    except Exception as e:
-                        st.warning(f"触发刷新失败: {e}")
+                    notify_monitor("channels")
                     try:
                         get_channels.clear()
                     except Exception:
@@ -238,10 +282,10 @@ st.markdown("---")
 # 频道规则管理
 st.header("频道规则管理")
 from model import ChannelRule
-NETDISK_OPTIONS = ['夸克网盘', '阿里云盘', '百度网盘', '115网盘', '天翼云盘', '123云盘', 'UC网盘', '迅雷']
+from netdisk import NETDISK_TYPES as NETDISK_OPTIONS
 
 with Session(engine) as session:
-    chan_list = [u for _, u in get_channels()]
+    chan_list = [u for _, u, _ in get_channels()]
     if not chan_list:
         st.info("请先在上方添加至少一个频道")
     else:
@@ -280,21 +324,13 @@ with Session(engine) as session:
                 session.commit()
                 st.success("已保存规则")
                 # 触发规则刷新
-                try:
-                    with open("rules_refresh.flag", "w") as f:
-                        f.write("refresh")
-                except Exception as e:
-                    st.warning(f"触发规则刷新失败: {e}")
+                notify_monitor("rules")
                 st.rerun()
         # 删除规则
         if existing and st.button("删除该频道规则"):
             session.delete(existing)
             session.commit()
-            try:
-                with open("rules_refresh.flag", "w") as f:
-                    f.write("refresh")
-            except Exception as e:
-                st.warning(f"触发规则刷新失败: {e}")
+            notify_monitor("rules")
             st.success("已删除规则")
             st.rerun()
 
@@ -337,11 +373,7 @@ with Session(engine) as session:
                         if st.button("删除", key=f"delete_rule_{r.id}"):
                             session.delete(r)
                             session.commit()
-                            try:
-                                with open("rules_refresh.flag", "w") as f:
-                                    f.write("refresh")
-                            except Exception as e:
-                                st.warning(f"触发规则刷新失败: {e}")
+                            notify_monitor("rules")
                             st.success("已删除该规则")
                             st.rerun()
 
@@ -382,6 +414,7 @@ with colr:
         try:
             with open(CONTROL_FILE, "w", encoding="utf-8") as f:
                 json.dump({"paused": True}, f, ensure_ascii=False)
+            notify_monitor("control")
             st.success("已暂停（无需重启）")
         except Exception as e:
             st.error(f"操作失败: {e}")
@@ -390,6 +423,7 @@ with colr:
         try:
             with open(CONTROL_FILE, "w", encoding="utf-8") as f:
                 json.dump({"paused": False}, f, ensure_ascii=False)
+            notify_monitor("control")
             st.success("已恢复（无需重启）")
         except Exception as e:
             st.error(f"操作失败: {e}")